@@ -0,0 +1,156 @@
+import os
+import simplejson as json
+import threading
+import urllib2
+import zlib
+
+from ckanext.geogratis.cache import CachedResponse
+
+MAGIC = 'GEOGRATIS-ARCHIVE 1'
+
+
+def relative_key(url, base_url):
+    """The key of url in an archive, i.e. the URL relative to base_url, or None if it is not under base_url"""
+    prefix = base_url.rstrip('/') + '/'
+    if url.startswith(prefix):
+        return url[len(prefix):]
+    return None
+
+
+class ResponseArchive(object):
+    """Compact archive of Geogratis responses, used to replay harvests without contacting Geogratis
+
+    Response bodies are kept compressed in a single file that is only ever appended to. The file starts with a
+    line naming the base URL the responses were recorded from, and every entry is a JSON header line holding
+    the key of the response (its URL relative to the base URL) and the size of the compressed body that
+    follows. An entry left incomplete by a crash is dropped when the archive is next opened. Only the location
+    of each body is held in memory, and a key that is already in the archive is not recorded again.
+
+    """
+    def __init__(self, path, base_url=None, writable=False):
+        self.path = path
+        self.base_url = base_url
+        self.entries = {}
+        self.lock = threading.Lock()
+        exists = os.path.exists(path)
+        if writable:
+            self.file = open(path, 'r+b' if exists else 'w+b')
+        else:
+            self.file = open(path, 'rb')
+        if exists:
+            end = self._load()
+            if writable:
+                if base_url and base_url.rstrip('/') != self.base_url:
+                    self.file.close()
+                    raise ValueError('%s was recorded from %s' % (path, self.base_url))
+                self.file.truncate(end)
+        else:
+            self.base_url = base_url.rstrip('/')
+            self.file.write('%s %s\n' % (MAGIC, self.base_url))
+            self.file.flush()
+
+    def _load(self):
+        """Index the complete entries in the file and return where the last of them ends"""
+        header = self.file.readline()
+        if not header.startswith(MAGIC + ' '):
+            raise ValueError('%s is not a Geogratis response archive' % self.path)
+        self.base_url = header[len(MAGIC) + 1:].rstrip('\n')
+        size = os.fstat(self.file.fileno()).st_size
+        end = self.file.tell()
+        while True:
+            line = self.file.readline()
+            if not line.endswith('\n'):
+                break
+            try:
+                key, length = json.loads(line)
+            except ValueError:
+                break
+            offset = self.file.tell()
+            if offset + length > size:
+                break
+            self.entries[key] = (offset, length)
+            end = offset + length
+            self.file.seek(end)
+        return end
+
+    def get(self, key, base_url=None):
+        """Return the body recorded for key, or None if there is none. Links in the body that point under the base
+        URL it was recorded from are rewritten to point under base_url, if it is given."""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        with self.lock:
+            self.file.seek(entry[0])
+            data = self.file.read(entry[1])
+        body = zlib.decompress(data)
+        if base_url and base_url.rstrip('/') != self.base_url:
+            base_url = base_url.rstrip('/')
+            body = body.replace(self.base_url, base_url)
+            body = body.replace(self.base_url.replace('/', '\\/'), base_url.replace('/', '\\/'))
+        return body
+
+    def put(self, key, body):
+        """Add a response body to the archive, unless one has already been recorded for key"""
+        data = zlib.compress(body, 6)
+        with self.lock:
+            if key in self.entries:
+                return
+            self.file.seek(0, os.SEEK_END)
+            self.file.write(json.dumps([key, len(data)]) + '\n')
+            offset = self.file.tell()
+            self.file.write(data)
+            self.file.flush()
+            self.entries[key] = (offset, len(data))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def close(self):
+        self.file.close()
+
+
+class RecordingTransport(object):
+    """Wrap a transport and record every successful response from under base_url in a ResponseArchive"""
+    def __init__(self, transport, archive, base_url):
+        self.transport = transport
+        self.archive = archive
+        self.base_url = base_url
+        self.recorded = 0
+
+    def open(self, url, headers=None):
+        response = self.transport.open(url, headers)
+        body = response.read()
+        key = relative_key(url, self.base_url)
+        if response.status == 200 and key is not None:
+            self.archive.put(key, body)
+            self.recorded += 1
+        return CachedResponse(url, body, response.status)
+
+    def summary(self):
+        return '%s, %d responses recorded' % (self.transport.summary(), self.recorded)
+
+
+class ReplayTransport(object):
+    """Answer requests from a ResponseArchive instead of Geogratis
+
+    Requests for anything that is not in the archive fail with 404 Not Found, as the requests that failed
+    while it was recorded did. Links in the responses are rewritten to point under base_url.
+
+    """
+    def __init__(self, archive, base_url):
+        self.archive = archive
+        self.base_url = base_url
+        self.stats = {'replayed': 0, 'missing': 0}
+        self.lock = threading.Lock()
+
+    def open(self, url, headers=None):
+        key = relative_key(url, self.base_url)
+        body = None if key is None else self.archive.get(key, self.base_url)
+        with self.lock:
+            self.stats['missing' if body is None else 'replayed'] += 1
+        if body is None:
+            raise urllib2.HTTPError(url, 404, 'Not Found', None, None)
+        return CachedResponse(url, body)
+
+    def summary(self):
+        return '%(replayed)d responses replayed, %(missing)d not in the archive' % self.stats
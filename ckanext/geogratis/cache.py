@@ -0,0 +1,149 @@
+import StringIO
+import hashlib
+import os
+import simplejson as json
+import threading
+import urllib2
+
+
+class ResponseCache(object):
+    """Size-bounded on-disk cache of response bodies keyed by URL
+
+    Every entry is a body file and a small JSON file holding the URL and the validators (ETag and
+    Last-Modified) needed to revalidate it. The modification time of the body file records when the
+    entry was last used, and the least recently used entries are removed once the cache grows past
+    max_bytes.
+
+    """
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.total_bytes = 0
+        for name in os.listdir(directory):
+            if name.endswith('.body'):
+                self.total_bytes += os.path.getsize(os.path.join(directory, name))
+
+    def _path(self, url, extension):
+        return os.path.join(self.directory, '%s.%s' % (hashlib.sha1(url).hexdigest(), extension))
+
+    def get(self, url):
+        """Return the (validators, body) pair cached for the URL, or None if it is not cached"""
+        body_path = self._path(url, 'body')
+        try:
+            with open(self._path(url, 'json'), 'rb') as meta_file:
+                validators = json.load(meta_file)
+            with open(body_path, 'rb') as body_file:
+                body = body_file.read()
+            os.utime(body_path, None)
+        except (IOError, OSError, ValueError):
+            return None
+        return validators, body
+
+    def put(self, url, body, etag=None, last_modified=None):
+        body_path = self._path(url, 'body')
+        meta_path = self._path(url, 'json')
+        with self.lock:
+            if os.path.exists(body_path):
+                self.total_bytes -= os.path.getsize(body_path)
+            self._write(body_path, body)
+            self._write(meta_path, json.dumps({'url': url, 'etag': etag, 'last_modified': last_modified}))
+            self.total_bytes += len(body)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _write(self, path, data):
+        # Write to a temporary file first so that readers never see a partly written entry
+        tmp_path = '%s.%d.tmp' % (path, threading.current_thread().ident)
+        with open(tmp_path, 'wb') as tmp_file:
+            tmp_file.write(data)
+        os.rename(tmp_path, path)
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.body'):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, stat.st_size, name[:-5]))
+        entries.sort()
+        target = self.max_bytes * 0.9
+        for mtime, size, key in entries:
+            if self.total_bytes <= target:
+                break
+            for extension in ('body', 'json'):
+                try:
+                    os.remove(os.path.join(self.directory, '%s.%s' % (key, extension)))
+                except OSError:
+                    pass
+            self.total_bytes -= size
+
+
+class CachedResponse(object):
+    """A response served from memory, with the same read interface as HttpResponse"""
+    def __init__(self, url, body, status=200):
+        self.url = url
+        self.status = status
+        self.body = StringIO.StringIO(body)
+
+    def read(self, size=-1):
+        return self.body.read(size)
+
+    def close(self):
+        pass
+
+
+class CachingTransport(object):
+    """Wrap a transport with a ResponseCache
+
+    Cached responses are revalidated with a conditional GET, and a 304 Not Modified is answered from
+    the cache. In offline mode nothing is sent and only cached responses are available.
+
+    """
+    def __init__(self, transport, cache, offline=False):
+        self.transport = transport
+        self.cache = cache
+        self.offline = offline
+        self.lock = threading.Lock()
+        self.stats = {'cache_hits': 0, 'cache_revalidated': 0, 'cache_misses': 0}
+
+    def _count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def open(self, url, headers=None):
+        cached = self.cache.get(url)
+        if self.offline:
+            if cached is None:
+                self._count('cache_misses')
+                raise urllib2.URLError('%s is not in the cache' % url)
+            self._count('cache_hits')
+            return CachedResponse(url, cached[1])
+
+        request_headers = dict(headers or {})
+        if cached is not None:
+            validators = cached[0]
+            if validators.get('etag'):
+                request_headers['If-None-Match'] = validators['etag']
+            if validators.get('last_modified'):
+                request_headers['If-Modified-Since'] = validators['last_modified']
+
+        response = self.transport.open(url, request_headers)
+        if response.status == 304 and cached is not None:
+            response.read()
+            self._count('cache_revalidated')
+            return CachedResponse(url, cached[1])
+
+        body = response.read()
+        self._count('cache_misses')
+        if response.status == 200:
+            self.cache.put(url, body, response.getheader('etag'), response.getheader('last-modified'))
+        return CachedResponse(url, body, response.status)
+
+    def summary(self):
+        stats = dict(self.stats)
+        summary = '%(cache_hits)d cache hits, %(cache_revalidated)d revalidated, %(cache_misses)d misses' % stats
+        if self.offline:
+            return summary
+        return '%s, %s' % (self.transport.summary(), summary)
@@ -0,0 +1,129 @@
+import collections
+import sqlite3
+import time
+import zlib
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    id TEXT PRIMARY KEY,
+    updated_date TEXT,
+    series TEXT,
+    valid INTEGER NOT NULL,
+    reasons TEXT,
+    title TEXT,
+    harvested TEXT NOT NULL,
+    product_en BLOB,
+    product_fr BLOB,
+    odproduct BLOB
+);
+CREATE INDEX IF NOT EXISTS records_updated_date ON records (updated_date);
+CREATE INDEX IF NOT EXISTS records_series ON records (series);
+CREATE INDEX IF NOT EXISTS records_valid ON records (valid);
+CREATE TABLE IF NOT EXISTS topics (
+    topic TEXT NOT NULL,
+    id TEXT NOT NULL,
+    PRIMARY KEY (topic, id)
+);
+CREATE INDEX IF NOT EXISTS topics_id ON topics (id);
+"""
+
+# A record in the catalog. The Geogratis records and the Open Data record are JSON text, or None if there is none.
+CatalogRecord = collections.namedtuple('CatalogRecord', 'id updated_date series valid reasons title harvested '
+                                                        'product_en product_fr odproduct')
+
+
+def _pack(text):
+    if text is None:
+        return None
+    if isinstance(text, unicode):
+        text = text.encode('utf-8')
+    return buffer(zlib.compress(text, 6))
+
+
+def _unpack(data):
+    if data is None:
+        return None
+    return zlib.decompress(data)
+
+
+class CatalogStore(object):
+    """Local catalog of harvested records, kept in an SQLite database
+
+    For every Geogratis ID the catalog keeps the English and French Geogratis records as they were retrieved,
+    the Open Data record converted from them, whether it passed validation and why not, along with the
+    Geogratis updatedDate, the data series and the topic categories, which are indexed so that selections
+    of records can be exported or converted again without contacting Geogratis. The JSON documents are
+    stored compressed. Changes are written out in a single transaction by sync().
+
+    """
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def put(self, geo_id, updated_date, product_en, product_fr, odproduct, line, valid, reasons, title):
+        """Store a record, replacing any earlier one with the same ID
+
+        product_en and product_fr are the Geogratis records as JSON text, and odproduct the converted record,
+        serialized as 'line', or None if the record could not be converted.
+
+        """
+        series = (odproduct.get('data_series_name') or None) if odproduct else None
+        topics = odproduct.get('topic_category', []) if odproduct else []
+        self.db.execute('INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                        (geo_id, updated_date, series, int(bool(valid)), reasons or None, title,
+                         time.strftime('%Y-%m-%dT%H:%M:%S'), _pack(product_en), _pack(product_fr), _pack(line)))
+        self.db.execute('DELETE FROM topics WHERE id = ?', (geo_id,))
+        self.db.executemany('INSERT OR IGNORE INTO topics VALUES (?, ?)', [(topic, geo_id) for topic in topics])
+
+    def _where(self, since=None, series=None, topic=None, valid=None):
+        clauses = []
+        params = []
+        if since:
+            clauses.append('updated_date >= ?')
+            params.append(since)
+        if series:
+            clauses.append('series = ?')
+            params.append(series)
+        if topic:
+            clauses.append('id IN (SELECT id FROM topics WHERE topic = ?)')
+            params.append(topic)
+        if valid is not None:
+            clauses.append('valid = ?')
+            params.append(int(bool(valid)))
+        return clauses, params
+
+    def count(self, **selection):
+        """The number of records selected by the same arguments as select()"""
+        clauses, params = self._where(**selection)
+        query = 'SELECT COUNT(*) FROM records'
+        if clauses:
+            query += ' WHERE ' + ' AND '.join(clauses)
+        return self.db.execute(query, params).fetchone()[0]
+
+    def select(self, since=None, series=None, topic=None, valid=None, batch_size=500):
+        """Yield a CatalogRecord for every record in ID order, or only those updated in Geogratis since a date
+        (given in ISO 8601 format), in a series, with a topic category or that passed (or failed) validation
+
+        The records are read batch_size at a time, so that records can be stored while the selection is being
+        read.
+
+        """
+        clauses, params = self._where(since, series, topic, valid)
+        query = 'SELECT * FROM records WHERE %s ORDER BY id LIMIT %d' % (
+            ' AND '.join(clauses + ['id > ?']), batch_size)
+        last_id = ''
+        while True:
+            rows = self.db.execute(query, params + [last_id]).fetchall()
+            for row in rows:
+                yield CatalogRecord(*(row[:7] + tuple(_unpack(data) for data in row[7:])))
+            if len(rows) < batch_size:
+                break
+            last_id = rows[-1][0]
+
+    def sync(self):
+        """Write out the records stored so far"""
+        self.db.commit()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
@@ -0,0 +1,89 @@
+import os
+
+
+class CheckpointJournal(object):
+    """Append-only journal of the progress of a feed harvest, used to resume an interrupted run
+
+    The journal holds one 'P' line for the feed page being imported, followed by a 'D' line for each
+    product on that page that has been completed. Both record the position of the output at that
+    point, as returned by the output's sync(), so that a resumed run can drop any output written after
+    the last completed record. Every batch of lines is fsync'd before the journal call returns, and a
+    line left incomplete by a crash is ignored. Moving on to a new page atomically replaces the journal,
+    which keeps it no longer than one page.
+
+    """
+    def __init__(self, path):
+        self.path = path
+        self.cursor = None
+        self.position = None
+        self.done = set()
+        self.journal = None
+        self._load()
+
+    def _load(self):
+        try:
+            journal = open(self.path, 'rb')
+        except IOError:
+            return
+        with journal:
+            for line in journal:
+                if not line.endswith('\n'):
+                    break
+                kind, position, value = line.rstrip('\n').split(' ', 2)
+                if kind == 'P':
+                    self.cursor = value
+                    self.done = set()
+                elif kind == 'D':
+                    self.done.add(value.decode('utf-8'))
+                self.position = None if position == '-' else position
+
+    def _line(self, kind, position, value):
+        return '%s %s %s\n' % (kind, '-' if position is None else position, value)
+
+    def _sync_directory(self):
+        fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def begin_page(self, url, position=None):
+        """Record that the feed page at url is now being imported"""
+        self.close()
+        tmp_path = '%s.tmp' % self.path
+        with open(tmp_path, 'wb') as journal:
+            journal.write(self._line('P', position, url))
+            journal.flush()
+            os.fsync(journal.fileno())
+        os.rename(tmp_path, self.path)
+        self._sync_directory()
+        self.cursor = url
+        self.position = position
+        self.done = set()
+
+    def complete(self, geo_ids, position=None):
+        """Record that products on the current page have been imported"""
+        if not geo_ids:
+            return
+        if self.journal is None:
+            self.journal = open(self.path, 'ab')
+        for geo_id in geo_ids:
+            self.journal.write(self._line('D', position, geo_id.encode('utf-8')))
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+        self.done.update(geo_ids)
+        self.position = position
+
+    def reset(self):
+        """Forget all progress so that the next run starts from the beginning of the feed"""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.cursor = None
+        self.position = None
+        self.done = set()
+
+    def close(self):
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
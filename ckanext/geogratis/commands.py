@@ -1,47 +1,306 @@
 from ckan.lib.cli import CkanCommand
-from ckanext.canada.metadata_schema import schema_description
+from ckanext.geogratis.cache import CachingTransport, ResponseCache
+from ckanext.geogratis.checkpoint import CheckpointJournal
+from ckanext.geogratis.concurrency import AdaptiveRateLimiter, WorkerPool, ordered_map, retry_delay, spawn
+from ckanext.geogratis.failures import FailureQueue
+from ckanext.geogratis.feed import FeedPrefetcher, iter_page
+from ckanext.geogratis.jsonstream import JsonStream
+from ckanext.geogratis.metrics import PrometheusExporter, RunMetrics, write_json
+from ckanext.geogratis.report import ImportReport
+from ckanext.geogratis.shards import merge_records, merge_reports, parse_shard, shard_of
+from ckanext.geogratis.sinks import COMPRESSIONS, CkanSink, JsonLinesSink
+from ckanext.geogratis.spatial import DEFAULT_PRECISION, SpatialEncoder
+from ckanext.geogratis.tables import build_lookup_tables, load_lookup_tables
+from ckanext.geogratis.transport import HttpTransport
 from paste.script import command
 import ConfigParser
-import csv
-import dateutil.parser
 import datetime
+import collections
 import logging
 import os.path
+import random
 import re
+import shutil
 import simplejson as json
+import socket
+import subprocess
+import tempfile
+import threading
 import time
 import urllib2
 import sys
 
+# Modules that only some subcommands use (the Open Data schema, dateutil, multiprocessing, the evented engine, the
+# harvest index, the response archive, the stand-in server, the synthetic products, the catalog and the record of IDs
+# seen during a feed harvest, which loads sqlite3) are imported where they are used, so that every invocation does
+# not pay for loading them.
+
+
+# The Geogratis API. Records are harvested from it unless another --base-url is given, and always link to it.
+GEOGRATIS_API = 'http://geogratis.gc.ca/api'
+
+# Splits camel-cased Geogratis topic categories into words e.g. "imageryBaseMaps" to "imagery Base Maps"
+CAMEL_CASE = re.compile("([a-z])([A-Z])")
+
+# The command that conversion processes work for. Conversion processes are forked from the command's process
+# and inherit it along with its lookup tables and options.
+_conversion_command = None
+
+
+def _convert_record(args):
+    """Decode, convert and serialize one record in a conversion process, and return the result along with the
+    timings of those stages"""
+    command = _conversion_command
+    command.metrics = RunMetrics()
+    command.profiler = None
+    return command._convert_raw_record(*args), dict(command.metrics.stages)
+
 
 class GeogratisCommand(CkanCommand):
     """CKAN Geogratis Extension
     
     Usage:
-        paster geogratis print_one -u <uuid> [-f <file-name>] [-c <config-file>]
-                         import_one -u <uuid> [-f <file-name>] [-c <config-file>]
-                         updated -d <date-time> [-f <file-name>] [-r <report_file>] [-n] [-c <config-file>]
-                         get_all [-f <file-name>] [-r <report_file>] [-n] [-z] [-m <max-number>] [-c <config-file>]
+        paster geogratis print_one -u <uuid> [-f <file-name>] [--cache-dir <directory> [--offline]] [-c <config-file>]
+                         import_one -u <uuid> [-f <file-name>] [--cache-dir <directory> [--offline]]
+                                    [--catalog <catalog>] [--ckan] [-c <config-file>]
+                         import_many [<id-file>] [-f <file-name>] [-r <report_file>] [-n] [-w <workers>]
+                                     [-P <processes>] [--rate <requests>] [--max-rate <requests>]
+                                     [--retries <retries>] [--timeout <seconds>] [--pool-size <connections>] [--stream]
+                                     [--cache-dir <directory> [--cache-size <megabytes>] [--offline]]
+                                     [--compress <compression>] [--rotate-size <shard-size>]
+                                     [--rotate-records <records>] [--metrics-file <stats-file>] [--profile <prof-file>]
+                                     [--prometheus-file <prom-file> [--metrics-interval <refresh>]]
+                                     [--base-url <url>] [--record <archive> | --replay <archive>]
+                                     [--catalog <catalog>] [--ckan [--batch-size <batch-size>]]
+                                     [--failures <queue-file>] [-c <config-file>]
+                         retry_failed [--failures <queue-file>] [--max-attempts <attempts>] [--all] [-f <file-name>]
+                                      [-r <report_file>] [-n] [-w <workers>] [-P <processes>] [--rate <requests>]
+                                      [--max-rate <requests>] [--retries <retries>] [--timeout <seconds>]
+                                      [--pool-size <connections>] [--stream] [--compress <compression>]
+                                      [--rotate-size <shard-size>] [--rotate-records <records>]
+                                      [--metrics-file <stats-file>] [--profile <prof-file>]
+                                      [--prometheus-file <prom-file> [--metrics-interval <refresh>]]
+                                      [--base-url <url>] [--record <archive> | --replay <archive>]
+                                      [--catalog <catalog>] [--ckan [--batch-size <batch-size>]] [-c <config-file>]
+                         updated -d <date-time> [-f <file-name>] [-r <report_file>] [-n] [-w <workers>]
+                                 [-p <pages>] [-P <processes>] [-e <engine>] [--rate <requests>] [--max-rate <requests>]
+                                 [--retries <retries>] [--timeout <seconds>] [--pool-size <connections>] [--stream]
+                                 [--cache-dir <directory> [--cache-size <megabytes>] [--offline]]
+                                 [--index <index-file> [--delta-file <delta-file>]] [-k <journal>] [-s <shard>]
+                                 [--compress <compression>] [--rotate-size <shard-size>]
+                                 [--rotate-records <records>] [--sync-interval <interval>]
+                                 [--metrics-file <stats-file>] [--profile <prof-file>]
+                                 [--prometheus-file <prom-file> [--metrics-interval <refresh>]]
+                                 [--base-url <url>] [--record <archive> | --replay <archive>]
+                                 [--catalog <catalog>] [--ckan [--batch-size <batch-size>]]
+                                 [--failures <queue-file>] [-c <config-file>]
+                         get_all [-f <file-name>] [-r <report_file>] [-n] [-z] [-m <max-number>] [-w <workers>]
+                                 [-p <pages>] [-P <processes>] [-e <engine>] [--rate <requests>] [--max-rate <requests>]
+                                 [--retries <retries>] [--timeout <seconds>] [--pool-size <connections>] [--stream]
+                                 [--cache-dir <directory> [--cache-size <megabytes>] [--offline]]
+                                 [--index <index-file> [--delta-file <delta-file>]] [-k <journal>] [-s <shard>]
+                                 [--compress <compression>] [--rotate-size <shard-size>]
+                                 [--rotate-records <records>] [--sync-interval <interval>]
+                                 [--metrics-file <stats-file>] [--profile <prof-file>]
+                                 [--prometheus-file <prom-file> [--metrics-interval <refresh>]]
+                                 [--base-url <url>] [--record <archive> | --replay <archive>]
+                                 [--catalog <catalog>] [--ckan [--batch-size <batch-size>]]
+                                 [--failures <queue-file>] [-c <config-file>]
+                         watch [-d <date-time>] [--poll-interval <period>] [--jitter <jitter>] [-f <file-name>]
+                               [-r <report_file>] [-n] [-w <workers>] [-p <pages>] [-P <processes>] [-e <engine>]
+                               [--rate <requests>] [--max-rate <requests>] [--retries <retries>] [--timeout <seconds>]
+                               [--pool-size <connections>] [--stream] [--index <index-file> [--delta-file <delta-file>]]
+                               [-k <journal>] [-s <shard>] [--compress <compression>] [--rotate-size <shard-size>]
+                               [--rotate-records <records>] [--sync-interval <interval>]
+                               [--metrics-file <stats-file>] [--profile <prof-file>]
+                               [--prometheus-file <prom-file> [--metrics-interval <refresh>]]
+                               [--base-url <url>] [--record <archive> | --replay <archive>]
+                               [--catalog <catalog>] [--ckan [--batch-size <batch-size>]]
+                               [--failures <queue-file>] [-c <config-file>]
+                         serve <archive> [--listen <address>] [--latency <delay>]
+                               [--latency-jitter <delay>] [--error-rate <fraction>] [--seed <seed>]
+                         export <catalog> [-f <file-name>] [-r <report_file>] [-n] [-d <date-time>]
+                                [--series <series>] [--topic <topic>] [--failed] [--compress <compression>]
+                                [--rotate-size <shard-size>] [--rotate-records <records>]
+                         reconvert <catalog> [-f <file-name>] [-r <report_file>] [-n] [-P <processes>]
+                                   [-d <date-time>] [--series <series>] [--topic <topic>] [--failed]
+                                   [--compress <compression>] [--rotate-size <shard-size>]
+                                   [--rotate-records <records>] [--metrics-file <stats-file>]
+                                   [--ckan [--batch-size <batch-size>]] [-c <config-file>]
+                         merge -f <file-name> [-r <report_file> --shard-report <report_file> ...] <shard-file> ...
+                         startup_benchmark [--runs <runs>] [-c <config-file>]
+                         throughput_benchmark [-w <workers>] [-e <engine>] [--products <products>] [--runs <runs>]
+                                              [--latency <delay>] [--latency-jitter <delay>] [-c <config-file>]
+                         conversion_benchmark [--products <products>] [--runs <runs>] [-c <config-file>]
                          [-h | --help]
                          
     Arguments:
+        <address>     is the host:port at which to serve the archive, 127.0.0.1:8080 by default
+        <archive>     is the name of a file of recorded Geogratis responses. --record adds every response received
+                      from Geogratis to it, --replay answers every request from it instead of Geogratis, and serve
+                      answers requests from it over HTTP, to harvests given the stand-in's --base-url. Requests
+                      for anything that was not recorded are answered with 404 Not Found.
+        <attempts>    is the number of times a record may fail before retry_failed stops retrying it, 10 by default
+                      (0 for no limit). It is kept in the queue in any case.
+        <batch-size>  is the number of records to load into CKAN at a time, 50 by default
+        <catalog>     is the name of an SQLite database in which to keep every record imported, i.e. the English and
+                      French Geogratis records and the Open Data record converted from them, with whether it passed
+                      and why not. export writes the Open Data records in the catalog out again, and reconvert
+                      converts the Geogratis records in it again with the current rules and updates the catalog,
+                      both without contacting Geogratis. They select every record in the catalog, or only those
+                      updated in Geogratis since -d, in a series, with a topic or that failed (--failed). export
+                      writes the records that passed to the JSON lines file, and every selected record to the
+                      report.
+        <compression> is gzip or bz2, or xz if the lzma module is installed, to compress the JSON lines file
         <config-file> is the CKAN configuration file
+        <connections> is the number of idle connections to keep open to Geogratis for reuse
         <date-time>   is datetime string in ISO 8601 format e.g. "2013-01-30T01:30:00"
-        <file-name>   is the name of a text file to write out the updated records in JSON Lines format
+        <delay>       is the number of milliseconds the stand-in waits before every response, 0 by default, or for
+                      --latency-jitter the largest number by which to randomly shorten or lengthen the wait
+        <delta-file>  is the name of a text file to write out new, changed and removed records in JSON Lines format
+        <directory>   is the directory in which to cache responses from Geogratis between runs
+        <engine>      is 'threads' (the default) to harvest with threads, or 'evented' to make all requests on
+                      a single-threaded event loop. The evented engine cannot be combined with -P, --cache-dir,
+                      --record or --replay.
+        <file-name>   is the name of a text file to write out the updated records in JSON Lines format. A record
+                      that updated or get_all finds listed again further on in the feed is only imported again if
+                      it has been edited since. The file is only ever appended to, so the earlier version is not
+                      replaced: the newer one follows it, and merging the file on its own keeps only the newer one.
+        <fraction>    is the fraction of requests, from 0 to 1, that the stand-in answers with a server error
+        <id-file>     is the name of a text file listing the Geogratis dataset IDs to import, one per line, or '-'
+                      (the default) to read them from standard input. An ID listed more than once is imported once.
+                      Progress is printed to standard error as the records are imported.
+        <index-file>  is the name of the file that keeps track of previously harvested records
+        <interval>    is the number of records to import between making the output durable and recording the
+                      progress of the harvest, 100 by default. Output is not flushed in between.
+        <jitter>      is the largest number of seconds by which to randomly shorten or lengthen each wait between
+                      polls, so that several watchers do not poll Geogratis in step, 5 by default
+        <journal>     is the name of the file that records the progress of a harvest, geogratis.ckpt by default or
+                      geogratis-K-of-N.ckpt for a shard. watch uses geogratis-watch.ckpt or
+                      geogratis-watch-K-of-N.ckpt by default, and resumes polling from the link recorded there.
         <max-number>  is the maximum number of times to read from the Geogratis Atom Feed
-        <report_file> is the name of a text to write out a import records report in .csv format
+        <megabytes>   is the maximum size of the response cache, 512 MB by default
+        <pages>       is the number of Atom Feed pages to read ahead of the page being imported
+        <period>      is the number of seconds to wait between polls of the Geogratis monitor link, 60 by default.
+                      watch runs until it is interrupted. Without a date it only imports the changes made from
+                      the time it first starts; -m does not apply to it.
+        <processes>   is the number of processes with which to convert records, 1 by default
+        <products>    is the number of synthetic products that throughput_benchmark harvests from a stand-in server
+                      and that conversion_benchmark converts, 1000 by default
+        <prof-file>   is the name of a file to write a cProfile dump of the conversion and serialization of records
+                      to, to be read with pstats. Records converted in other processes with -P are not profiled.
+        <prom-file>   is the name of a file to write the metrics to in the Prometheus text format as the run goes,
+                      e.g. for the textfile collector of the Prometheus node exporter
+        <queue-file>  is the name of the file that keeps the records which failed to import, with the reason, the
+                      number of attempts and the time of the last one, geogratis.failures by default ('' to keep no
+                      queue). A record is queued when its English or French record cannot be retrieved, it is
+                      invalid or CKAN rejects it, and leaves the queue once it is imported. With a queue, a record
+                      that cannot be retrieved because of a network error is queued instead of stopping the harvest.
+                      retry_failed imports the queued records again, waiting 1 minute after the first failure
+                      and twice as long after each further one before retrying a record.
+        <records>     is the number of records at which to start a new JSON lines file
+        <refresh>     is the number of seconds between writes of the Prometheus metrics file, 15 by default
+        <report_file> is the name of a text to write out a import records report in .csv format. Whether or not
+                      there is a report, a summary of the import is printed to standard error at the end of a
+                      harvest.
+        <requests>    is the number of requests per second to send to Geogratis (0 for no limit). The rate starts at
+                      --rate, rises while Geogratis responds promptly, up to --max-rate unless it is 0 (the
+                      default), and is halved whenever Geogratis is overloaded.
+        <retries>     is the number of times to retry a request that failed for a reason that may be temporary
+        <runs>        is the number of times to start each subcommand when timing startup, or to run each
+                      configuration of a benchmark, 5 by default
+        <seconds>     is the number of seconds to wait for Geogratis to respond before giving up
+        <seed>        is the seed from which the stand-in draws its delays and errors, so that runs can be repeated
+        <series>      is the English name of a data series, as in the data_series_name of the Open Data record
+        <shard>       is K/N to harvest only the K-th of N disjoint shards of the feed. Products are assigned to shards
+                      by a hash of their ID, so that each of N nodes can harvest one shard independently.
+        <shard-file>  is a JSON lines file written by a sharded harvest, compressed or not, or the manifest of its
+                      rotated output. When merging, a record that appears in more than one file is kept once, from
+                      the file with the newest date_modified.
+        <stats-file>  is the name of a JSON file to write the metrics of the run to at its end: the 50th, 95th and
+                      99th percentile, maximum and total time taken by each stage, counts of records, bytes and
+                      HTTP responses by status, and records imported per second. The stages are fetch_page and
+                      fetch_record (requests to Geogratis, including reading the response unless --stream is
+                      given), decode, convert, serialize, output_write and output_sync. Requests made on the
+                      evented engine's event loop are not timed.
+        <shard-size>  is the size in megabytes at which to start a new JSON lines file. With --rotate-size or
+                      --rotate-records the output is written to numbered files, e.g. out-00001.jl.gz for -f out.jl,
+                      listed in a manifest (out.manifest.json) with their record counts and checksums.
+        <topic>       is the key of an Open Data topic category, as in the topic_category of the Open Data record
+        <url>         is the base URL of the Geogratis API, http://geogratis.gc.ca/api by default. Converted records
+                      still name Geogratis itself as their endpoint.
         <uuid>        is the Geogratis dataset ID number
+        <workers>     is the number of Geogratis records to retrieve concurrently, or with the evented engine
+                      the number of requests to have in flight at once. throughput_benchmark compares harvesting
+                      with one worker with harvesting with this many, or with 8 by default.
 
     Options:
         -c/--config      Configuration file to use
         -d/--date        Updated since date in ISO 8601 format
+        -e/--engine      Harvest with threads or on an event loop
         -f/--json-file   Filename of a JSON lines file to write out Geogratis records to
         -h/--help        Display help message
+        -k/--checkpoint  Filename of the journal used to resume an interrupted harvest
         -n/--no-print    Do not print datasets to file. Helpful for testing.
         -m/--max         Maximum number of times to read the Geogratis feed
+        -p/--prefetch    Number of Geogratis feed pages to read ahead
+        -P/--processes   Number of processes with which to convert records
         -r/--report-file Filename of a basic log file to generate while importing records
+        -s/--shard       Harvest only one shard of the feed
         -u/--uuid        Geogratis dataset ID number
+        -w/--workers     Number of Geogratis records to retrieve concurrently
         -z/--reset       Reset the feed and start from the beginning
+        --rate           Number of requests per second to start sending to Geogratis
+        --max-rate       Maximum number of requests per second to send to Geogratis, 0 for no maximum
+        --retries        Number of times to retry a failed request
+        --timeout        Seconds to wait for Geogratis to respond
+        --pool-size      Number of idle connections to keep open to Geogratis
+        --cache-dir      Cache Geogratis responses in this directory and revalidate them on later runs
+        --cache-size     Maximum size of the response cache in megabytes
+        --offline        Only use responses already in the cache, without contacting Geogratis
+        --index          Skip records that are unchanged since they were last harvested
+        --delta-file     Filename of a JSON lines file to write out new, changed and removed records to
+        --ckan           Create or update the datasets directly in CKAN
+        --batch-size     Number of records to load into CKAN at a time
+        --compress       Compress the JSON lines file
+        --rotate-size    Start a new JSON lines file once the current one reaches this size
+        --rotate-records Start a new JSON lines file once the current one has this many records
+        --sync-interval  Number of records to import between checkpoints
+        --tables-cache   Filename in which to cache the look-up tables built from the Open Data schema, or an empty
+                         string not to cache them. geogratis.tables by default.
+        --spatial-precision Number of decimal places to round the coordinates of spatial fields to, 6 by default
+                         (about 0.1 m), or -1 to keep them in full
+        --spatial-tolerance Degrees within which to simplify lines and polygons in spatial fields, 0 (not to
+                         simplify them) by default. Rectangles are never simplified, and polygon rings are never
+                         collapsed or turned inside out.
+        --startup-only   Stop once the subcommand has started up, without doing anything
+        --runs           Number of times to start each subcommand when timing startup, or to run a benchmark
+        --products       Number of synthetic products to benchmark with
+        --stream         Parse feed pages and records as they are received instead of after reading them in full.
+                         Products are imported as soon as they are read from a feed page. Records converted with -P,
+                         and everything retrieved by the evented engine, are still read in full.
+        --shard-report   Filename of a report from a sharded harvest to merge
+        --failures       Filename of the queue of records that failed to import
+        --max-attempts   Number of failures after which retry_failed stops retrying a record
+        --all            Retry every queued record straight away, however often it has failed
+        --base-url       Base URL of the Geogratis API to harvest from
+        --record         Record the responses from Geogratis in an archive
+        --replay         Answer requests from an archive instead of Geogratis
+        --listen         Host and port at which to serve an archive
+        --latency        Milliseconds by which to delay every response served from an archive
+        --latency-jitter Largest number of milliseconds by which to vary the delay of a response
+        --error-rate     Fraction of requests to answer with a server error when serving an archive
+        --seed           Seed for the random delays and errors when serving an archive
+        --metrics-file   Filename of a JSON file to write the metrics of the run to
+        --prometheus-file Filename of a file to write the metrics to in the Prometheus text format
+        --metrics-interval Seconds between writes of the Prometheus metrics file
+        --profile        Filename of a cProfile dump of the conversion of records
+        --poll-interval  Seconds to wait between polls of the monitor link when watching for changes
+        --jitter         Largest number of seconds by which to vary the wait between polls
+        --catalog        Filename of a catalog in which to keep every record imported
+        --series         Only export or reconvert the records in this data series
+        --topic          Only export or reconvert the records with this topic category
+        --failed         Only export or reconvert the records that failed
 
 
     """
@@ -57,8 +316,95 @@ class GeogratisCommand(CkanCommand):
     parser.add_option('-n', '--no-print', dest='noprint', action='store_true', help='Do not print out the JSON records')
     parser.add_option('-m', '--max', dest='maximum', help='Maximum number of times to read the Geogratis feed',
                       default=1)
+    parser.add_option('-p', '--prefetch', dest='prefetch', default=1,
+                      help='Number of Geogratis feed pages to read ahead')
+    parser.add_option('-P', '--processes', dest='processes', default=1,
+                      help='Number of processes with which to convert records')
+    parser.add_option('-e', '--engine', dest='engine', default='threads', type='choice',
+                      choices=['threads', 'evented'], help='Harvest with threads or on an event loop')
     parser.add_option('-z', '--reset', dest='reset', action='store_true',
                       help='Reset the feed and start from the beginning')
+    parser.add_option('-w', '--workers', dest='workers', default=1,
+                      help='Number of Geogratis records to retrieve concurrently')
+    parser.add_option('--rate', dest='rate', default=20,
+                      help='Number of requests per second to start sending to Geogratis')
+    parser.add_option('--max-rate', dest='max_rate', default=0,
+                      help='Maximum number of requests per second to send to Geogratis')
+    parser.add_option('--retries', dest='retries', default=4, help='Number of times to retry a failed request')
+    parser.add_option('--timeout', dest='timeout', default=10, help='Seconds to wait for Geogratis to respond')
+    parser.add_option('--pool-size', dest='pool_size', default=4,
+                      help='Number of idle connections to keep open to Geogratis')
+    parser.add_option('--cache-dir', dest='cache_dir', help='Directory in which to cache Geogratis responses')
+    parser.add_option('--cache-size', dest='cache_size', default=512,
+                      help='Maximum size of the response cache in megabytes')
+    parser.add_option('--offline', dest='offline', action='store_true',
+                      help='Only use cached responses, without contacting Geogratis')
+    parser.add_option('--index', dest='index_file', help='Filename of the index of previously harvested records')
+    parser.add_option('--delta-file', dest='delta_file',
+                      help='Filename of a JSON lines file to write out new, changed and removed records to')
+    parser.add_option('-k', '--checkpoint', dest='checkpoint',
+                      help='Filename of the journal used to resume an interrupted harvest')
+    parser.add_option('-s', '--shard', dest='shard', help='Harvest only the K-th of N shards of the feed, given as K/N')
+    parser.add_option('--shard-report', dest='shard_reports', action='append', default=[],
+                      help='Filename of a report from a sharded harvest to merge')
+    parser.add_option('--ckan', dest='ckan', action='store_true', help='Create or update the datasets in CKAN')
+    parser.add_option('--batch-size', dest='batch_size', default=50,
+                      help='Number of records to load into CKAN at a time')
+    parser.add_option('--compress', dest='compression', type='choice', choices=sorted(COMPRESSIONS),
+                      help='Compress the JSON lines file')
+    parser.add_option('--rotate-size', dest='rotate_size', default=0,
+                      help='Megabytes at which to start a new JSON lines file')
+    parser.add_option('--rotate-records', dest='rotate_records', default=0,
+                      help='Number of records at which to start a new JSON lines file')
+    parser.add_option('--sync-interval', dest='sync_interval', default=100,
+                      help='Number of records to import between checkpoints')
+    parser.add_option('--tables-cache', dest='tables_cache', default='geogratis.tables',
+                      help='Filename in which to cache the look-up tables built from the Open Data schema')
+    parser.add_option('--spatial-precision', dest='spatial_precision', default=DEFAULT_PRECISION,
+                      help='Number of decimal places to round spatial coordinates to')
+    parser.add_option('--spatial-tolerance', dest='spatial_tolerance', default=0,
+                      help='Degrees within which to simplify spatial lines and polygons')
+    parser.add_option('--startup-only', dest='startup_only', action='store_true',
+                      help='Stop once the subcommand has started up')
+    parser.add_option('--runs', dest='runs', default=5, help='Number of times to start each subcommand')
+    parser.add_option('--products', dest='products', default=1000,
+                      help='Number of synthetic products to benchmark with')
+    parser.add_option('--stream', dest='stream', action='store_true',
+                      help='Parse Geogratis responses as they are received')
+    parser.add_option('--failures', dest='failures', default='geogratis.failures',
+                      help='Filename of the queue of records that failed to import')
+    parser.add_option('--max-attempts', dest='max_attempts', default=10,
+                      help='Number of failures after which to stop retrying a record')
+    parser.add_option('--all', dest='retry_all', action='store_true',
+                      help='Retry every queued record straight away')
+    parser.add_option('--base-url', dest='base_url', default=GEOGRATIS_API,
+                      help='Base URL of the Geogratis API')
+    parser.add_option('--record', dest='record', help='Filename of an archive in which to record responses')
+    parser.add_option('--replay', dest='replay', help='Filename of an archive from which to replay responses')
+    parser.add_option('--listen', dest='listen', default='127.0.0.1:8080',
+                      help='Host and port at which to serve an archive')
+    parser.add_option('--latency', dest='latency', default=0,
+                      help='Milliseconds by which to delay every response served from an archive')
+    parser.add_option('--latency-jitter', dest='latency_jitter', default=0,
+                      help='Largest number of milliseconds by which to vary the delay of a response')
+    parser.add_option('--error-rate', dest='error_rate', default=0,
+                      help='Fraction of requests to answer with a server error when serving an archive')
+    parser.add_option('--seed', dest='seed', help='Seed for the random delays and errors when serving an archive')
+    parser.add_option('--metrics-file', dest='metrics_file', help='Filename of a JSON file to write metrics to')
+    parser.add_option('--prometheus-file', dest='prometheus_file',
+                      help='Filename of a file to write metrics to in the Prometheus text format')
+    parser.add_option('--metrics-interval', dest='metrics_interval', default=15,
+                      help='Seconds between writes of the Prometheus metrics file')
+    parser.add_option('--profile', dest='profile', help='Filename of a cProfile dump of the conversion of records')
+    parser.add_option('--poll-interval', dest='poll_interval', default=60,
+                      help='Seconds to wait between polls of the monitor link')
+    parser.add_option('--jitter', dest='jitter', default=5,
+                      help='Largest number of seconds by which to vary the wait between polls')
+    parser.add_option('--catalog', dest='catalog', help='Filename of a catalog in which to keep every record imported')
+    parser.add_option('--series', dest='series', help='Only export or reconvert the records in this data series')
+    parser.add_option('--topic', dest='topic', help='Only export or reconvert the records with this topic category')
+    parser.add_option('--failed', dest='failed', action='store_true',
+                      help='Only export or reconvert the records that failed')
     parser.add_option('-c', '--config', dest='config',
                       default='development.ini', help='Configuration file to use.')
 
@@ -72,6 +418,41 @@ class GeogratisCommand(CkanCommand):
 
         cmd = self.args[0]
 
+        # Command: merge - combine the output of sharded harvests. Nothing is converted or loaded into CKAN, so
+        #                  neither the CKAN configuration nor the look-up tables below are needed.
+
+        if cmd == 'merge':
+            if not self.options.startup_only:
+                self._merge_shards()
+            return
+
+        # Command: serve - answer requests from an archive of recorded responses in place of Geogratis
+
+        if cmd == 'serve':
+            if not self.options.startup_only:
+                self._serve_archive()
+            return
+
+        # Command: export - write out the records kept in a catalog again. Nothing is converted or loaded into CKAN.
+
+        if cmd == 'export':
+            if not self.options.startup_only:
+                self._export_catalog()
+            return
+
+        # Command: startup_benchmark - time how long each subcommand takes to start up
+
+        if cmd == 'startup_benchmark':
+            self._benchmark_startup()
+            return
+
+        # Command: throughput_benchmark - time harvests of a synthetic feed from a stand-in server, with one worker
+        # and with several
+
+        if cmd == 'throughput_benchmark':
+            self._benchmark_throughput()
+            return
+
         self._load_config()
 
         self.logger = logging.getLogger('ckanext')
@@ -80,65 +461,146 @@ class GeogratisCommand(CkanCommand):
         # * topic categories
         # * resource file format types
         # * geographic regions
+        # The tables are cached between runs, and rebuilt when the installed schema changes.
+
+        self._set_lookup_tables(load_lookup_tables(self.options.tables_cache))
+
+        # Spatial fields are written as compact GeoJSON
+        precision = int(self.options.spatial_precision)
+        self.spatial_encoder = SpatialEncoder(precision if precision >= 0 else None,
+                                              float(self.options.spatial_tolerance))
 
-        # Topic categories
-        self.topic_choices = dict((c['eng'], c)
-                                  for c in schema_description.dataset_field_by_id['topic_category']['choices'] if
-                                  'eng' in c)
-
-        # Resource file types - additional mappings to the correct types are added 
-        # for Geogratis because the file formats in Geogratis do not match one-for-one with Open Data formats
-        self.format_types = dict((item['eng'], item['key'])
-                                 for item in schema_description.resource_field_by_id['format']['choices'])
-        self.format_types['GeoTIFF (Georeferenced Tag Image File Format)'] = 'geotif'
-        self.format_types['TIFF (Tag Image File Format)'] = "tiff"
-        self.format_types['GeoTIFF'] = 'geotif'
-        self.format_types['Adobe PDF'] = 'PDF'
-        self.format_types['PDF - Portable Document Format'] = "PDF"
-        self.format_types['ASCII (American Standard Code for Information Interchange)'] = "TXT"
-        self.format_types['GML (Geography Markup Language)'] = "gml"
-        self.format_types['Shape'] = "SHAPE"
-        self.format_types['gzip (GNU zip)'] = "ZIP"
-        self.format_types['ZIP'] = "ZIP"
-        self.format_types['ESRI Shapefile'] = "SHAPE"
-        self.format_types['JPEG'] = "jpg"
-        self.format_types['Jpeg 2000'] = "jpeg 2000"
-
-        # Geographic regions - note that Open Data uses far fewer regions than Geogratis
-        self.geographic_regions = dict((region['eng'], region['key'])
-                                       for region in
-                                       schema_description.dataset_field_by_id['geographic_region']['choices'])
-
-        self.presentation_forms = {}
-        self.presentation_forms['documentDigital'] = u"Document Digital | Document num\u00e9rique"
-        self.presentation_forms['documentHardcopy'] = u"Document Hardcopy | Document papier"
-        self.presentation_forms['imageDigital'] = u"Image Digital | Image num\u00e9rique"
-        self.presentation_forms['imageHardcopy'] = u"Image Hardcopy | Image papier"
-        self.presentation_forms['mapDigital'] = u"Map Digital | Carte num\u00e9rique"
-        self.presentation_forms['mapHardcopy'] = u"Map Hardcopy | Carte papier"
-        self.presentation_forms['modelDigital'] = u"Model Digital | Mod\u00e8le num\u00e9rique"
-        self.presentation_forms['modelHardcopy'] = u"Model Hardcopy | Maquette"
-        self.presentation_forms['profileDigital'] = u"Profile Digital | Profil num\u00e9rique"
-        self.presentation_forms['profileHardcopy'] = u"Profile Hardcopy | Profil papier"
-        self.presentation_forms['tableDigital'] = u"Table Digital | Table num\u00e9rique"
-        self.presentation_forms['tableHardcopy'] = u"Table Hardcopy | Table papier"
-        self.presentation_forms['videoDigital'] = u"Video Digital | Vid\u00e9o num\u00e9rique"
-        self.presentation_forms['videalHardcopy'] = u"Video Hardcopy | Vid\u00e9o film"
-        self.presentation_forms['audioDigital'] = u"Audio Digital | Audio num\u00e9rique"
-        self.presentation_forms['audioHardcopy'] = u"Audio Hardcopy | Audio analogique"
-        self.presentation_forms['multimediaDigital'] = u"Multimedia Digital | Multim\u00e9dia num\u00e9rique"
-        self.presentation_forms['multimediaHardcopy'] = u"Multimedia Hardcopy | Multim\u00e9dia analogique"
-        self.presentation_forms['diagramDigial'] = u"Diagram Digital | Diagramme num\u00e9rique"
-        self.presentation_forms['diagramHardcopy'] = u"Diagram Hardcopy | Diagramme papier"
+        self.base_url = self.options.base_url.rstrip('/')
 
+        # Every stage of the run is timed, and the conversion of records can also be profiled
+        self.metrics = RunMetrics()
+        self.exporter = None
+        self.profiler = None
+        if self.options.profile:
+            import cProfile
+            self.profiler = cProfile.Profile()
         self.output_file = sys.stdout
+        self.output = None
+        self.completed = []
+        self.resuming_page = False
         self.display_formatted = True
+        self.pool = None
+        self.conversion_pool = None
+        self.index = None
+        self.delta_file = None
+        self.checkpoint = None
+        self.ckan_sink = None
+        self.report = None
+        self.watched = None
+        self.last_page = None
+        self.failures = None
+        self.failure = None
+        self.seen = None
+        self.duplicate = False
+        self.ckan_rejected = set()
+        self.catalog = None
+        self.catalog_products = {}
+        self.raw_products = None
+
+        # Command: conversion_benchmark - time the conversion of synthetic products, with the look-up tables built
+        # once and with them built again for every record
+
+        if cmd == 'conversion_benchmark':
+            if not self.options.startup_only:
+                self._benchmark_conversion()
+            return
+
+        # A sharded harvest only imports the products whose IDs fall in its shard
+        self.shard = None
+        if self.options.shard:
+            try:
+                self.shard = parse_shard(self.options.shard)
+            except ValueError, e:
+                print e
+                return
+
+        # Feed harvests record their progress in a checkpoint journal so that an interrupted run can be resumed.
+        # Each shard has its own journal, so that shards can also be harvested one after another on one node.
+        # Watching for changes keeps a journal of its own, so that it does not disturb full harvests.
+        if cmd in ('updated', 'get_all', 'watch'):
+            checkpoint = self.options.checkpoint
+            if not checkpoint:
+                name = 'geogratis-watch' if cmd == 'watch' else 'geogratis'
+                checkpoint = '%s-%d-of-%d.ckpt' % ((name,) + self.shard) if self.shard else '%s.ckpt' % name
+            self.checkpoint = CheckpointJournal(os.path.normpath(checkpoint))
+            if self.options.reset:
+                self.checkpoint.reset()
+
+        # Records that fail to import are queued so that they can be retried on their own
+        if cmd in ('updated', 'get_all', 'watch', 'import_many', 'retry_failed') and self.options.failures:
+            self.failures = FailureQueue(os.path.normpath(self.options.failures))
 
-        # Default output is JSON lines (one JSON record per line) but human-readable formatting is an option
+        # Imported records can be kept in a local catalog, from which reconvert converts them again
+        catalog = self.args[1] if cmd == 'reconvert' and len(self.args) > 1 else self.options.catalog
+        if catalog and cmd != 'print_one':
+            from ckanext.geogratis.catalog import CatalogStore
+            self.catalog = CatalogStore(os.path.normpath(catalog))
+
+        # Default output is JSON lines (one JSON record per line) but human-readable formatting is an option.
+        # When resuming, the output of the interrupted run is continued from its last checkpoint.
         if self.options.jl_file:
-            self.output_file = open(os.path.normpath(self.options.jl_file), 'wt')
+            if cmd == 'print_one':
+                self.output_file = open(os.path.normpath(self.options.jl_file), 'wt')
+            else:
+                self.output = JsonLinesSink(os.path.normpath(self.options.jl_file), self.options.compression,
+                                            int(float(self.options.rotate_size) * 1048576),
+                                            int(self.options.rotate_records))
+                if self.checkpoint and self.checkpoint.position is not None:
+                    self.output.resume(self.checkpoint.position)
             self.display_formatted = False
 
+        # All requests to Geogratis, from any worker thread, share the same rate limit. Nothing is sent to
+        # Geogratis when working offline from the cache, so there is nothing to limit or retry.
+        if self.options.offline:
+            self.rate_limiter = AdaptiveRateLimiter(0)
+            self.retries = 0
+        else:
+            self.rate_limiter = AdaptiveRateLimiter(float(self.options.rate), float(self.options.max_rate))
+            self.retries = int(self.options.retries)
+        # Requests can also be answered from, or recorded in, an archive of responses
+        if self.options.replay:
+            from ckanext.geogratis.archive import ReplayTransport, ResponseArchive
+            self.transport = ReplayTransport(ResponseArchive(os.path.normpath(self.options.replay)), self.base_url)
+        else:
+            self.transport = HttpTransport(float(self.options.timeout), int(self.options.pool_size))
+        if self.options.cache_dir:
+            cache = ResponseCache(os.path.normpath(self.options.cache_dir),
+                                  int(float(self.options.cache_size) * 1048576))
+            self.transport = CachingTransport(self.transport, cache, self.options.offline)
+        elif self.options.offline:
+            print 'The --offline option requires a --cache-dir'
+            return
+        if self.options.record:
+            from ckanext.geogratis.archive import RecordingTransport, ResponseArchive
+            try:
+                archive = ResponseArchive(os.path.normpath(self.options.record), self.base_url, writable=True)
+            except ValueError, e:
+                print e
+                return
+            self.transport = RecordingTransport(self.transport, archive, self.base_url)
+
+        # With -P records are converted in a pool of processes. They are forked before any other thread is started,
+        # since a process forked while another thread holds a lock can wait on that lock forever.
+        if (int(self.options.processes) > 1 and self.options.engine != 'evented' and not self.options.startup_only and
+                cmd in ('import_many', 'retry_failed', 'updated', 'get_all', 'watch', 'reconvert')):
+            self._start_conversion_pool()
+
+        # Optionally load the converted datasets straight into CKAN
+        if self.options.ckan and cmd != 'print_one':
+            self.ckan_sink = CkanSink(int(self.options.batch_size))
+
+        if self.options.startup_only:
+            return
+
+        if self.options.prometheus_file:
+            self.exporter = PrometheusExporter(self.metrics, os.path.normpath(self.options.prometheus_file),
+                                               float(self.options.metrics_interval))
+
         # Command: print_one - retrieve one record from Geogratis and print it out.
 
         if cmd == 'print_one':
@@ -166,33 +628,115 @@ class GeogratisCommand(CkanCommand):
 
             except urllib2.URLError, e:
                 self.logger.error(e.reason)
+            finally:
+                self._close_ckan_sink()
+                if self.output:
+                    self.output.close()
+                if self.catalog is not None:
+                    self.catalog.close()
+                self._finish_metrics()
+
+        # Command: import_many - retrieve a list of records from Geogratis, several at a time, and convert them to
+        #                        open data's JSON format.
+        # Command: retry_failed - import the records in the failure queue again
+
+        elif cmd == 'import_many' or cmd == 'retry_failed':
+            if cmd == 'retry_failed':
+                if self.failures is None:
+                    print self.__doc__
+                    return
+                ids = self.failures.due(max_attempts=int(self.options.max_attempts),
+                                        backoff=not self.options.retry_all)
+                print >> sys.stderr, 'Retrying %d of %d failed records' % (len(ids), len(self.failures))
+            else:
+                ids = self._read_ids()
+            self.report = ImportReport(self.options.report_file)
+            try:
+                self._import_ids(ids)
+            except urllib2.URLError, e:
+                self.logger.error(e.reason)
+            finally:
+                self._close_pools()
+                self._close_ckan_sink()
+                if self.output:
+                    self.output.close()
+                self.report.close()
+                print >> sys.stderr, self.report.summary()
+                if self.failures is not None:
+                    if cmd == 'retry_failed':
+                        still_failing = sum(1 for id in ids if self.failures.get(id))
+                        print >> sys.stderr, '%d of %d retried records imported, %d still failing' % (
+                            len(ids) - still_failing, len(ids), still_failing)
+                    self.failures.close()
+                if self.catalog is not None:
+                    self.catalog.close()
+                self._finish_metrics()
+
+        # Command: reconvert - convert the Geogratis records kept in a catalog again, without contacting Geogratis
+
+        elif cmd == 'reconvert':
+            if self.catalog is None:
+                print self.__doc__
+                return
+            self.report = ImportReport(self.options.report_file)
+            try:
+                self._reconvert_catalog()
+            finally:
+                self._close_pools()
+                self._close_ckan_sink()
+                if self.output:
+                    self.output.close()
+                self.catalog.close()
+                self.report.close()
+                print >> sys.stderr, self.report.summary()
+                self._finish_metrics()
+
+        # Command: watch - keep importing the records that change in Geogratis, as listed at the monitor link of
+        #                  the feed, until interrupted.
 
-        elif cmd == 'updated' or cmd == 'get_all':
+        elif cmd in ('updated', 'get_all', 'watch'):
 
             # By default, retrieve all records from Geogratis
-            query_string = 'http://geogratis.gc.ca/api/en/nrcan-rncan/ess-sst?alt=json'
+            query_string = '%s/en/nrcan-rncan/ess-sst?alt=json' % self.base_url
 
-            # Retrieve records using the last-edited date.
-            if cmd == 'updated':
+            # Retrieve records using the last-edited date. A watch only starts from a date if one is given.
+            if cmd == 'updated' or (cmd == 'watch' and self.options.date):
                 if not self.options.date:
                     print self.__doc__
                     return
+                import dateutil.parser
                 try:
                     dt = dateutil.parser.parse(self.options.date)
-                    query_string = 'http://geogratis.gc.ca/api/en/nrcan-rncan/ess-sst?edited-min=%s&alt=json' % dt.isoformat()
+                    query_string = '%s/en/nrcan-rncan/ess-sst?edited-min=%s&alt=json' % (self.base_url, dt.isoformat())
                 except ValueError, e:
                     self.logger.error('"%s" is an invalid date' % self.options.date)
                     return
 
-            # Check to see if we are resuming from a previous feed. If the reset flag was set, then blank out the
-            # previous feed link and restart from scratch
+            # Check to see if we are resuming from a previous feed. If the reset flag was set, then the checkpoint
+            # and the previous feed link have been blanked out and we restart from scratch. The feed link saved in
+            # geogratis.cfg by earlier versions is still used when there is no checkpoint.
 
+            resumed = False
+            resume_ids = set()
+            has_cfg = os.path.exists('geogratis.cfg')
             if self.options.reset:
-                self._set_cfg_value('AtomFeed', 'monitor_link', '')
-            else:
+                if has_cfg:
+                    self._set_cfg_value('AtomFeed', 'monitor_link', '')
+            elif self.checkpoint.cursor:
+                query_string = self.checkpoint.cursor
+                resume_ids = self.checkpoint.done
+                resumed = True
+            elif has_cfg:
                 rel_link = self._get_cfg_value('AtomFeed', 'monitor_link')
                 if rel_link:
                     query_string = rel_link
+                    resumed = True
+
+            evented = self.options.engine == 'evented'
+            if evented and (int(self.options.processes) > 1 or self.options.cache_dir or self.options.record or
+                            self.options.replay):
+                print 'The evented engine cannot be combined with --processes, --cache-dir, --record or --replay'
+                return
 
             # Get the feed from Geogratis. The Atom feed only provides a list of datasets which then need to pulled in
             # one by one in their entirety.
@@ -201,58 +745,723 @@ class GeogratisCommand(CkanCommand):
             except urllib2.URLError, e:
                 self.logger.error(e.reason)
                 return
+            if not json_obj:
+                return
+
+            # A new watch without a date does not import the feed it starts from, only the changes listed at its
+            # monitor link from now on
+            watch_from_now = cmd == 'watch' and not self.options.date and not resumed
+            if query_string != self.checkpoint.cursor and not watch_from_now:
+                self.checkpoint.begin_page(query_string, self._sync_output())
 
             dt = datetime.date.today()
 
             # Set a maximum number of data sets to retrieve
             maxreads = int(self.options.maximum)  # artificial limit while developing
-            read_cnt = 0
 
-            # Log all exports to a CSV file
+            # Log all exports to a CSV file, and summarize them at the end in any case
 
-            if self.options.report_file:
-                reportf = open(self.options.report_file, 'wt') # use 'at' for appending
-                fieldnames = ('ID', 'Pass or Fail', 'Title (EN)', 'Title (FR)', 'Summary (EN)', 'Summary (FR)',
-                              'Topic Categories', 'Keywords', 'Published Date', 'Browse Images',
-                              'Series (EN)', 'Series (FR)', 'Series Issue (EN)', 'Series Issue (FR)',
-                              'Reason for Failure')
-                self.report = csv.DictWriter(reportf, dialect='excel', fieldnames=fieldnames)
-                self.report.writerow(dict(zip(fieldnames, fieldnames)))
+            self.report = ImportReport(self.options.report_file)
+
+            # Optionally skip records that have not changed since the last harvest, and keep a separate file
+            # of only the records that are new, changed or removed.
+            if self.options.index_file:
+                from ckanext.geogratis.index import HarvestIndex
+                self.index = HarvestIndex(os.path.normpath(self.options.index_file))
+                if self.options.delta_file:
+                    self.delta_file = open(os.path.normpath(self.options.delta_file), 'wt')
+            elif cmd == 'watch':
+                # Without an index, a watch still skips records that it has already written out unchanged
+                self.watched = {}
+
+            # Records edited while the feed is being read can be listed again on a later page. They are only
+            # imported again if they have been edited since they were first imported during this run.
+            if cmd != 'watch':
+                from ckanext.geogratis.dedup import SeenRecords
+                self.seen = SeenRecords()
+
+            # The index may already include products on the page being resumed whose output was discarded, so
+            # they are written out again regardless of the index.
+            self.resuming_page = resumed
 
             # Keep reading from the Atom feed until the end is reached, or the user provided
             # maximum number of reads is reached
             try:
-                while True:
-
-                    read_cnt = read_cnt + 1
-                    products = json_obj['products'] # Array of datasets in the JSON response from Geogratis
-                    for product in products:
-                        time.sleep(0.05)  # Allow some gap in time between requests to Geogratis
-
-                        self._import_geogratis_record(product['id'])
-
-                    # get the next set from the Atom feed. When the Atom feed is empty (or
-                    # the maximum read count has been reached, then we are done.
-                    next_link = self._get_next_link(json_obj)
-                    monitor_link = self._get_next_link(json_obj, "monitor")
-                    if next_link:
-                        self._set_cfg_value('AtomFeed', 'monitor_link', monitor_link)
-                        print 'Now retrieving %s' % next_link
-                        json_obj = self._get_feed_json_obj(next_link)
-
-                    if json_obj['count'] == 0 or read_cnt == maxreads:
-                        break
+                if cmd == 'watch':
+                    self._watch(json_obj, resume_ids, not watch_from_now)
+                else:
+                    exhausted = self._harvest(json_obj, maxreads, resume_ids)
+
+                    # Records can only be known to be gone from Geogratis after reading the entire feed
+                    if self.index is not None and cmd == 'get_all' and not resumed and exhausted:
+                        for id in self.index.remove_unseen(self._in_shard):
+                            self._write_delta(id, 'removed')
+            finally:
+                self._close_pools()
+                self._complete_feed_records()
+                self.checkpoint.close()
+                self._close_ckan_sink()
+                if self.index is not None:
+                    self.index.close()
+                if self.failures is not None:
+                    self.failures.close()
+                if self.catalog is not None:
+                    self.catalog.close()
+                if self.seen is not None:
+                    self.seen.close()
+                    if self.metrics.counters['duplicates']:
+                        self.logger.info('%d records listed again in the feed were skipped' %
+                                         self.metrics.counters['duplicates'])
+                if self.delta_file:
+                    self.delta_file.close()
+                if self.output:
+                    self.output.close()
+                self.logger.info('Geogratis transport: %s' % self.transport.summary())
+                self.report.close()
+                print >> sys.stderr, self.report.summary()
+                self._finish_metrics()
+
+
+    def _harvest(self, first_page, maxreads, skip_ids):
+        """Import the products of the feed starting at first_page with the chosen engine, and return True if the end
+        of the feed was reached"""
+        if self.options.engine == 'evented':
+            from ckanext.geogratis.evented import EventedHarvest
+            harvest = EventedHarvest(self, first_page, int(self.options.workers), float(self.options.timeout),
+                                     maxreads, skip_ids)
+            return harvest.run()
+        return self._harvest_feed(first_page, maxreads, skip_ids)
+
+    def _watch(self, first_page, skip_ids, import_first=True):
+        """Import the changes listed at the monitor link of the feed as they are made in Geogratis, until interrupted
+
+        first_page is imported first if import_first is set. After that, the monitor link of the last page read is
+        polled every --poll-interval seconds, give or take up to --jitter seconds, and every page of changes that a
+        poll returns is imported. The look-up tables, connections and worker pools are kept from one poll to the
+        next, and the output is made durable and recorded in the checkpoint journal after each poll. A poll that
+        fails part way is picked up again from the checkpoint journal at the next one.
+
+        """
+        interval = float(self.options.poll_interval)
+        jitter = min(float(self.options.jitter), interval)
+        page = first_page
+        try:
+            while True:
+                if page is not None:
+                    link = None
+                    try:
+                        if import_first and page['count']:
+                            self.last_page = page
+                            self._harvest(page, 0, skip_ids)
+                            page = self.last_page
+                        link = self._get_next_link(page, 'monitor') or page['url']
+                    except urllib2.URLError, e:
+                        self.logger.error(e.reason)
+                    self._complete_feed_records()
+                    if link and (link != self.checkpoint.cursor or self.checkpoint.done):
+                        self.checkpoint.begin_page(link, self._sync_output())
+                    self._flush_changes()
+                import_first = True
+                self.resuming_page = False
+
+                delay = max(interval + random.uniform(-jitter, jitter), 0)
+                print >> sys.stderr, 'Next poll of %s in %.1f seconds' % (self.checkpoint.cursor, delay)
+                time.sleep(delay)
+                skip_ids = set(self.checkpoint.done)
+                try:
+                    page = self._get_feed_json_obj(self.checkpoint.cursor)
+                except urllib2.URLError, e:
+                    self.logger.error(e.reason)
+                    page = None
+        except KeyboardInterrupt:
+            print >> sys.stderr, 'Stopped watching for changes'
+
+    def _flush_changes(self):
+        """Pass on the records imported so far without waiting for a full batch or buffer"""
+        if self.ckan_sink:
+            self.ckan_sink.flush()
+            self._report_ckan_failures()
+        if self.delta_file:
+            self.delta_file.flush()
+        if self.index is not None:
+            self.index.sync()
+        if self.failures is not None:
+            self.failures.sync()
+        if self.catalog is not None:
+            self.catalog.sync()
+
+    def _close_pools(self):
+        """Stop the worker threads and conversion processes, which are kept from one harvest to the next"""
+        if self.pool:
+            self.pool.close()
+            self.pool = None
+        if self.conversion_pool:
+            self.conversion_pool.terminate()
+            self.conversion_pool.join()
+            self.conversion_pool = None
+
+    def _harvest_feed(self, first_page, maxreads, skip_ids):
+        """Import the products of the feed starting at first_page, and return True if the end of the feed was reached
+
+        Following pages are read ahead in the background while the products of the current page are being imported.
+
+        """
+        pages = FeedPrefetcher(self._stream_feed_page, self._get_next_link, first_page,
+                               int(self.options.prefetch), maxreads)
+        try:
+            entries = self._get_feed_entries(pages, skip_ids)
+            for id, page, record in self._convert_geogratis_records(self._fetch_geogratis_records(entries)):
+                if id:
+                    self._import_feed_record(id, record)
+                else:
+                    self._finish_feed_page(page)
+        finally:
+            pages.close()
+        return pages.exhausted
+
+    def _import_feed_record(self, id, record):
+        """Import one product from the feed and record it in the checkpoint journal"""
+        if self.index is not None:
+            self.index.mark_seen(id)
+        self._import_record(id, record)
+        self.completed.append(id)
+        if len(self.completed) >= int(self.options.sync_interval):
+            self._complete_feed_records()
+
+    def _import_record(self, id, record):
+        """Import one product retrieved by _fetch_geogratis_records, converted in a conversion process or not, and
+        queue it to be retried if it fails"""
+        self.failure = None
+        self.duplicate = False
+        self.ckan_rejected = set()
+        self.metrics.count('records')
+        self.raw_products = self.catalog_products.pop(id, None)
+        if isinstance(record, urllib2.URLError):
+            self.logger.error('Unable to retrieve %s: %s' % (id, record.reason))
+            self.failure = 'Unable to retrieve record: %s' % record.reason
+        elif self.conversion_pool:
+            self._import_converted_record(id, record)
+        else:
+            self._import_geogratis_record(id, record)
+        # A record that was already imported during this run stays in the failure queue as it was
+        if self.failures is not None and not self.duplicate:
+            if self.failure:
+                self.failures.add(id, self.failure)
+            elif id not in self.ckan_rejected:
+                # CKAN can already have rejected the record, if writing it out completed a batch
+                self.failures.remove(id)
+
+    def _read_ids(self):
+        """Read the product IDs listed in the ID file or on standard input. Each ID is returned once, in the order
+        first listed."""
+        path = self.args[1] if len(self.args) > 1 else '-'
+        id_file = sys.stdin if path == '-' else open(os.path.normpath(path), 'rt')
+        ids = []
+        seen = set()
+        try:
+            for line in id_file:
+                id = line.strip()
+                if id and id not in seen:
+                    seen.add(id)
+                    ids.append(id)
+        finally:
+            if id_file is not sys.stdin:
+                id_file.close()
+        return ids
+
+    def _import_ids(self, ids, progress_interval=10):
+        """Import the products with the given IDs
+
+        The records are retrieved by the worker pool and converted by the conversion processes like those of a
+        feed harvest. Progress and throughput are printed to standard error every progress_interval seconds and
+        at the end.
+
+        """
+        entries = ((id, None) for id in ids)
+        self._import_fetched(self._fetch_geogratis_records(entries), len(ids), progress_interval)
+
+    def _import_fetched(self, fetched, total, progress_interval=10):
+        """Import a stream of (id, tag, records) like those from _fetch_geogratis_records, printing progress for the
+        'total' records expected"""
+        start = last_progress = time.time()
+        imported = 0
+        for id, tag, record in self._convert_geogratis_records(fetched):
+            self._import_record(id, record)
+            imported += 1
+            now = time.time()
+            if now - last_progress >= progress_interval or imported == total:
+                last_progress = now
+                elapsed = max(now - start, 0.001)
+                print >> sys.stderr, 'Imported %d of %d records in %.1f seconds (%.1f records/s)' % (
+                    imported, total, elapsed, imported / elapsed)
+
+    def _catalog_selection(self):
+        """The records of the catalog selected on the command line, as arguments to CatalogStore.select"""
+        return {'since': self.options.date, 'series': self.options.series, 'topic': self.options.topic,
+                'valid': False if self.options.failed else None}
+
+    def _reconvert_catalog(self):
+        """Convert the selected Geogratis records in the catalog again, and store and write out the results as if
+        they had just been retrieved from Geogratis"""
+        raw = int(self.options.processes) > 1
+        selection = self._catalog_selection()
+
+        def fetched():
+            for record in self.catalog.select(**selection):
+                products = (record.product_en, record.product_fr)
+                # The records are stored again as they are, rather than serialized again after decoding them
+                self.catalog_products[record.id] = products
+                if not raw:
+                    products = tuple(product and self._decode_feed_json(self._get_item_url(record.id, lang), product)
+                                     for product, lang in zip(products, ('en', 'fr')))
+                yield record.id, None, products
+
+        self._import_fetched(fetched(), self.catalog.count(**selection))
+
+    def _export_catalog(self):
+        """Write the Open Data records kept in a catalog out again: those that passed to the JSON lines file, or the
+        console, and every selected record to the report"""
+        from ckanext.geogratis.catalog import CatalogStore
+
+        if len(self.args) < 2:
+            print self.__doc__
+            return
+        catalog = CatalogStore(os.path.normpath(self.args[1]))
+        output = None
+        if self.options.jl_file and not self.options.noprint:
+            output = JsonLinesSink(os.path.normpath(self.options.jl_file), self.options.compression,
+                                   int(float(self.options.rotate_size) * 1048576), int(self.options.rotate_records))
+        report = ImportReport(self.options.report_file) if self.options.report_file else None
+        exported = 0
+        try:
+            for record in catalog.select(**self._catalog_selection()):
+                if report:
+                    if record.odproduct is None:
+                        report.missing_french(record.id, record.title or u'')
+                    else:
+                        report.record(json.loads(record.odproduct), bool(record.valid), record.reasons or '')
+                if not record.valid or self.options.noprint:
+                    continue
+                # The records are written out as they were stored, without decoding them
+                if output:
+                    output.write(record.odproduct)
+                else:
+                    print record.odproduct
+                exported += 1
+        finally:
+            if output:
+                output.close()
+            catalog.close()
+            if report:
+                report.close()
+        print >> sys.stderr, '%d records exported' % exported
+        if report:
+            print >> sys.stderr, report.summary()
+
+    def _complete_feed_records(self):
+        """Make the output of the products completed since the last checkpoint durable and record them in the
+        checkpoint journal"""
+        if self.completed:
+            self.checkpoint.complete(self.completed, self._sync_output())
+            self.completed = []
+
+    def _finish_feed_page(self, page):
+        """Every product on this page has been imported. Remember where the feed continues from so that the next
+        run can resume there."""
+        self.resuming_page = False
+        self.last_page = page
+        next_link = self._get_next_link(page)
+        if next_link:
+            self.completed = []
+            self.checkpoint.begin_page(next_link, self._sync_output())
+            print 'Now retrieving %s' % next_link
+
+    def _get_feed_entries(self, pages, skip_ids=()):
+        """Stream (id, None) for every product in the feed pages, followed by (None, page) at the end of each page
+
+        Products on the first page whose IDs are in skip_ids were completed by an interrupted run and are left out.
+
+        """
+        for kind, value in pages:
+            if kind == 'product':
+                if value['id'] not in skip_ids and self._in_shard(value['id']) and not self._is_repeated(value):
+                    yield value['id'], None
+            else:
+                yield None, value
+                skip_ids = ()
+
+    def _is_repeated(self, product):
+        """True if a product listed in the feed was already imported during this run and the feed shows it has not
+        been edited since. Products listed without an updatedDate are retrieved again, to be compared once the
+        record has been retrieved."""
+        if self.seen is None or not product.get('updatedDate'):
+            return False
+        previous = self.seen.get(product['id'])
+        if previous is not None and product['updatedDate'] <= previous:
+            self.metrics.count('duplicates')
+            return True
+        return False
+
+    def _is_duplicate(self, id, updated_date):
+        """True if the record was already imported during this run from a version at least as new. Otherwise the
+        record is remembered as imported with its updatedDate, so that only a newer version is imported again."""
+        if self.seen is None:
+            return False
+        previous = self.seen.get(id)
+        if previous is not None and (updated_date or '') <= previous:
+            self.metrics.count('duplicates')
+            self.duplicate = True
+            return True
+        self.seen.add(id, updated_date)
+        return False
+
+    def _in_shard(self, id):
+        """True if the product belongs to the shard being harvested, or if the harvest is not sharded"""
+        return self.shard is None or shard_of(id, self.shard[1]) == self.shard[0]
+
+    def _merge_shards(self):
+        """Merge the JSON lines files and reports of sharded harvests, keeping the newest record for each ID"""
+        shard_files = self.args[1:]
+        if not shard_files or not self.options.jl_file:
+            print self.__doc__
+            return
+        try:
+            with open(os.path.normpath(self.options.jl_file), 'wb') as output:
+                read, written = merge_records([os.path.normpath(path) for path in shard_files], output)
+        except ValueError, e:
+            print e
+            return
+        print 'Merged %d records from %d shards into %d records' % (read, len(shard_files), written)
+
+        if self.options.report_file and self.options.shard_reports:
+            with open(os.path.normpath(self.options.report_file), 'wb') as output:
+                rows = merge_reports([os.path.normpath(path) for path in self.options.shard_reports], output)
+            print 'Merged %d reports into %d rows' % (len(self.options.shard_reports), rows)
+
+    def _serve_archive(self):
+        """Serve the recorded responses in the archive over HTTP in place of Geogratis until interrupted"""
+        from ckanext.geogratis.archive import ResponseArchive
+        from ckanext.geogratis.standin import StandInServer
+
+        if len(self.args) < 2:
+            print self.__doc__
+            return
+        archive = ResponseArchive(os.path.normpath(self.args[1]))
+        host, port = self.options.listen.rsplit(':', 1)
+        seed = int(self.options.seed) if self.options.seed is not None else None
+        server = StandInServer((host, int(port)), archive, float(self.options.latency) / 1000,
+                               float(self.options.latency_jitter) / 1000, float(self.options.error_rate), seed)
+        print 'Serving %d responses recorded from %s. Harvest them with --base-url http://%s:%d' % (
+            len(archive), archive.base_url, host, server.server_address[1])
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            archive.close()
+
+    def _benchmark_startup(self):
+        """Start each subcommand several times in a new process, stopping as soon as it has started up, and print
+        how long it took"""
+        runs = int(self.options.runs)
+        paster = [sys.executable] + sys.argv[:sys.argv.index('startup_benchmark')]
+        subcommands = [('print_one', ['-u', 'startup']), ('import_one', ['-u', 'startup']), ('import_many', []),
+                       ('retry_failed', []), ('updated', ['-d', '2000-01-01T00:00:00']), ('get_all', []), ('watch', []),
+                       ('reconvert', []), ('export', []), ('merge', []), ('serve', [])]
+        with open(os.devnull, 'wb') as devnull:
+            for subcommand, args in subcommands:
+                times = []
+                for run in range(runs):
+                    start = time.time()
+                    subprocess.call(paster + [subcommand] + args + ['--startup-only', '-c', self.options.config],
+                                    stdout=devnull, stderr=devnull)
+                    times.append(time.time() - start)
+                times.sort()
+                print '%-12s min %.3fs  median %.3fs  max %.3fs' % (subcommand, times[0], times[len(times) // 2],
+                                                                    times[-1])
+
+    def _benchmark_throughput(self):
+        """Harvest a feed of synthetic products from a stand-in server with one worker and with --workers workers,
+        several times each in a new process, and print how many records were imported per second"""
+        from ckanext.geogratis.archive import ResponseArchive
+        from ckanext.geogratis.corpus import write_feed_archive
+        from ckanext.geogratis.standin import StandInServer
+
+        workers = int(self.options.workers)
+        if workers <= 1:
+            workers = 8
+        products = int(self.options.products)
+        directory = tempfile.mkdtemp(prefix='geogratis-benchmark-')
+        try:
+            path = os.path.join(directory, 'feed.archive')
+            write_feed_archive(path, GEOGRATIS_API, products)
+            archive = ResponseArchive(path)
+            server = StandInServer(('127.0.0.1', 0), archive, float(self.options.latency) / 1000,
+                                   float(self.options.latency_jitter) / 1000)
+            thread = threading.Thread(target=server.serve_forever)
+            thread.daemon = True
+            thread.start()
+            try:
+                base_url = 'http://127.0.0.1:%d' % server.server_address[1]
+                rates = {}
+                for count in (1, workers):
+                    # The whole feed is harvested, not just the first page
+                    rates[count] = self._benchmark_runs('throughput_benchmark', directory, '-w %d' % count, [
+                        'get_all', '--base-url', base_url, '-m', '0', '-w', str(count), '-e', self.options.engine,
+                        '-n', '--rate', '0', '--failures', ''], products)
             finally:
-                self.output_file.close()
+                server.shutdown()
+                thread.join()
+                server.server_close()
+                archive.close()
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        if rates[1] and rates[workers]:
+            print 'Speed-up with -w %d: %.2fx' % (workers, rates[workers] / rates[1])
+
+    def _benchmark_conversion(self):
+        """Convert a catalog of synthetic products several times in this process with _convert_to_od_dataset, with
+        the look-up tables built once, as in a harvest, and with them built from the schema again and the topic and
+        keyword caches emptied for every record, and print how many records were converted per second"""
+        from ckanext.geogratis.catalog import CatalogStore
+        from ckanext.geogratis.corpus import write_catalog
+
+        # The records are read from the catalog and decoded beforehand, so that only their conversion is timed
+        directory = tempfile.mkdtemp(prefix='geogratis-benchmark-')
+        try:
+            path = os.path.join(directory, 'catalog.db')
+            write_catalog(path, int(self.options.products))
+            catalog = CatalogStore(path)
+            products = [(self._decode_feed_json(self._get_item_url(record.id, 'en'), record.product_en),
+                         self._decode_feed_json(self._get_item_url(record.id, 'fr'), record.product_fr))
+                        for record in catalog.select()]
+            catalog.close()
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+        rates = {}
+        for label, rebuild in (('tables', False), ('rebuilt', True)):
+            times = []
+            for run in range(int(self.options.runs)):
+                start = time.time()
+                for geoproduct_en, geoproduct_fr in products:
+                    if rebuild:
+                        self._set_lookup_tables(build_lookup_tables())
+                    self.err_reasons = ''
+                    self._convert_to_od_dataset(geoproduct_en, geoproduct_fr)
+                times.append(time.time() - start)
+            times.sort()
+            rates[label] = len(products) / times[len(times) // 2]
+            print '%-8s min %.1f  median %.1f  max %.1f records/s' % (label, len(products) / times[-1], rates[label],
+                                                                     len(products) / times[0])
+        print 'Speed-up with the tables built once: %.2fx' % (rates['tables'] / rates['rebuilt'])
+
+    def _benchmark_runs(self, benchmark, directory, label, args, expected):
+        """Run a subcommand --runs times in a new process in 'directory', each time with a new checkpoint journal,
+        print how many records it imported per second, and return the median, or None if it failed or did not
+        import the 'expected' number of records"""
+        paster = [sys.executable] + sys.argv[:sys.argv.index(benchmark)]
+        if os.path.exists(paster[1]):
+            paster[1] = os.path.abspath(paster[1])
+        options = ['-c', os.path.abspath(self.options.config)]
+        if self.options.tables_cache:
+            options += ['--tables-cache', os.path.abspath(self.options.tables_cache)]
+        metrics_file = os.path.join(directory, 'metrics.json')
+        journal = os.path.join(directory, 'benchmark.ckpt')
+        rates = []
+        with open(os.devnull, 'wb') as devnull:
+            for run in range(int(self.options.runs)):
+                # Every run starts from the beginning, rather than resuming from where the last one ended
+                if os.path.exists(journal):
+                    os.remove(journal)
+                code = subprocess.call(paster + args + options + ['-k', journal, '--metrics-file', metrics_file],
+                                       cwd=directory, stdout=devnull, stderr=devnull)
+                if code or not os.path.exists(metrics_file):
+                    print '%-8s failed with exit status %d' % (label, code)
+                    return None
+                with open(metrics_file) as metrics:
+                    report = json.load(metrics)
+                os.remove(metrics_file)
+                if report['counters'].get('records', 0) != expected:
+                    print '%-8s imported %d of the %d records' % (label, report['counters'].get('records', 0),
+                                                                  expected)
+                    return None
+                rates.append(report['records_per_second'])
+        rates.sort()
+        median = rates[len(rates) // 2]
+        print '%-8s min %.1f  median %.1f  max %.1f records/s' % (label, rates[0], median, rates[-1])
+        return median
+
+    def _set_lookup_tables(self, tables):
+        """Use the look-up tables from load_lookup_tables, mapping Geogratis topic strings and keywords to them anew
+        as they are first seen"""
+        self.topic_subjects = tables['topic_subjects']
+        self.format_types = tables['format_types']
+        self.geographic_regions = tables['geographic_regions']
+        self.presentation_forms = tables['presentation_forms']
+        self.topic_cache = {}
+        self.keyword_cache = {}
+
+    def _sync_output(self):
+        """Make the JSON lines and catalog records written so far, the failure queue and the harvest index durable
+        and return the position to resume the output from, or None when writing to the console. Records being
+        loaded into CKAN are waited for, since a resumed run does not load the records before the checkpoint again."""
+        if self.ckan_sink:
+            self.ckan_sink.wait()
+            self._report_ckan_failures()
+        if self.failures is not None:
+            self.failures.sync()
+        # The index is made durable with the journal, so that after a crash both agree on what was written out
+        if self.index is not None:
+            self.index.sync()
+            if self.delta_file:
+                self.delta_file.flush()
+        if self.catalog is not None:
+            self.catalog.sync()
+        if self.output:
+            return self._timed('output_sync', self.output.sync)
+
+    def _timed(self, stage, func, *args):
+        """Call func(*args) and record how long it took as a stage of the run. The conversion and serialization of
+        records are profiled when --profile is given."""
+        start = time.time()
+        try:
+            if self.profiler and stage in ('convert', 'serialize'):
+                return self.profiler.runcall(func, *args)
+            return func(*args)
+        finally:
+            self.metrics.observe(stage, time.time() - start)
+
+    def _finish_metrics(self):
+        """Write out the metrics and the profile of the run, if they were asked for"""
+        if self.exporter:
+            self.exporter.close()
+        if self.options.metrics_file:
+            extra = {'command': self.args[0]}
+            if hasattr(self.transport, 'stats'):
+                extra['transport'] = dict(self.transport.stats)
+            write_json(self.metrics, os.path.normpath(self.options.metrics_file), extra)
+        if self.profiler:
+            self.profiler.dump_stats(os.path.normpath(self.options.profile))
+
+    def _fetch_geogratis_records(self, entries):
+        """Retrieve the English and French records for a stream of (id, tag) pairs
+
+        Yields (id, tag, records) in the order given. Pairs without an ID are passed through without retrieving
+        anything. With more than one worker the records are retrieved concurrently, but conversion, output and
+        reporting still happen one record at a time on the calling thread so that the results are always in
+        feed order.
+
+        """
+        # Records that are converted in another process are passed along undecoded
+        raw = int(self.options.processes) > 1
+
+        def fetch(entry):
+            if entry[0]:
+                try:
+                    return self._fetch_geogratis_record(entry[0], raw)
+                except urllib2.URLError, e:
+                    # With a failure queue the record is queued by _import_record rather than ending the run
+                    if self.failures is None:
+                        raise
+                    return e
+
+        workers = int(self.options.workers)
+        if workers <= 1:
+            results = ((entry, fetch(entry)) for entry in entries)
+        else:
+            if not self.pool:
+                self.pool = WorkerPool(workers)
+            results = ordered_map(self.pool, fetch, entries, 2 * workers)
+        return ((entry[0], entry[1], geoproducts) for entry, geoproducts in results)
+
+    def _start_conversion_pool(self):
+        """Fork the processes that convert records for this command, which they inherit as it is now"""
+        global _conversion_command
+        import multiprocessing
 
+        _conversion_command = self
+        self.conversion_pool = multiprocessing.Pool(int(self.options.processes))
 
-    def _import_geogratis_record(self, id):
+    def _convert_geogratis_records(self, fetched):
+        """Convert a stream of retrieved (id, tag, records) in a pool of processes when more than one is requested
+
+        Yields (id, tag, result) in the order given, where result is the value of _convert_raw_record. A few
+        records per process are converted ahead of the one being yielded. With a single process the stream is
+        passed through unchanged, to be converted by _import_geogratis_record.
+
+        """
+        processes = int(self.options.processes)
+        if processes <= 1:
+            for fetched_record in fetched:
+                yield fetched_record
+            return
+
+        import multiprocessing.pool
+
+        def collect(result):
+            if not isinstance(result, multiprocessing.pool.AsyncResult):
+                return result
+            result, stages = result.get()
+            self.metrics.merge_stages(stages)
+            return result
+
+        pending = collections.deque()
+        for id, tag, raw_records in fetched:
+            # Records that could not be retrieved are passed along as the error
+            result = raw_records
+            if id and not isinstance(raw_records, urllib2.URLError):
+                # Records to be kept in the catalog are kept in it as they were retrieved
+                if self.catalog is not None:
+                    self.catalog_products.setdefault(id, raw_records)
+                result = self.conversion_pool.apply_async(_convert_record, ((id,) + raw_records,))
+            pending.append((id, tag, result))
+            if len(pending) > 2 * processes:
+                id, tag, result = pending.popleft()
+                yield id, tag, collect(result)
+        while pending:
+            id, tag, result = pending.popleft()
+            yield id, tag, collect(result)
+
+    def _fetch_geogratis_record(self, id, raw=False):
+        """Retrieve the English and French records for one dataset, undecoded if 'raw' is set
+
+        Both requests are issued at the same time. If the English record is unavailable the French request
+        is cancelled: it is not sent if it is still waiting on the rate limit, and its result is discarded
+        otherwise.
+
+        """
+        get_item = self._get_geogratis_item_data if raw else self._get_geogratis_item
+        cancel_fr = threading.Event()
+        task_fr = spawn(get_item, id, 'fr', cancel_fr)
+        try:
+            geoproduct_en = get_item(id, 'en')
+        except:
+            cancel_fr.set()
+            raise
+        if not geoproduct_en:
+            cancel_fr.set()
+            return geoproduct_en, None
+        return geoproduct_en, task_fr.result()
+
+    def _import_geogratis_record(self, id, geoproducts=None):
         self.err_reasons = ''
 
-        # Retrieve and test for English record
-        geoproduct_en = self._get_geogratis_item(id, 'en')
+        if geoproducts is None:
+            geoproducts = self._fetch_geogratis_record(id)
+        geoproduct_en, geoproduct_fr = geoproducts
+
+        # Test for English record
         if not geoproduct_en:
             self.logger.warn('Unable to retrieve English record for %s' % id)
+            self.failure = 'Unable to retrieve English record'
+            return
+
+        # Skip records that have not been edited in Geogratis since they were last harvested, or were already
+        # imported during this run
+        updated_date = geoproduct_en.get('updatedDate')
+        if self._is_duplicate(id, updated_date) or self._is_current(id, updated_date):
             return
 
         # A test could be used here if there is a desire to only process or exclude certain
@@ -260,39 +1469,161 @@ class GeogratisCommand(CkanCommand):
         # if self._get_product_type(geoproduct_en) == "canadian-digital-elevation-data":
         #    continue
 
-        # Retrieve and test for the existence of the matching French record
-        geoproduct_fr = self._get_geogratis_item(id, 'fr')
+        # Test for the existence of the matching French record
         if not geoproduct_fr:
-            self.logger.warn('Unable to retrieve French record for %s' % id)
-            self.err_reasons = "Unable to retrieve French record"
-            if self.options.report_file:
-                self.report.writerow({'ID': id,
-                                      'Pass or Fail': False,
-                                      'Title (EN)': geoproduct_en['title'].encode('utf-8'),
-                                      'Title (FR)': '',
-                                      'Summary (EN)': '',
-                                      'Summary (FR)': '',
-                                      'Topic Categories': '',
-                                      'Keywords': '',
-                                      'Published Date': '',
-                                      'Browse Images': '',
-                                      'Series (EN)': '',
-                                      'Series (FR)': '',
-                                      'Series Issue (EN)': '',
-                                      'Series Issue (FR)': '',
-                                      'Reason for Failure': 'Unable to retrieve French record'})
+            self._report_missing_french(id, geoproduct_en['title'])
+            self._catalog_record(id, updated_date, geoproducts, None, False, geoproduct_en['title'])
             return
 
         # Convert the Geogratis English and French dataset records into an Open Data JSON object
-        odproduct = self._convert_to_od_dataset(geoproduct_en, geoproduct_fr)
+        odproduct, valid = self._convert_to_od_dataset(geoproduct_en, geoproduct_fr)
+        self._catalog_record(id, updated_date, geoproducts, odproduct, valid)
+
+        if valid:
+            self._write_od_dataset(id, updated_date, odproduct)
 
-        if odproduct and not self.options.noprint:
-            if self.display_formatted:
-                print  >> self.output_file, (json.dumps(odproduct, indent=2 * ' '))
+    def _convert_raw_record(self, id, data_en, data_fr):
+        """Decode, convert and serialize one record, returning what _import_converted_record needs to finish it
+
+        The result is ('no_en',) if the English record is unavailable, ('no_fr', updatedDate, English title)
+        if the French one is, and otherwise ('converted', updatedDate, odproduct, valid, err_reasons, line).
+
+        """
+        if not data_en:
+            return ('no_en',)
+        geoproduct_en = self._decode_feed_json(self._get_item_url(id, 'en'), data_en)
+        updated_date = geoproduct_en.get('updatedDate')
+        if not data_fr:
+            return ('no_fr', updated_date, geoproduct_en['title'])
+        geoproduct_fr = self._decode_feed_json(self._get_item_url(id, 'fr'), data_fr)
+
+        self.err_reasons = ''
+        odproduct, valid = self._timed('convert', self._build_od_dataset, geoproduct_en, geoproduct_fr)
+        line = None
+        if valid and not self.options.noprint:
+            line = self._timed('serialize', self._serialize_od_dataset, odproduct)
+        return ('converted', updated_date, odproduct, valid, self.err_reasons, line)
+
+    def _import_converted_record(self, id, result):
+        """Finish importing a record converted by _convert_raw_record in a conversion process"""
+        if result[0] == 'no_en':
+            self.logger.warn('Unable to retrieve English record for %s' % id)
+            self.failure = 'Unable to retrieve English record'
+            return
+
+        # Skip records that have not been edited in Geogratis since they were last harvested, or were already
+        # imported during this run
+        updated_date = result[1]
+        if self._is_duplicate(id, updated_date) or self._is_current(id, updated_date):
+            return
+
+        if result[0] == 'no_fr':
+            self._report_missing_french(id, result[2])
+            self._catalog_record(id, updated_date, None, None, False, result[2])
+            return
+
+        odproduct, valid, self.err_reasons, line = result[2:]
+        self._report_od_dataset(odproduct, valid)
+        self._catalog_record(id, updated_date, None, odproduct, valid, line=line)
+        if valid:
+            self._write_od_dataset(id, updated_date, odproduct, line)
+
+    def _report_missing_french(self, id, title_en):
+        self.logger.warn('Unable to retrieve French record for %s' % id)
+        self.err_reasons = "Unable to retrieve French record"
+        self.failure = self.err_reasons
+        if self.report:
+            self.report.missing_french(id, title_en)
+
+    def _catalog_record(self, id, updated_date, geoproducts, odproduct, valid, title=None, line=None):
+        """Keep an imported record in the catalog, if there is one
+
+        geoproducts are the decoded English and French records, used when the records as they were retrieved are
+        not at hand. odproduct is the converted record, or None if the French record is unavailable, and 'line'
+        the record already serialized, if it has been.
+
+        """
+        if self.catalog is None:
+            return
+        products = self.raw_products
+        if products is None:
+            products = [product and json.dumps(product) for product in geoproducts]
+        if odproduct is not None:
+            if not line or self.display_formatted:
+                line = json.dumps(odproduct, encoding="utf-8")
+            title = odproduct['title']
+        self.catalog.put(id, updated_date, products[0], products[1], odproduct, line, valid, self.err_reasons,
+                         title)
+
+    def _serialize_od_dataset(self, odproduct):
+        if self.display_formatted:
+            return json.dumps(odproduct, indent=2 * ' ')
+        return json.dumps(odproduct, encoding="utf-8")
+
+    def _is_current(self, id, updated_date):
+        """True if the harvest index, or the records already written out by a watch, show the record has not been
+        edited since it was last written out"""
+        if self.resuming_page:
+            return False
+        if self.index is not None:
+            return self.index.is_current(id, updated_date)
+        if self.watched is not None:
+            return bool(updated_date) and self.watched.get(id) == updated_date
+        return False
+
+    def _write_od_dataset(self, id, updated_date, odproduct, line=None):
+        """Write out a converted record, unless the harvest index shows it is unchanged. 'line' is the record
+        already serialized, if it has been."""
+        if self.index is not None:
+            change = self.index.update(id, updated_date, odproduct)
+            if change:
+                self._write_delta(id, change, odproduct)
+            elif not self.resuming_page:
+                return
+
+        if not self.options.noprint:
+            line = line or self._timed('serialize', self._serialize_od_dataset, odproduct)
+            start = time.time()
+            if self.output:
+                self.output.write(line)
             else:
-                print  >> self.output_file, (json.dumps(odproduct, encoding="utf-8"))
-            self.output_file.flush()
+                print line
+            self.metrics.observe('output_write', time.time() - start)
+        self.metrics.count('records_written')
+
+        if self.ckan_sink:
+            self.ckan_sink.write(odproduct)
+            self._report_ckan_failures()
+
+        if self.watched is not None:
+            self.watched[id] = updated_date
+
+    def _report_ckan_failures(self):
+        """Log the records that CKAN rejected and add them to the report"""
+        for odproduct, reason in self.ckan_sink.failures():
+            self.logger.warn('Unable to load %s into CKAN: %s' % (odproduct['id'], reason))
+            if self.report:
+                self.report.ckan_failure(odproduct, reason)
+            if self.failures is not None:
+                self.failures.add(odproduct['id'], reason)
+                self.ckan_rejected.add(odproduct['id'])
+
+    def _close_ckan_sink(self):
+        """Finish loading records into CKAN"""
+        if not self.ckan_sink:
+            return
+        self.ckan_sink.close()
+        self._report_ckan_failures()
+        self.logger.info('%d datasets loaded into CKAN' % self.ckan_sink.loaded)
 
+    def _write_delta(self, id, change, odproduct=None):
+        """Write out a new, changed or removed record to the delta file"""
+        if not self.delta_file:
+            return
+        delta = {'id': id, 'change': change}
+        if odproduct:
+            delta['record'] = odproduct
+        print >> self.delta_file, (json.dumps(delta, encoding="utf-8"))
 
     def _convert_to_od_dataset(self, geoproduct_en, geoproduct_fr):
         """Convert the Geogratis JSON into CKAN Open Data JSON
@@ -309,7 +1640,16 @@ class GeogratisCommand(CkanCommand):
             * date_published
             * browse_graphic_url
 
+        The import is reported on, and the dataset is returned along with whether it is valid.
+
         """
+        odproduct, valid = self._timed('convert', self._build_od_dataset, geoproduct_en, geoproduct_fr)
+        self._report_od_dataset(odproduct, valid)
+        return odproduct, valid
+
+    def _build_od_dataset(self, geoproduct_en, geoproduct_fr):
+        """Generate the Open Data JSON dataset for _convert_to_od_dataset and return it with whether it is valid.
+        The reasons it is not valid are added to self.err_reasons."""
         odproduct = {}
         valid = True
 
@@ -352,8 +1692,11 @@ class GeogratisCommand(CkanCommand):
 
         # Keywords (Mandatory)
 
+        categories_en = self._index_categories(geoproduct_en)
+        categories_fr = self._index_categories(geoproduct_fr)
+
         xtra_en_keywords = []
-        gc_keywords = self._get_category(geoproduct_en, 'urn:gc:subject')
+        gc_keywords = categories_en.get('urn:gc:subject', [])
         for term in gc_keywords:
             xtra_en_keywords.append(self._clean_keyword(term['label']))
         odproduct['keywords'] = self._extract_keywords(geoproduct_en.get('keywords', []), xtra_en_keywords)
@@ -363,7 +1706,7 @@ class GeogratisCommand(CkanCommand):
             self.err_reasons = '%s Missing English Keywords;' % self.err_reasons
 
         xtra_fr_keywords = []
-        gc_keywords = self._get_category(geoproduct_fr, 'urn:gc:subject')
+        gc_keywords = categories_fr.get('urn:gc:subject', [])
         for term in gc_keywords:
             xtra_fr_keywords.append(self._clean_keyword(term['label']))
         odproduct['keywords_fra'] = self._extract_keywords(geoproduct_fr.get('keywords', []), xtra_fr_keywords)
@@ -374,8 +1717,8 @@ class GeogratisCommand(CkanCommand):
 
         # Geographic Region/Spatial fields
 
-        odproduct['geographic_region'] = self._get_places(geoproduct_en)
-        odproduct['spatial'] = str(geoproduct_en['geometry']).replace("'", '\"')
+        odproduct['geographic_region'] = self._get_places(geoproduct_en, categories_en)
+        odproduct['spatial'] = self.spatial_encoder.encode(geoproduct_en['geometry'])
 
         try:
             odproduct['date_published'] = geoproduct_en['citation']['publicationDate']
@@ -439,13 +1782,14 @@ class GeogratisCommand(CkanCommand):
         odproduct['time_period_coverage_end'] = ""
 
         # Link the dataset to the default page in Geogratis for the dataset, not the '.json' version. For the general
-        # endpoint, the general info page on Geogratis is sufficient
+        # endpoint, the general info page on Geogratis is sufficient. Records harvested from elsewhere with --base-url
+        # still link to Geogratis.
 
-        odproduct['url'] = geoproduct_en['url'][:-5]
-        odproduct['url_fra'] = geoproduct_fr['url'][:-5]
+        odproduct['url'] = self._geogratis_url(geoproduct_en['url'])[:-5]
+        odproduct['url_fra'] = self._geogratis_url(geoproduct_fr['url'])[:-5]
 
-        odproduct['endpoint_url'] = "http://geogratis.gc.ca/api/en"
-        odproduct['endpoint_url_fra'] = "http://geogratis.gc.ca/api/fr"
+        odproduct['endpoint_url'] = GEOGRATIS_API + "/en"
+        odproduct['endpoint_url_fra'] = GEOGRATIS_API + "/fr"
 
         # Geogratis datasets are pre-approved for publication and do not need to wait for the usual IMSO review by TBS
 
@@ -474,53 +1818,138 @@ class GeogratisCommand(CkanCommand):
             self.err_reasons = '%s No resources;' % self.err_reasons
 
         odproduct['resources'] = ckan_resources
+        return odproduct, valid
 
+    def _report_od_dataset(self, odproduct, valid):
         # Optional, make a report of the results of the import for this dataset. Useful when performing large imports.
-        if self.options.report_file:
-            self.report.writerow({'ID': odproduct['id'],
-                                  'Pass or Fail': valid,
-                                  'Title (EN)': odproduct['title'].encode('utf-8'),
-                                  'Title (FR)': odproduct['title_fra'].encode('utf-8'),
-                                  'Summary (EN)': 'Y' if odproduct['notes'] <> 'No title provided' else 'N',
-                                  'Summary (FR)': 'Y' if odproduct['notes_fra'] <> 'Pas de titre pr\u00e9vu' else 'N',
-                                  'Topic Categories': 'Y' if len(odproduct['topic_category']) > 0 else 'N',
-                                  'Keywords': 'Y' if len(odproduct['topic_category']) > 0 else 'N',
-                                  'Published Date': 'Y' if odproduct['date_published'] <> '' else 'N',
-                                  'Browse Images': 'Y' if odproduct['browse_graphic_url'] <>
-                                                          "/static/img/canada_default.png" else 'N',
-                                  'Series (EN)': 'Y' if odproduct['data_series_name'] <> '' else 'N',
-                                  'Series (FR)': 'Y' if odproduct['data_series_name_fra'] <> '' else 'N',
-                                  'Series Issue (EN)': 'Y' if odproduct['data_series_issue_identification'] <>
-                                                              '' else 'N',
-                                  'Series Issue (FR)': 'Y' if odproduct['data_series_issue_identification_fra'] <>
-                                                              '' else 'N',
-                                  'Reason for Failure': self.err_reasons})
+        if self.report:
+            self.report.record(odproduct, valid, self.err_reasons)
         if not valid:
-            odproduct = None
-        return odproduct
-
-    def _get_feed_json_obj(self, link):
-        """Retrieve the JSON feed from Geogratis and return it as a JSON object"""
-        try:
-            response = urllib2.urlopen(link, None, 10)
-            json_data = response.read()
-            json_obj = json.loads(json_data)
-            json_obj['url'] = link
+            self.failure = self.err_reasons or 'Invalid record'
+
+    def _get_feed_json_obj(self, link, cancel=None):
+        """Retrieve the JSON feed from Geogratis and return it as a JSON object. Nothing is retrieved if the
+        optional 'cancel' event is set before the request is sent."""
+        if self.options.stream:
+            json_obj = self._request(link, cancel, lambda response: JsonStream(response).load())
+            if json_obj is not None:
+                json_obj['url'] = link
             return json_obj
-        except urllib2.HTTPError, e:
-            self.logger.error(e.msg)
-        return None
+        json_data = self._get_feed_data(link, cancel)
+        if json_data is None:
+            return None
+        return self._decode_feed_json(link, json_data)
+
+    def _stream_feed_page(self, link):
+        """Retrieve the feed page at link for FeedPrefetcher, as a stream of its products followed by the page"""
+        if self.options.stream:
+            return self._iter_feed_page(link)
+        page = self._get_feed_json_obj(link)
+        return iter_page(page) if page else iter(())
+
+    def _iter_feed_page(self, link):
+        """Yield ('product', product) for each product on the feed page as soon as it has been read, and then
+        ('page', page) for the rest of the page without its products"""
+        stream = self._request(link, None, JsonStream)
+        if stream is None:
+            return
+        page = {'url': link, 'products': []}
+        for key, value in stream.members(streamed=('products',)):
+            if key == 'products':
+                yield 'product', value
+            else:
+                page[key] = value
+        yield 'page', page
+
+    def _get_feed_data(self, link, cancel=None):
+        """Retrieve the undecoded JSON feed from Geogratis"""
+        data = self._request(link, cancel, lambda response: response.read())
+        if data:
+            self.metrics.count('bytes_fetched', len(data))
+        return data
+
+    def _request(self, link, cancel, read):
+        """Request link from Geogratis and return read(response)
+
+        Requests that fail for a reason that may be temporary are retried with exponential backoff, and the
+        rate limit is lowered when Geogratis is overloaded. A response that read returns without consuming it
+        in full is not retried if it fails later. None is returned for an HTTP error that persists, and a
+        URLError is raised for any other failure that persists.
+
+        """
+        stage = 'fetch_record' if link.endswith('.json') else 'fetch_page'
+        for attempt in range(self.retries + 1):
+            self.rate_limiter.wait()
+            if cancel is not None and cancel.is_set():
+                return None
+            start = time.time()
+            retry_after = None
+            try:
+                response = self.transport.open(link)
+                result = read(response)
+                elapsed = time.time() - start
+                self.rate_limiter.succeeded(elapsed)
+                self.metrics.observe(stage, elapsed)
+                self.metrics.count_status(response.status)
+                return result
+            except urllib2.HTTPError, e:
+                self.metrics.count_status(e.code)
+                if e.code not in (429, 500, 502, 503, 504) or attempt == self.retries:
+                    self.logger.error('%s %s' % (e.msg, link))
+                    return None
+                if e.code in (429, 503):
+                    self.rate_limiter.overloaded()
+                if e.hdrs:
+                    retry_after = e.hdrs.get('retry-after')
+            except urllib2.URLError, e:
+                self.metrics.count('network_errors')
+                if attempt == self.retries:
+                    raise
+                if isinstance(e.reason, socket.timeout):
+                    self.rate_limiter.overloaded()
+            except socket.error, e:
+                # Errors while reading the response are not wrapped in a URLError
+                self.metrics.count('network_errors')
+                if attempt == self.retries:
+                    raise urllib2.URLError(e)
+                if isinstance(e, socket.timeout):
+                    self.rate_limiter.overloaded()
+
+            self.metrics.count('retries')
+            delay = retry_delay(attempt, retry_after)
+            if retry_after:
+                self.rate_limiter.pause(delay)
+            self.logger.warn('Retrying %s in %.1f seconds' % (link, delay))
+            time.sleep(delay)
+
+    def _decode_feed_json(self, link, json_data):
+        json_obj = self._timed('decode', json.loads, json_data)
+        json_obj['url'] = link
+        return json_obj
+
+    def _geogratis_url(self, url):
+        """The URL on Geogratis itself for a URL retrieved from under the base URL"""
+        if url.startswith(self.base_url + '/'):
+            return GEOGRATIS_API + url[len(self.base_url):]
+        return url
 
-    def _get_geogratis_item(self, geo_id, lang):
+    def _get_item_url(self, geo_id, lang):
+        return '%s/%s/nrcan-rncan/ess-sst/%s.json' % (self.base_url, lang, geo_id)
+
+    def _get_geogratis_item(self, geo_id, lang, cancel=None):
         """Retrieve one dataset from Geogratis and return it as a JSON object"""
-        json_obj = self._get_feed_json_obj('http://geogratis.gc.ca/api/%s/nrcan-rncan/ess-sst/%s.json' % (lang, geo_id))
+        json_obj = self._get_feed_json_obj(self._get_item_url(geo_id, lang), cancel)
         return json_obj
 
+    def _get_geogratis_item_data(self, geo_id, lang, cancel=None):
+        """Retrieve one undecoded dataset from Geogratis"""
+        return self._get_feed_data(self._get_item_url(geo_id, lang), cancel)
+
     def _get_next_link(self, json_obj, rel = 'next'):
-        """Look up the 'rel' link from the feed - this is URL for the next page of the feed"""
+        """Look up the 'rel' link from the feed - by default the URL for the next page of the feed"""
         links = json_obj['links']
         for link in links:
-            if link['rel'] == 'next':
+            if link['rel'] == rel:
                 return link['href']
 
     def _extract_keywords(self, keywords, base_keywords):
@@ -539,11 +1968,16 @@ class GeogratisCommand(CkanCommand):
         return ','.join(base_keywords)
 
     def _clean_keyword(self, keyword):
-        """Clean up formatting on the keywords"""
-        keyword = keyword.strip().replace("/", " - ")
-        keyword = keyword.replace("(", "- ").replace(")", "") # change "one (two)" to "one - two"
-        keyword = keyword.replace("[", "- ").replace("]", "") # change "one [two]" to "one - two"
-        return keyword
+        """Clean up formatting on the keywords. The same keywords recur across many records, so results are kept."""
+        try:
+            return self.keyword_cache[keyword]
+        except KeyError:
+            pass
+        cleaned = keyword.strip().replace("/", " - ")
+        cleaned = cleaned.replace("(", "- ").replace(")", "") # change "one (two)" to "one - two"
+        cleaned = cleaned.replace("[", "- ").replace("]", "") # change "one [two]" to "one - two"
+        self.keyword_cache[keyword] = cleaned
+        return cleaned
 
     def _get_product_type(self, geoproduct):
         """Look up the product type which is mapped against the dataset's assigned category"""
@@ -553,29 +1987,36 @@ class GeogratisCommand(CkanCommand):
             product_type = terms[0]['term']
         return product_type
 
-    def _get_places(self, geoproduct):
+    def _get_places(self, geoproduct, categories=None):
         """
 
         Return the first match for a geographic region. Note that for the region 'Canada' the value is
-        and empty string since this assumed to be the default
+        and empty string since this assumed to be the default. 'categories' may be given if the dataset's
+        categories have already been indexed.
 
         """
         places = ""
-        terms = self._get_category(geoproduct, 'urn:iso:place')
+        if categories is None:
+            categories = self._index_categories(geoproduct)
+        terms = categories.get('urn:iso:place', [])
         for term in terms:
-            if term["label"] in self.geographic_regions.keys() and term["label"] <> "Canada":
+            if term["label"] in self.geographic_regions and term["label"] <> "Canada":
                 places = self.geographic_regions[term["label"]]
                 break
         return places
 
     def _get_category(self, geoproduct, cat_type):
         """Retrieve the category from the dataset"""
-        category = []
+        return self._index_categories(geoproduct).get(cat_type, [])
+
+    def _index_categories(self, geoproduct):
+        """Index the terms of all the dataset's categories by category type in a single pass. As with
+        _get_category, only the first category of each type is used."""
+        categories = {}
         for cat in geoproduct['categories']:
-            if cat['type'] == cat_type:
-                category = cat['terms']
-                break
-        return category
+            if cat['type'] not in categories:
+                categories[cat['type']] = cat['terms']
+        return categories
 
 
     def _get_gc_subject_category(self, geoproduct_en):
@@ -590,41 +2031,41 @@ class GeogratisCommand(CkanCommand):
         topics = []
         subjects = []
 
-        schema_categories = schema_description.dataset_field_by_id['topic_category']['choices']
         topic_categories = geoproduct_en.get('topicCategories', [])
 
         # Subjects are mapped to the topics in the schema, so both are looked up from the topic keys
         for topic in topic_categories:
-            # Test for a non-standard exceptions specific to Geogratis
-            if topic == u'society; soci\u00e9t\u00e9':
-                topic = "society"
-            elif topic == "farming; agriculture":
-                topic = "farming"
-
-            topic_key = re.sub("([a-z])([A-Z])", "\g<1> \g<2>", topic).title()
-
-            # Test for a non-standard exceptions specific to Geogratis
-            if topic_key == "Climatology Meteorology Atmosphere":
-                topic_key = "Climatology / Meteorology / Atmosphere"
-            if self.topic_choices.has_key(topic_key):
-                topics.append(self.topic_choices[topic_key]['key'])
-                topic_subject_keys = self.topic_choices[topic_key]['subject_ids']
-                for topic_subject_key in topic_subject_keys:
-                    subjects.append(
-                        schema_description.dataset_field_by_id['subject']['choices_by_id'][topic_subject_key]['key'])
+            topic_subjects = self._lookup_topic(topic)
+            if topic_subjects:
+                topics.append(topic_subjects[0])
+                subjects.extend(topic_subjects[1])
 
         return {'topics': topics, 'subjects': subjects}
 
-    def _encapsulate_geojson(self, geodict):
-        """CKAN works with a dictionary of GeoJSON strings values. Ensure all values are formatted as required."""
-        new_geodict = {}
-        for key in geodict.keys():
-            new_key = '"%s"' % (key,)
-            if isinstance(geodict[key], basestring):
-                new_geodict[new_key] = '"%s"' % (geodict[key],)
-            else:
-                new_geodict[new_key] = geodict[key]
-        return new_geodict
+    def _lookup_topic(self, topic):
+        """Return the Open Data topic key and subject keys for a Geogratis topic category, or None if there is no match.
+        The result for each topic is kept, so the topic string only has to be normalized the first time it is seen."""
+        try:
+            return self.topic_cache[topic]
+        except KeyError:
+            pass
+
+        # Test for a non-standard exceptions specific to Geogratis
+        topic_name = topic
+        if topic_name == u'society; soci\u00e9t\u00e9':
+            topic_name = "society"
+        elif topic_name == "farming; agriculture":
+            topic_name = "farming"
+
+        topic_key = CAMEL_CASE.sub("\g<1> \g<2>", topic_name).title()
+
+        # Test for a non-standard exceptions specific to Geogratis
+        if topic_key == "Climatology Meteorology Atmosphere":
+            topic_key = "Climatology / Meteorology / Atmosphere"
+
+        topic_subjects = self.topic_subjects.get(topic_key)
+        self.topic_cache[topic] = topic_subjects
+        return topic_subjects
 
     def _to_byte_string(self, filesize):
         """Take a Geogratis file size string (e.g. 1.25 MB) and convert into a number of bytes in base 10"""
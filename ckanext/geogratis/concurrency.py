@@ -0,0 +1,181 @@
+import Queue
+import email.utils
+import random
+import sys
+import threading
+import time
+
+
+class RateLimiter(object):
+    """Cap the number of requests per second sent to Geogratis across all threads
+
+    Each caller reserves the next free time slot and sleeps until it arrives, or is told when it arrives by
+    reserve(), so requests are spread evenly instead of in bursts. A rate of 0 disables the limit, although
+    requests still wait out a pause.
+
+    """
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0
+        self.next_slot = time.time()
+        self.lock = threading.Lock()
+
+    def pause(self, seconds):
+        """Hold back every request for the given number of seconds"""
+        with self.lock:
+            self.next_slot = max(self.next_slot, time.time() + seconds)
+
+    def reserve(self):
+        """Reserve the next free time slot without waiting for it, and return the time at which it arrives"""
+        with self.lock:
+            slot = max(time.time(), self.next_slot)
+            self.next_slot = slot + self.interval
+        return slot
+
+    def wait(self):
+        delay = self.reserve() - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class AdaptiveRateLimiter(RateLimiter):
+    """A RateLimiter that adjusts its rate to what Geogratis can sustain
+
+    The rate rises additively, by about 'increase' requests per second for every second of requests
+    that succeed in less than healthy_latency seconds, up to max_rate, or without a ceiling if max_rate is 0.
+    It is halved whenever Geogratis shows it is overloaded, down to min_rate. A burst of failures from concurrent requests counts as a
+    single decrease. Without a rate limit only pauses are applied.
+
+    """
+    healthy_latency = 2.0
+
+    def __init__(self, rate, max_rate=0, min_rate=0.5, increase=1.0):
+        RateLimiter.__init__(self, rate)
+        self.rate = rate
+        self.max_rate = max(max_rate, rate) if max_rate > 0 else 0
+        self.min_rate = min(min_rate, rate)
+        self.increase = increase
+        self.last_decrease = 0
+
+    def _set_rate(self, rate):
+        self.rate = rate
+        self.interval = 1.0 / rate
+
+    def succeeded(self, latency):
+        """Report a request that succeeded after 'latency' seconds"""
+        if not self.interval or latency > self.healthy_latency:
+            return
+        with self.lock:
+            if not self.max_rate:
+                self._set_rate(self.rate + self.increase / self.rate)
+            elif self.rate < self.max_rate:
+                self._set_rate(min(self.max_rate, self.rate + self.increase / self.rate))
+
+    def overloaded(self):
+        """Report a request that was refused or timed out because Geogratis is overloaded"""
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.time()
+            if now - self.last_decrease < 1.0:
+                return
+            self.last_decrease = now
+            self._set_rate(max(self.min_rate, self.rate / 2))
+
+
+def retry_delay(attempt, retry_after=None, base=1.0, cap=60.0):
+    """Seconds to wait before retry number 'attempt' (counting from 0), with exponential backoff and jitter
+
+    A Retry-After header value, either a number of seconds or an HTTP date, sets the minimum delay.
+
+    """
+    delay = min(cap, base * 2 ** attempt) * random.uniform(0.5, 1.5)
+    if retry_after:
+        try:
+            delay = max(delay, float(retry_after))
+        except ValueError:
+            when = email.utils.parsedate_tz(retry_after)
+            if when:
+                delay = max(delay, email.utils.mktime_tz(when) - time.time())
+    return delay
+
+
+class Task(object):
+    """The pending result of a call running on another thread"""
+    def __init__(self, func, args):
+        self.func = func
+        self.args = args
+        self.done = threading.Event()
+        self.value = None
+        self.exc_info = None
+
+    def run(self):
+        try:
+            self.value = self.func(*self.args)
+        except:
+            self.exc_info = sys.exc_info()
+        self.done.set()
+
+    def result(self):
+        """Wait for the call to finish and return its value, re-raising any exception it raised"""
+        self.done.wait()
+        if self.exc_info:
+            raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+        return self.value
+
+
+class WorkerPool(object):
+    """A fixed number of daemon threads running submitted calls in the order they were queued"""
+    def __init__(self, workers):
+        self.tasks = Queue.Queue()
+        self.threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._work)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def _work(self):
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                break
+            task.run()
+
+    def submit(self, func, *args):
+        task = Task(func, args)
+        self.tasks.put(task)
+        return task
+
+    def close(self):
+        for thread in self.threads:
+            self.tasks.put(None)
+
+
+def spawn(func, *args):
+    """Start func on its own daemon thread and return the Task for its result"""
+    task = Task(func, args)
+    thread = threading.Thread(target=task.run)
+    thread.daemon = True
+    thread.start()
+    return task
+
+
+def ordered_map(pool, func, items, window):
+    """Apply func to every item on the pool and yield (item, result) pairs in the original order
+
+    At most 'window' calls are queued ahead of the one being yielded, which bounds memory use
+    and keeps the pool from racing too far ahead of the consumer.
+
+    """
+    pending = []
+    items = iter(items)
+    for item in items:
+        pending.append((item, pool.submit(func, item)))
+        if len(pending) >= window:
+            break
+    while pending:
+        item, task = pending.pop(0)
+        for next_item in items:
+            pending.append((next_item, pool.submit(func, next_item)))
+            break
+        yield item, task.result()
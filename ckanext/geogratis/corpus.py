@@ -0,0 +1,100 @@
+import math
+import random
+import simplejson as json
+
+from ckanext.geogratis.archive import ResponseArchive
+from ckanext.geogratis.catalog import CatalogStore
+
+# The first page of the feed, relative to the base URL. Later pages add &page=N.
+FEED_KEY = 'en/nrcan-rncan/ess-sst?alt=json'
+
+# Values that the synthetic records are drawn from, as they appear in Geogratis records
+TOPICS = ['farming', 'biota', 'boundaries', 'climatologyMeteorologyAtmosphere', 'economy', 'elevation',
+          'environment', 'geoscientificInformation', 'health', 'imageryBaseMapsEarthCover', 'inlandWaters',
+          'location', 'oceans', 'planningCadastre', 'society', 'structure', 'transportation',
+          'utilitiesCommunication']
+PLACES = ['Alberta', 'British Columbia', 'Manitoba', 'New Brunswick', 'Newfoundland and Labrador',
+          'Northwest Territories', 'Nova Scotia', 'Nunavut', 'Ontario', 'Prince Edward Island', 'Quebec',
+          'Saskatchewan', 'Yukon']
+PRESENTATION_FORMS = ['mapDigital', 'documentDigital', 'imageDigital', 'modelDigital', 'tableDigital']
+FILE_TYPES = ['ZIP', 'PDF', 'TIFF', 'GeoTIFF', 'Shape', 'KML', 'CSV', 'GML']
+WORDS = ['soil', 'water', 'forest', 'elevation', 'geology', 'permafrost', 'coastline', 'wetland', 'glacier',
+         'road', 'boundary', 'mineral', 'climate', 'vegetation', 'river', 'lake', 'survey', 'imagery']
+
+
+def product_id(number):
+    """The Geogratis ID, in the form of a UUID, of synthetic product 'number'"""
+    return '%08x-0000-4000-8000-%012x' % (number, number)
+
+
+def synthetic_product(geo_id, lang, vertices=50):
+    """A synthetic Geogratis record for a product in 'lang', with every field that is converted
+
+    The record is drawn from a generator seeded with the ID, so that the English and French records of a product
+    describe the same product with the same files.
+
+    """
+    rng = random.Random(geo_id)
+    x, y, radius = rng.uniform(-140, -55), rng.uniform(42, 80), rng.uniform(0.1, 3)
+    ring = [[x + radius * math.cos(2 * math.pi * i / vertices) * rng.uniform(0.8, 1.2),
+             y + radius * math.sin(2 * math.pi * i / vertices) * rng.uniform(0.8, 1.2)] for i in range(vertices)]
+    ring.append(ring[0])
+    if lang == 'fr':
+        title = u'Donn\xe9es g\xe9ospatiales %s' % geo_id
+    else:
+        title = u'Geospatial data %s' % geo_id
+    return {'id': geo_id,
+            'title': title,
+            'summary': ' '.join(rng.choice(WORDS) for i in range(rng.randint(20, 80))),
+            'topicCategories': rng.sample(TOPICS, rng.randint(1, 3)),
+            'keywords': ['%s > %s' % (rng.choice(WORDS), rng.choice(WORDS)) for i in range(rng.randint(2, 8))],
+            'categories': [{'type': 'urn:iso:place', 'terms': [{'label': rng.choice(PLACES)}]},
+                           {'type': 'urn:gc:subject', 'terms': [{'label': word} for word in rng.sample(WORDS, 3)]}],
+            'geometry': {'type': 'Polygon', 'coordinates': [ring]},
+            'citation': {'publicationDate': '%d-%02d-%02d' % (rng.randint(1990, 2014), rng.randint(1, 12),
+                                                             rng.randint(1, 28)),
+                         'presentationForm': '%s;' % rng.choice(PRESENTATION_FORMS),
+                         'series': 'Series %d' % rng.randint(1, 50),
+                         'seriesIssue': 'Issue %d' % rng.randint(1, 12)},
+            'browseImages': [{'link': 'http://geogratis.gc.ca/browse/%s.png' % geo_id}],
+            'files': [{'description': '%s %d' % (rng.choice(WORDS), i),
+                       'link': 'http://ftp.geogratis.gc.ca/%s/%d.zip' % (geo_id, i),
+                       'size': '%.1f MB' % rng.uniform(0.1, 900),
+                       'type': rng.choice(FILE_TYPES)} for i in range(rng.randint(1, 5))],
+            'updatedDate': '2014-%02d-%02dT12:00:00Z' % (rng.randint(1, 12), rng.randint(1, 28))}
+
+
+def write_feed_archive(path, base_url, count, per_page=100):
+    """Write a ResponseArchive, as if recorded from base_url, of a feed listing 'count' synthetic products,
+    per_page to a page, along with their English and French records"""
+    archive = ResponseArchive(path, base_url, writable=True)
+    try:
+        pages = max((count + per_page - 1) // per_page, 1)
+        for page in range(pages):
+            products = []
+            for number in range(page * per_page, min((page + 1) * per_page, count)):
+                geo_id = product_id(number)
+                for lang in ('fr', 'en'):
+                    record = synthetic_product(geo_id, lang)
+                    archive.put('%s/nrcan-rncan/ess-sst/%s.json' % (lang, geo_id), json.dumps(record))
+                products.append({'id': geo_id, 'title': record['title'], 'updatedDate': record['updatedDate']})
+            links = []
+            if page + 1 < pages:
+                links.append({'rel': 'next', 'href': '%s/%s&page=%d' % (base_url.rstrip('/'), FEED_KEY, page + 2)})
+            key = FEED_KEY if page == 0 else '%s&page=%d' % (FEED_KEY, page + 1)
+            archive.put(key, json.dumps({'count': len(products), 'products': products, 'links': links}))
+    finally:
+        archive.close()
+
+
+def write_catalog(path, count):
+    """Store 'count' synthetic products in a CatalogStore, as retrieved from Geogratis but not yet converted"""
+    catalog = CatalogStore(path)
+    try:
+        for number in range(count):
+            geo_id = product_id(number)
+            product_en = synthetic_product(geo_id, 'en')
+            catalog.put(geo_id, product_en['updatedDate'], json.dumps(product_en),
+                        json.dumps(synthetic_product(geo_id, 'fr')), None, None, False, None, product_en['title'])
+    finally:
+        catalog.close()
@@ -0,0 +1,82 @@
+import hashlib
+import math
+import os
+import shutil
+import sqlite3
+import struct
+import tempfile
+import threading
+
+# The share of IDs never seen that the Bloom filters wrongly report as possibly seen. Each of those costs one look-up
+# on disk.
+FALSE_POSITIVE_RATE = 0.01
+
+# The number of IDs the first Bloom filter is sized for. Each further filter is sized for twice as many as the last.
+INITIAL_CAPACITY = 100000
+
+
+class BloomFilter(object):
+    """Fixed-size Bloom filter of strings, sized for 'capacity' strings at the given false positive rate"""
+    def __init__(self, capacity, error_rate=FALSE_POSITIVE_RATE):
+        self.capacity = capacity
+        self.bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, int(round(self.bits / float(capacity) * math.log(2))))
+        self.array = bytearray((self.bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        # Every position is derived from the two halves of one digest (double hashing)
+        first, second = struct.unpack('<QQ', hashlib.md5(key).digest())
+        return [(first + i * second) % self.bits for i in xrange(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.array[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.array[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class SeenRecords(object):
+    """The Geogratis IDs seen during a run, with the updatedDate each was last seen with
+
+    IDs are first tested against Bloom filters held in memory, and only those that the filters report as possibly
+    seen are looked up in the exact record of IDs and dates, which is kept on disk in a temporary SQLite database
+    removed on close. A new filter, twice the size of the last, is started whenever the last is full, so that the
+    false positive rate stays low however many IDs there are, while the filters take no more than about 2.4 bytes
+    of memory per ID.
+
+    """
+    def __init__(self, directory=None):
+        self.directory = tempfile.mkdtemp(prefix='geogratis-seen-', dir=directory)
+        # The database only lasts for the run, so its changes are never committed or made durable
+        self.db = sqlite3.connect(os.path.join(self.directory, 'seen.db'), check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode = OFF')
+        self.db.execute('PRAGMA synchronous = OFF')
+        self.db.execute('CREATE TABLE seen (id TEXT PRIMARY KEY, updated_date TEXT NOT NULL)')
+        self.filters = [BloomFilter(INITIAL_CAPACITY)]
+        self.lock = threading.Lock()
+
+    def get(self, geo_id):
+        """Return the updatedDate the record was last seen with ('' if it had none), or None if it was not seen"""
+        key = geo_id.encode('utf-8')
+        with self.lock:
+            if not any(key in bloom for bloom in self.filters):
+                return None
+            row = self.db.execute('SELECT updated_date FROM seen WHERE id = ?', (geo_id,)).fetchone()
+        return row[0] if row else None
+
+    def add(self, geo_id, updated_date):
+        """Record that the record was seen with the given updatedDate"""
+        key = geo_id.encode('utf-8')
+        with self.lock:
+            if not any(key in bloom for bloom in self.filters):
+                if self.filters[-1].count >= self.filters[-1].capacity:
+                    self.filters.append(BloomFilter(2 * self.filters[-1].capacity))
+                self.filters[-1].add(key)
+            self.db.execute('INSERT OR REPLACE INTO seen VALUES (?, ?)', (geo_id, updated_date or ''))
+
+    def close(self):
+        self.db.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
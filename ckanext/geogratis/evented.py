@@ -0,0 +1,404 @@
+import asyncore
+import collections
+import heapq
+import itertools
+import socket
+import sys
+import time
+import urllib2
+import urlparse
+import zlib
+
+from ckanext.geogratis.concurrency import retry_delay
+
+
+class HttpRequest(asyncore.dispatcher, object):
+    """One HTTP/1.0 GET request made on an EventLoop
+
+    When the response is complete, or the request fails, the callback is called with the decoded body
+    and None, or with None and the urllib2.URLError or urllib2.HTTPError describing the failure.
+
+    Deriving from object as well makes this a new-style class, so that requests hash and compare by
+    identity rather than through the socket that asyncore.dispatcher forwards attribute lookups to.
+
+    """
+    max_redirects = 5
+
+    def __init__(self, loop, url, callback, redirects=0):
+        asyncore.dispatcher.__init__(self, map=loop.map)
+        self.loop = loop
+        self.url = url
+        self.callback = callback
+        self.redirects = redirects
+        self.outgoing = ''
+        self.incoming = []
+        self.deadline = None
+        self.finished = False
+
+    def start(self):
+        if self.finished:
+            # Cancelled while waiting for its time slot
+            return
+        parts = urlparse.urlsplit(self.url)
+        if parts.scheme != 'http':
+            self.fail(urllib2.URLError('Only http URLs can be requested on the event loop: %s' % self.url))
+            return
+        path = parts.path or '/'
+        if parts.query:
+            path = '%s?%s' % (path, parts.query)
+        self.outgoing = ('GET %s HTTP/1.0\r\nHost: %s\r\nAccept-Encoding: gzip, deflate\r\n'
+                         'User-Agent: ckanext-geogratis\r\n\r\n' % (path, parts.netloc))
+        self.deadline = time.time() + self.loop.timeout
+        try:
+            self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.connect((parts.hostname, parts.port or 80))
+        except socket.error, e:
+            self.fail(urllib2.URLError(e))
+
+    def writable(self):
+        return not self.connected or bool(self.outgoing)
+
+    def handle_connect(self):
+        pass
+
+    def handle_write(self):
+        sent = self.send(self.outgoing)
+        self.outgoing = self.outgoing[sent:]
+
+    def handle_read(self):
+        data = self.recv(65536)
+        if data:
+            self.incoming.append(data)
+
+    def handle_close(self):
+        self.close()
+        self._complete()
+
+    def handle_error(self):
+        self.fail(urllib2.URLError(sys.exc_info()[1]))
+
+    def fail(self, error):
+        self.close()
+        self._finish(None, error)
+
+    def _finish(self, body, error):
+        if not self.finished:
+            self.finished = True
+            self.loop._finished(self, body, error)
+
+    def _complete(self):
+        head, separator, body = ''.join(self.incoming).partition('\r\n\r\n')
+        if not separator:
+            self._finish(None, urllib2.URLError('Incomplete response from %s' % self.url))
+            return
+        lines = head.split('\r\n')
+        status_line = lines[0].split(' ', 2)
+        status = int(status_line[1])
+        reason = status_line[2] if len(status_line) > 2 else ''
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        location = headers.get('location')
+        if status in (301, 302, 303, 307) and location:
+            if self.redirects >= self.max_redirects:
+                self._finish(None, urllib2.URLError('Too many redirects for %s' % self.url))
+                return
+            self.finished = True
+            self.loop._redirect(self, urlparse.urljoin(self.url, location))
+            return
+        if not 200 <= status < 300:
+            self._finish(None, urllib2.HTTPError(self.url, status, reason, headers, None))
+            return
+
+        try:
+            if headers.get('transfer-encoding', '').lower() == 'chunked':
+                body = _dechunk(body)
+            encoding = headers.get('content-encoding', '').lower()
+            if encoding == 'gzip':
+                body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+            elif encoding == 'deflate':
+                try:
+                    body = zlib.decompress(body)
+                except zlib.error:
+                    body = zlib.decompress(body, -zlib.MAX_WBITS)
+        except (ValueError, zlib.error), e:
+            self._finish(None, urllib2.URLError(e))
+            return
+        self._finish(body, None)
+
+
+def _dechunk(body):
+    """Decode a body sent with chunked transfer encoding"""
+    chunks = []
+    while True:
+        size_line, _, body = body.partition('\r\n')
+        size = int(size_line.split(';')[0], 16)
+        if size == 0:
+            return ''.join(chunks)
+        chunks.append(body[:size])
+        body = body[size + 2:]
+
+
+class EventLoop(object):
+    """Run many GET requests at once on a single thread
+
+    At most 'concurrency' requests are in flight; the rest wait their turn in the order they were made.
+    With a rate limiter, a request whose turn has come is given the next free time slot and is started by
+    run_once when the slot arrives, so that the loop goes on handling the requests in flight meanwhile.
+    Requests that take longer than 'timeout' seconds fail with a URLError. call_later schedules a call on
+    the loop.
+
+    """
+    def __init__(self, concurrency, timeout, rate_limiter=None):
+        self.map = {}
+        self.concurrency = max(concurrency, 1)
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter
+        self.waiting = collections.deque()
+        self.active = set()
+        self.timers = []
+        self.sequence = itertools.count()
+
+    def get(self, url, callback):
+        """Queue a request and return it, so that it can be cancelled"""
+        request = HttpRequest(self, url, callback)
+        self.waiting.append(request)
+        self._start_waiting()
+        return request
+
+    def cancel(self, request):
+        """Drop a request: it is not sent if it is still waiting, and closed if it is in flight"""
+        request.callback = None
+        if request in self.waiting:
+            self.waiting.remove(request)
+        elif request in self.active:
+            self.active.discard(request)
+            request.finished = True
+            if request.socket is not None:
+                request.close()
+
+    def call_later(self, delay, function):
+        """Have run_once call function once 'delay' seconds have passed"""
+        self._call_at(time.time() + delay, function)
+
+    def _call_at(self, when, function):
+        heapq.heappush(self.timers, (when, next(self.sequence), function))
+
+    def _start_waiting(self):
+        while self.waiting and len(self.active) < self.concurrency:
+            request = self.waiting.popleft()
+            self.active.add(request)
+            start = self.rate_limiter.reserve() if self.rate_limiter else 0
+            if start > time.time():
+                self._call_at(start, request.start)
+            else:
+                request.start()
+
+    def _redirect(self, request, url):
+        self.active.discard(request)
+        redirected = HttpRequest(self, url, request.callback, request.redirects + 1)
+        self.waiting.appendleft(redirected)
+        self._start_waiting()
+
+    def _finished(self, request, body, error):
+        self.active.discard(request)
+        if request.callback:
+            request.callback(body, error)
+        self._start_waiting()
+
+    def run_once(self, timeout=0.05):
+        """Make the calls that are due, and handle whatever network events are ready, waiting up to 'timeout'
+        seconds for one, or until the next call is due"""
+        while self.timers and self.timers[0][0] <= time.time():
+            heapq.heappop(self.timers)[2]()
+        if self.timers:
+            timeout = min(timeout, max(self.timers[0][0] - time.time(), 0))
+        if self.map:
+            asyncore.loop(timeout, map=self.map, count=1)
+        elif self.timers:
+            # Nothing is in flight, so there is nothing to handle before the next call is due
+            time.sleep(timeout)
+        now = time.time()
+        for request in list(self.active):
+            if request.deadline and request.deadline < now:
+                request.fail(urllib2.URLError(socket.timeout('timed out')))
+
+    def close(self):
+        for request in list(self.active):
+            self.cancel(request)
+        self.waiting.clear()
+        del self.timers[:]
+
+
+class _Slot(object):
+    """A product, or the end of a feed page, waiting for its turn to be imported"""
+    PENDING = object()
+
+    def __init__(self, geo_id=None, page=None):
+        self.id = geo_id
+        self.page = page
+        self.en = self.PENDING
+        self.fr = self.PENDING
+        self.fr_request = None
+        self.error = None
+
+    def done(self):
+        if self.error or self.page is not None:
+            return True
+        return self.en is not self.PENDING and (self.en is None or self.fr is not self.PENDING)
+
+
+class EventedHarvest(object):
+    """Harvest the Geogratis feed for a GeogratisCommand on a single-threaded EventLoop
+
+    Feed pages and the English and French records of every product are all requested on the loop, with at
+    most 'concurrency' requests in flight. Records are imported through the command in feed order as soon as
+    they and every record before them are complete, so the output is the same as the threaded harvest's. A
+    French request is cancelled as soon as its English record turns out to be unavailable. Requests that fail
+    for a reason that may be temporary are made again on the loop after the same backoff as the command's own
+    requests. A record that still cannot be retrieved is passed to the command as its URLError, to be queued
+    for retrying like in the threaded harvest, if the command keeps a failure queue. A feed page that cannot be
+    retrieved stops the harvest with a URLError once the records before it have been imported.
+
+    """
+    def __init__(self, command, first_page, concurrency, timeout, max_pages=0, skip_ids=()):
+        self.command = command
+        self.loop = EventLoop(concurrency, timeout, command.rate_limiter)
+        self.window = 4 * self.loop.concurrency
+        self.max_pages = max_pages
+        self.page_cnt = 1
+        self.slots = collections.deque()
+        self.next_link = None
+        self.page_pending = False
+        self.exhausted = False
+        self._add_page(first_page, skip_ids)
+
+    def _add_page(self, page, skip_ids=()):
+        for product in page['products']: # Array of datasets in the JSON response from Geogratis
+            if (product['id'] not in skip_ids and self.command._in_shard(product['id']) and
+                    not self.command._is_repeated(product)):
+                self._add_record(product['id'])
+        self.slots.append(_Slot(page=page))
+        next_link = self.command._get_next_link(page)
+        if not next_link:
+            self.exhausted = True
+        elif self.page_cnt != self.max_pages:
+            self.next_link = next_link
+
+    def _add_record(self, geo_id):
+        slot = _Slot(geo_id)
+        self.slots.append(slot)
+        self._get_record(slot, 'fr')
+        self._get_record(slot, 'en')
+
+    def _get_record(self, slot, lang, attempt=0):
+        if lang == 'fr' and slot.en is None:
+            # The English record turned out to be unavailable while the French one was waiting to be retried
+            return
+        request = self.loop.get(self.command._get_item_url(slot.id, lang),
+                                lambda body, error: self._record_received(slot, lang, attempt, body, error))
+        if lang == 'fr':
+            slot.fr_request = request
+
+    def _get_page(self, link, attempt=0):
+        self.page_pending = True
+        self.loop.get(link, lambda body, error: self._page_received(link, attempt, body, error))
+
+    def _retry(self, url, error, attempt, request_again):
+        """Call request_again on the loop after a backoff delay if the request failed for a reason that may be
+        temporary and has not been retried too often yet, the way GeogratisCommand._request does, and return True
+        if it will be"""
+        command = self.command
+        retry_after = None
+        if isinstance(error, urllib2.HTTPError):
+            command.metrics.count_status(error.code)
+            if error.code not in (429, 500, 502, 503, 504) or attempt >= command.retries:
+                return False
+            if error.code in (429, 503):
+                command.rate_limiter.overloaded()
+            if error.hdrs:
+                retry_after = error.hdrs.get('retry-after')
+        else:
+            command.metrics.count('network_errors')
+            if attempt >= command.retries:
+                return False
+            if isinstance(error.reason, socket.timeout):
+                command.rate_limiter.overloaded()
+
+        command.metrics.count('retries')
+        delay = retry_delay(attempt, retry_after)
+        if retry_after:
+            command.rate_limiter.pause(delay)
+        command.logger.warn('Retrying %s in %.1f seconds' % (url, delay))
+        self.loop.call_later(delay, request_again)
+        return True
+
+    def _decode(self, url, body, error):
+        """Decode a response the way _get_feed_json_obj does, logging HTTP errors and returning None for them"""
+        if isinstance(error, urllib2.HTTPError):
+            self.command.logger.error('%s %s' % (error.msg, url))
+            return None
+        if error:
+            raise error
+        return self.command._decode_feed_json(url, body)
+
+    def _record_received(self, slot, lang, attempt, body, error):
+        url = self.command._get_item_url(slot.id, lang)
+        if error and self._retry(url, error, attempt, lambda: self._get_record(slot, lang, attempt + 1)):
+            return
+        try:
+            geoproduct = self._decode(url, body, error)
+        except Exception, e:
+            slot.error = e
+            geoproduct = None
+        setattr(slot, lang, geoproduct)
+        if lang == 'en' and not geoproduct:
+            self.loop.cancel(slot.fr_request)
+
+    def _page_received(self, link, attempt, body, error):
+        if error and self._retry(link, error, attempt, lambda: self._get_page(link, attempt + 1)):
+            return
+        self.page_pending = False
+        self.next_link = None
+        if isinstance(error, urllib2.HTTPError):
+            # Without this page the rest of the feed cannot be read, so the harvest ends with an error
+            error = urllib2.URLError('Could not retrieve %s: %s %s' % (link, error.code, error.msg))
+        try:
+            page = self._decode(link, body, error)
+        except Exception, e:
+            error_slot = _Slot()
+            error_slot.error = e
+            self.slots.append(error_slot)
+            return
+        if page['count'] == 0:
+            self.exhausted = True
+            return
+        self.page_cnt += 1
+        self._add_page(page)
+
+    def _import_ready(self):
+        while self.slots and self.slots[0].done():
+            slot = self.slots.popleft()
+            if slot.error:
+                if slot.id is None or not isinstance(slot.error, urllib2.URLError) or self.command.failures is None:
+                    raise slot.error
+                self.command._import_feed_record(slot.id, slot.error)
+            elif slot.page is not None:
+                self.command._finish_feed_page(slot.page)
+            else:
+                self.command._import_feed_record(slot.id, (slot.en, slot.fr))
+
+    def run(self):
+        """Harvest until the end of the feed or max_pages pages, and return True if the end of the feed was reached"""
+        try:
+            while True:
+                self._import_ready()
+                if self.next_link and not self.page_pending and len(self.slots) < self.window:
+                    self._get_page(self.next_link)
+                if not self.slots and not self.page_pending and not self.next_link:
+                    return self.exhausted
+                self.loop.run_once()
+        finally:
+            self.loop.close()
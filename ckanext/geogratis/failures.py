@@ -0,0 +1,64 @@
+import shelve
+import time
+
+# Seconds to wait before retrying a record after its first failure. The wait doubles with every further failure,
+# up to MAX_BACKOFF.
+RETRY_BACKOFF = 60
+MAX_BACKOFF = 24 * 3600
+
+
+class FailureQueue(object):
+    """Persistent queue of records that failed to import, keyed by Geogratis ID
+
+    For every record the queue keeps the reason it last failed, the number of times it has failed and when
+    it last did, so that only the failed records need to be processed again. A record becomes due for
+    another attempt RETRY_BACKOFF seconds after its first failure, and twice as long after each further one.
+    A record leaves the queue once it has been imported.
+
+    """
+    def __init__(self, path):
+        self.db = shelve.open(path)
+
+    def add(self, geo_id, reason, now=None):
+        """Record that the record failed to import for the given reason"""
+        key = geo_id.encode('utf-8')
+        entry = self.db.get(key)
+        attempts = entry[1] + 1 if entry else 1
+        self.db[key] = (reason, attempts, time.time() if now is None else now)
+
+    def remove(self, geo_id):
+        """Drop the record from the queue, if it is there, now that it has been imported"""
+        key = geo_id.encode('utf-8')
+        if key in self.db:
+            del self.db[key]
+
+    def due(self, now=None, max_attempts=0, backoff=True):
+        """Return the IDs of the records due for another attempt, longest waiting first
+
+        Records that have failed max_attempts times or more are left out, unless max_attempts is 0 or less.
+        Without backoff, every other record is due straight away.
+
+        """
+        if now is None:
+            now = time.time()
+        due = []
+        for key, (reason, attempts, last_attempt) in self.db.items():
+            if 0 < max_attempts <= attempts:
+                continue
+            if not backoff or last_attempt + min(RETRY_BACKOFF * 2 ** (attempts - 1), MAX_BACKOFF) <= now:
+                due.append((last_attempt, key.decode('utf-8')))
+        return [geo_id for last_attempt, geo_id in sorted(due)]
+
+    def get(self, geo_id):
+        """Return (reason, attempts, last attempt time) for a queued record, or None"""
+        return self.db.get(geo_id.encode('utf-8'))
+
+    def __len__(self):
+        return len(self.db)
+
+    def sync(self):
+        """Write out the changes made to the queue so far"""
+        self.db.sync()
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,108 @@
+import Queue
+import sys
+import threading
+
+# The most products that are held waiting to be imported. Reading a page ahead stops until the import catches up.
+MAX_QUEUED = 1000
+
+
+def iter_page(page):
+    """Stream an already decoded feed page the way FeedPrefetcher expects stream_page to"""
+    for product in page['products']:
+        yield 'product', product
+    yield 'page', page
+
+
+class FeedPrefetcher(object):
+    """Read pages of the Geogratis Atom feed ahead of the import on a background thread
+
+    Iterating yields ('product', product) for every product in the feed, in order, followed by ('page', page) at the
+    end of each page, starting with first_page. stream_page(link) must produce the same for the page at link, so
+    that products can be passed on as soon as they are read when pages are parsed incrementally. The page it ends
+    with need not include its products. Up to 'depth' pages are fetched ahead of the page being imported, a page
+    being imported until the entry that follows its ('page', page) is asked for, and no more than max_queued
+    products are held at a time, so that a large page read as a stream does not fill memory. Reading stops after
+    max_pages pages (no limit if max_pages is 0 or less), when a page has no next link, or when the next page is
+    empty or cannot be retrieved. Errors raised while fetching a page are re-raised from the iterator after the
+    products read before the error. 'exhausted' is set once the end of the feed itself has been reached.
+
+    """
+    END = object()
+
+    def __init__(self, stream_page, get_next_link, first_page, depth=1, max_pages=0, max_queued=MAX_QUEUED):
+        self.stream_page = stream_page
+        self.get_next_link = get_next_link
+        self.max_pages = max_pages
+        self.entries = Queue.Queue(max(max_queued, 1))
+        self.pages_ahead = threading.Semaphore(max(depth, 1))
+        self.stopped = False
+        self.exhausted = False
+        self.thread = threading.Thread(target=self._read, args=(first_page,))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _put(self, entry):
+        """Queue an entry, waiting for room. Returns False, leaving the entry out, once reading has been stopped."""
+        while not self.stopped:
+            try:
+                self.entries.put(entry, timeout=0.1)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def _read(self, page):
+        page_cnt = 1
+        try:
+            for entry in iter_page(page):
+                if not self._put(entry):
+                    return
+            while not self.stopped:
+                next_link = self.get_next_link(page)
+                if not next_link:
+                    self.exhausted = True
+                    break
+                if page_cnt == self.max_pages:
+                    break
+                self.pages_ahead.acquire()
+                if self.stopped:
+                    break
+                page = None
+                for kind, value in self.stream_page(next_link):
+                    if kind == 'page':
+                        page = value
+                    elif not self._put((kind, value)):
+                        return
+                if not page:
+                    break
+                if page['count'] == 0:
+                    self.exhausted = True
+                    break
+                if not self._put(('page', page)):
+                    return
+                page_cnt += 1
+        except:
+            self._put(sys.exc_info())
+        self._put(self.END)
+
+    def __iter__(self):
+        while True:
+            entry = self.entries.get()
+            if entry is self.END:
+                return
+            if len(entry) == 3:
+                raise entry[0], entry[1], entry[2]
+            yield entry
+            if entry[0] == 'page':
+                # The page has been dealt with, so the next one can be fetched
+                self.pages_ahead.release()
+
+    def close(self):
+        """Stop reading ahead. Pages already fetched are discarded."""
+        self.stopped = True
+        self.pages_ahead.release()
+        try:
+            while True:
+                self.entries.get_nowait()
+        except Queue.Empty:
+            pass
@@ -0,0 +1,58 @@
+import hashlib
+import shelve
+import simplejson as json
+
+
+def record_digest(odproduct):
+    """Hash an Open Data record, leaving out the fields that change on every run"""
+    fields = dict((key, value) for key, value in odproduct.items() if key != 'portal_release_date')
+    return hashlib.sha1(json.dumps(fields, sort_keys=True)).hexdigest()
+
+
+class HarvestIndex(object):
+    """Persistent index of harvested records, keyed by Geogratis ID
+
+    For every record the index keeps the Geogratis updatedDate and a hash of the Open Data record that
+    was last written out, so that unchanged records can be skipped on later runs. The IDs seen during
+    the current run are tracked so that records which are no longer in the feed can be found.
+
+    """
+    def __init__(self, path):
+        self.db = shelve.open(path)
+        self.seen = set()
+
+    def mark_seen(self, geo_id):
+        self.seen.add(geo_id.encode('utf-8'))
+
+    def is_current(self, geo_id, updated_date):
+        """True if the record has not been edited in Geogratis since it was last written out"""
+        entry = self.db.get(geo_id.encode('utf-8'))
+        return bool(entry and updated_date and entry[0] == updated_date)
+
+    def update(self, geo_id, updated_date, odproduct):
+        """Save the record and return 'new' or 'changed', or None if the Open Data record is unchanged"""
+        key = geo_id.encode('utf-8')
+        digest = record_digest(odproduct)
+        entry = self.db.get(key)
+        self.db[key] = (updated_date, digest)
+        if entry is None:
+            return 'new'
+        if entry[1] != digest:
+            return 'changed'
+        return None
+
+    def remove_unseen(self, in_scope=None):
+        """Drop every record that was not seen during this run and return their IDs. If given, in_scope(id) limits
+        this to the records that the run could have seen."""
+        removed = [key for key in self.db.keys()
+                   if key not in self.seen and (in_scope is None or in_scope(key.decode('utf-8')))]
+        for key in removed:
+            del self.db[key]
+        return [key.decode('utf-8') for key in removed]
+
+    def sync(self):
+        """Write out the changes made to the index so far"""
+        self.db.sync()
+
+    def close(self):
+        self.db.close()
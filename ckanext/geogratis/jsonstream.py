@@ -0,0 +1,102 @@
+import codecs
+import re
+import simplejson as json
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+DELIMITERS = u' \t\n\r,:]}'
+
+
+class JsonStream(object):
+    """Parse the JSON object read from a file-like source incrementally
+
+    The source is read 'chunk_size' bytes at a time and only the part of the document that has not been
+    parsed yet is kept, so the whole undecoded document is never held in memory at once. Each member value
+    is decoded with the JSON library's own decoder as soon as all of it has been read. A value that spans
+    many chunks is retried with twice as much input each time, which keeps the cost of retrying linear.
+
+    """
+    def __init__(self, source, chunk_size=65536):
+        self.source = source
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = u''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, size):
+        """Read up to size more bytes, dropping the text that has already been parsed. Returns False at the end."""
+        if self.eof:
+            return False
+        data = self.source.read(size)
+        self.eof = not data
+        self.buffer = self.buffer[self.pos:] + self.utf8.decode(data, self.eof)
+        self.pos = 0
+        return not self.eof
+
+    def _peek(self):
+        """Skip whitespace and return the next character without consuming it, or '' at the end of the input"""
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill(self.chunk_size):
+                return ''
+
+    def _expect(self, chars):
+        char = self._peek()
+        if not char or char not in chars:
+            raise ValueError('Expecting one of "%s" but found "%s"' % (chars, char or 'end of input'))
+        self.pos += 1
+        return char
+
+    def _value(self):
+        """Decode the next complete JSON value"""
+        self._peek()
+        size = self.chunk_size
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # A number or literal cut off at the end of the buffer may continue in the next chunk
+                if self.eof or (end < len(self.buffer) and self.buffer[end] in DELIMITERS):
+                    self.pos = end
+                    return value
+            except ValueError:
+                if self.eof:
+                    raise
+            size = max(size, 2 * (len(self.buffer) - self.pos))
+            self._fill(size)
+
+    def members(self, streamed=()):
+        """Yield (key, value) for every member of the object in the order they are read
+
+        The items of array members whose keys are in 'streamed' are yielded one at a time as (key, item), so that
+        they can be used before the rest of the array has been read.
+
+        """
+        self._expect('{')
+        if self._peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self._value()
+            if not isinstance(key, basestring):
+                raise ValueError('Expecting an object key but found %r' % (key,))
+            self._expect(':')
+            if key in streamed and self._peek() == '[':
+                self.pos += 1
+                if self._peek() == ']':
+                    self.pos += 1
+                else:
+                    while True:
+                        yield key, self._value()
+                        if self._expect(',]') == ']':
+                            break
+            else:
+                yield key, self._value()
+            if self._expect(',}') == '}':
+                return
+
+    def load(self):
+        """Decode the whole object, as json.load would"""
+        return dict(self.members())
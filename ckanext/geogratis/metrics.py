@@ -0,0 +1,158 @@
+import collections
+import math
+import os
+import simplejson as json
+import threading
+import time
+
+# Latencies are counted in buckets that each span GROWTH times the one before, starting at MIN_LATENCY seconds, so
+# that percentiles are accurate to within 5% whatever the number of samples
+MIN_LATENCY = 1e-6
+GROWTH = 1.05
+
+PERCENTILES = (50, 95, 99)
+
+
+class Histogram(object):
+    """Latency histogram with logarithmic buckets, which takes the same memory however many samples it holds"""
+    def __init__(self):
+        self.buckets = collections.Counter()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.buckets[int(math.log(max(seconds, MIN_LATENCY) / MIN_LATENCY, GROWTH))] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def merge(self, other):
+        self.buckets.update(other.buckets)
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percent):
+        """The latency below which percent of the samples fall, to within the width of a bucket"""
+        if not self.count:
+            return 0.0
+        rank = percent / 100.0 * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(MIN_LATENCY * GROWTH ** (bucket + 1), self.max)
+        return self.max
+
+    def summary(self):
+        summary = {'count': self.count, 'total': self.total, 'max': self.max}
+        for percent in PERCENTILES:
+            summary['p%d' % percent] = self.percentile(percent)
+        return summary
+
+
+class RunMetrics(object):
+    """Timings and counts for the stages of a run, safe to update from any thread
+
+    Each stage has a latency histogram, from which the 50th, 95th and 99th percentiles are reported. Counters
+    keep totals such as records and bytes, and HTTP responses are counted by status code. The metrics can be
+    written out as JSON, and in the Prometheus text format for a node exporter's textfile collector.
+
+    """
+    def __init__(self):
+        self.started = time.time()
+        self.stages = collections.defaultdict(Histogram)
+        self.counters = collections.Counter()
+        self.statuses = collections.Counter()
+        self.lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            self.stages[stage].add(seconds)
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] += n
+
+    def count_status(self, code):
+        with self.lock:
+            self.statuses[code] += 1
+
+    def merge_stages(self, stages):
+        """Add the histograms of another RunMetrics' stages, e.g. from a conversion process"""
+        with self.lock:
+            for stage, histogram in stages.items():
+                self.stages[stage].merge(histogram)
+
+    def report(self, extra=None):
+        """The metrics as a dict, with any 'extra' entries added"""
+        with self.lock:
+            elapsed = time.time() - self.started
+            report = {'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+                      'elapsed': elapsed,
+                      'records_per_second': self.counters['records'] / elapsed if elapsed > 0 else 0.0,
+                      'counters': dict(self.counters),
+                      'http_status': dict((str(code), n) for code, n in self.statuses.items()),
+                      'stages': dict((stage, histogram.summary()) for stage, histogram in self.stages.items())}
+        if extra:
+            report.update(extra)
+        return report
+
+    def prometheus(self, prefix='geogratis'):
+        """The metrics in the Prometheus text exposition format"""
+        report = self.report()
+        lines = ['# TYPE %s_elapsed_seconds gauge' % prefix,
+                 '%s_elapsed_seconds %f' % (prefix, report['elapsed']),
+                 '# TYPE %s_records_per_second gauge' % prefix,
+                 '%s_records_per_second %f' % (prefix, report['records_per_second'])]
+        for name, value in sorted(report['counters'].items()):
+            lines.append('# TYPE %s_%s_total counter' % (prefix, name))
+            lines.append('%s_%s_total %d' % (prefix, name, value))
+        if report['http_status']:
+            lines.append('# TYPE %s_http_responses_total counter' % prefix)
+            for code, n in sorted(report['http_status'].items()):
+                lines.append('%s_http_responses_total{code="%s"} %d' % (prefix, code, n))
+        if report['stages']:
+            lines.append('# TYPE %s_stage_seconds summary' % prefix)
+            for stage, summary in sorted(report['stages'].items()):
+                for percent in PERCENTILES:
+                    lines.append('%s_stage_seconds{stage="%s",quantile="%s"} %f' % (
+                        prefix, stage, percent / 100.0, summary['p%d' % percent]))
+                lines.append('%s_stage_seconds_sum{stage="%s"} %f' % (prefix, stage, summary['total']))
+                lines.append('%s_stage_seconds_count{stage="%s"} %d' % (prefix, stage, summary['count']))
+        return '\n'.join(lines) + '\n'
+
+
+def write_atomically(path, data):
+    """Replace the file at path with data, so that readers never see it partly written"""
+    tmp_path = '%s.tmp' % path
+    with open(tmp_path, 'wb') as tmp_file:
+        tmp_file.write(data)
+    os.rename(tmp_path, path)
+
+
+def write_json(metrics, path, extra=None):
+    write_atomically(path, json.dumps(metrics.report(extra), indent=2, sort_keys=True))
+
+
+class PrometheusExporter(object):
+    """Write the metrics to a file in the Prometheus text format every 'interval' seconds on a background thread,
+    and once more when closed"""
+    def __init__(self, metrics, path, interval=15):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._work)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _work(self):
+        while not self.stopped.wait(self.interval):
+            write_atomically(self.path, self.metrics.prometheus())
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+        write_atomically(self.path, self.metrics.prometheus())
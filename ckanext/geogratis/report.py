@@ -0,0 +1,136 @@
+import Queue
+import collections
+import csv
+import sys
+import threading
+
+FIELDNAMES = ('ID', 'Pass or Fail', 'Title (EN)', 'Title (FR)', 'Summary (EN)', 'Summary (FR)',
+              'Topic Categories', 'Keywords', 'Published Date', 'Browse Images',
+              'Series (EN)', 'Series (FR)', 'Series Issue (EN)', 'Series Issue (FR)',
+              'Reason for Failure')
+
+# The columns that show whether a field was filled in
+FIELD_COLUMNS = FIELDNAMES[4:14]
+
+
+class ImportReport(object):
+    """Report on the import of each record on a background thread, and keep statistics for a summary
+
+    Records are queued as they are imported and the CSV rows are built and written out on a background
+    thread, so that reporting adds little to the import itself. Without a path only the statistics are
+    kept. At most max_pending records wait to be reported; record() blocks beyond that.
+
+    """
+    def __init__(self, path=None, max_pending=1000):
+        self.report_file = None
+        self.writer = None
+        if path:
+            self.report_file = open(path, 'wt') # use 'at' for appending
+            self.writer = csv.DictWriter(self.report_file, dialect='excel', fieldnames=FIELDNAMES)
+            self.writer.writerow(dict(zip(FIELDNAMES, FIELDNAMES)))
+        self.passed = 0
+        self.failed = 0
+        self.ckan_failed = 0
+        self.missing_fields = collections.Counter()
+        self.reasons = collections.Counter()
+        self.rows = Queue.Queue(max_pending)
+        self.error = None
+        self.thread = threading.Thread(target=self._work)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def record(self, odproduct, valid, reasons):
+        """Report a converted record"""
+        self.rows.put((self._record_row, (odproduct, valid, reasons)))
+
+    def missing_french(self, id, title_en):
+        """Report a record that could not be converted because its French record is unavailable"""
+        self.rows.put((self._missing_french_row, (id, title_en)))
+
+    def ckan_failure(self, odproduct, reason):
+        """Report a converted record that CKAN rejected"""
+        self.rows.put((self._ckan_failure_row, (odproduct, reason)))
+
+    def _work(self):
+        while True:
+            item = self.rows.get()
+            if item is None:
+                break
+            if self.error:
+                continue
+            make_row, args = item
+            try:
+                row = make_row(*args)
+                if self.writer:
+                    self.writer.writerow(row)
+            except:
+                self.error = sys.exc_info()
+
+    def _count_failure(self, reasons):
+        self.failed += 1
+        for reason in reasons.split(';'):
+            reason = reason.strip()
+            if reason:
+                self.reasons[reason] += 1
+
+    def _record_row(self, odproduct, valid, reasons):
+        row = {'ID': odproduct['id'],
+               'Pass or Fail': valid,
+               'Title (EN)': odproduct['title'].encode('utf-8'),
+               'Title (FR)': odproduct['title_fra'].encode('utf-8'),
+               'Summary (EN)': 'Y' if odproduct['notes'] <> 'No title provided' else 'N',
+               'Summary (FR)': 'Y' if odproduct['notes_fra'] <> 'Pas de titre pr\u00e9vu' else 'N',
+               'Topic Categories': 'Y' if len(odproduct['topic_category']) > 0 else 'N',
+               'Keywords': 'Y' if len(odproduct['topic_category']) > 0 else 'N',
+               'Published Date': 'Y' if odproduct['date_published'] <> '' else 'N',
+               'Browse Images': 'Y' if odproduct['browse_graphic_url'] <>
+                                       "/static/img/canada_default.png" else 'N',
+               'Series (EN)': 'Y' if odproduct['data_series_name'] <> '' else 'N',
+               'Series (FR)': 'Y' if odproduct['data_series_name_fra'] <> '' else 'N',
+               'Series Issue (EN)': 'Y' if odproduct['data_series_issue_identification'] <> '' else 'N',
+               'Series Issue (FR)': 'Y' if odproduct['data_series_issue_identification_fra'] <> '' else 'N',
+               'Reason for Failure': reasons}
+        if valid:
+            self.passed += 1
+        else:
+            self._count_failure(reasons)
+        for column in FIELD_COLUMNS:
+            if row[column] == 'N':
+                self.missing_fields[column] += 1
+        return row
+
+    def _failure_row(self, id, title_en, title_fr, reason):
+        row = dict((column, '') for column in FIELDNAMES)
+        row.update({'ID': id, 'Pass or Fail': False, 'Title (EN)': title_en.encode('utf-8'),
+                    'Title (FR)': title_fr.encode('utf-8'), 'Reason for Failure': reason})
+        return row
+
+    def _missing_french_row(self, id, title_en):
+        self._count_failure('Unable to retrieve French record')
+        return self._failure_row(id, title_en, u'', 'Unable to retrieve French record')
+
+    def _ckan_failure_row(self, odproduct, reason):
+        self.ckan_failed += 1
+        return self._failure_row(odproduct['id'], odproduct['title'], odproduct['title_fra'], reason)
+
+    def close(self):
+        """Write out the remaining rows and wait for the background thread to finish"""
+        self.rows.put(None)
+        self.thread.join()
+        if self.report_file:
+            self.report_file.close()
+        if self.error:
+            raise self.error[0], self.error[1], self.error[2]
+
+    def summary(self, top=5):
+        """A few lines summarizing the import. Only complete once the report has been closed."""
+        lines = ['%d records imported: %d passed, %d failed' % (self.passed + self.failed, self.passed, self.failed)]
+        if self.ckan_failed:
+            lines.append('%d records rejected by CKAN' % self.ckan_failed)
+        if self.missing_fields:
+            lines.append('Missing fields: %s' % ', '.join('%s %d' % item
+                                                          for item in self.missing_fields.most_common()))
+        if self.reasons:
+            lines.append('Top reasons for failure: %s' % ', '.join('%s %d' % item
+                                                                   for item in self.reasons.most_common(top)))
+        return '\n'.join(lines)
@@ -0,0 +1,89 @@
+import collections
+import csv
+import hashlib
+import simplejson as json
+
+from ckanext.geogratis.sinks import output_files, read_lines
+
+
+def parse_shard(spec):
+    """Parse a shard given as 'K/N', the K-th of N shards numbered from 1, into (K, N)"""
+    try:
+        number, count = [int(part) for part in spec.split('/')]
+    except ValueError:
+        raise ValueError('"%s" is not a shard in the form K/N' % spec)
+    if not 1 <= number <= count:
+        raise ValueError('"%s" is not a shard: K must be from 1 to N' % spec)
+    return number, count
+
+
+def shard_of(geo_id, count):
+    """The shard, from 1 to count, that a Geogratis ID belongs to. Every node computes the same shard."""
+    return int(hashlib.md5(geo_id.encode('utf-8')).hexdigest()[:8], 16) % count + 1
+
+
+def merge_records(paths, output):
+    """Merge the JSON lines files of several shards into 'output', one record per ID
+
+    Each path is read as output written by a JsonLinesSink: compressed files are decompressed, and the output of a
+    rotated harvest is read from all the files listed in its manifest. When an ID appears more than once the record
+    with the newest date_modified is kept, or the one from the later file if they are equally new. Records are
+    written in the order of the files they were read from. Only the position of each record is held in memory, so
+    the files are read twice. Returns the number of records read and written. Raises ValueError if a path is a
+    single file of rotated output.
+
+    """
+    files = [output_files(path) for path in paths]
+    newest = {}
+    read = 0
+    for source, shard_files in enumerate(files):
+        for position, line in _read_lines(shard_files):
+            record = json.loads(line)
+            version = (record.get('date_modified', ''), source)
+            if record['id'] not in newest or newest[record['id']][0] <= version:
+                newest[record['id']] = (version, position)
+            read += 1
+
+    written = 0
+    for source, shard_files in enumerate(files):
+        for position, line in _read_lines(shard_files):
+            version, kept_position = newest[json.loads(line)['id']]
+            if version[1] == source and kept_position == position:
+                output.write(line)
+                written += 1
+    return read, written
+
+
+def _read_lines(paths):
+    """Yield the position and text of every non-blank line of the files, counting the lines from 0"""
+    position = 0
+    for path in paths:
+        for line in read_lines(path):
+            if line.strip():
+                yield position, line
+                position += 1
+
+
+def merge_reports(paths, output):
+    """Merge the CSV reports of several shards into 'output', keeping the last row reported for each ID
+
+    Returns the number of rows written, not counting the header.
+
+    """
+    header = None
+    rows = collections.OrderedDict()
+    for path in paths:
+        with open(path, 'rb') as report:
+            reader = csv.reader(report, dialect='excel')
+            for row in reader:
+                if header is None:
+                    header = row
+                elif row == header:
+                    continue
+                elif row:
+                    rows[row[0]] = row
+    writer = csv.writer(output, dialect='excel')
+    if header:
+        writer.writerow(header)
+    writer.writerows(rows.values())
+    return len(rows)
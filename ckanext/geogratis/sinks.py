@@ -0,0 +1,355 @@
+import Queue
+import bz2
+import hashlib
+import os
+import re
+import simplejson as json
+import threading
+import zlib
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+
+# File name suffix and compressor factory for each supported output compression. xz is only available when an
+# lzma module is installed.
+COMPRESSIONS = {
+    'gzip': ('.gz', lambda: zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)),
+    'bz2': ('.bz2', lambda: bz2.BZ2Compressor(9)),
+}
+if lzma is not None:
+    COMPRESSIONS['xz'] = ('.xz', lambda: lzma.LZMACompressor())
+
+# Decompressor factory for each compressed file name suffix, to read the output back
+DECOMPRESSIONS = {
+    '.gz': lambda: zlib.decompressobj(16 + zlib.MAX_WBITS),
+    '.bz2': lambda: bz2.BZ2Decompressor(),
+}
+if lzma is not None:
+    DECOMPRESSIONS['.xz'] = lambda: lzma.LZMADecompressor()
+
+
+class CkanSink(object):
+    """Load Open Data records straight into CKAN through the action API
+
+    Records are collected into batches which are loaded on a background thread, so converting the
+    next records overlaps with CKAN writing the previous ones. At most max_pending batches wait to be
+    loaded; write() blocks beyond that. Each record is created, or updated if CKAN already has a
+    dataset with the same ID. A record written again before its batch is loaded replaces the earlier
+    version in the batch. Records that CKAN rejects are kept, with the reason, until collected
+    with failures(). wait() returns once CKAN has every record written so far.
+
+    CKAN must be configured before the sink is created.
+
+    """
+    def __init__(self, batch_size=50, max_pending=4):
+        self._connect()
+        self.batch_size = batch_size
+        self.batch = []
+        self.positions = {}
+        self.batches = Queue.Queue(max_pending)
+        self.failed = Queue.Queue()
+        self.loaded = 0
+        self.thread = threading.Thread(target=self._work)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def write(self, odproduct):
+        # A newer version of a record that is still waiting in the batch replaces it there
+        position = self.positions.get(odproduct['id'])
+        if position is not None:
+            self.batch[position] = odproduct
+            return
+        self.positions[odproduct['id']] = len(self.batch)
+        self.batch.append(odproduct)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def _connect(self):
+        """Look up the site user that records are loaded as"""
+        import ckan.model as model
+        from ckan.logic import get_action
+
+        self.model = model
+        self.site_user = get_action('get_site_user')({'model': model, 'ignore_auth': True}, {})['name']
+
+    def _work(self):
+        while True:
+            batch = self.batches.get()
+            if batch is None:
+                self.batches.task_done()
+                break
+            try:
+                self._load_batch(batch)
+            finally:
+                self.model.Session.remove()
+                self.batches.task_done()
+
+    def _load_batch(self, batch):
+        from ckan.logic import get_action, ValidationError
+
+        model = self.model
+        ids = [odproduct['id'] for odproduct in batch]
+        existing = set(row[0] for row in model.Session.query(model.Package.id).filter(model.Package.id.in_(ids)))
+        for odproduct in batch:
+            action = 'package_update' if odproduct['id'] in existing else 'package_create'
+            context = {'model': model, 'session': model.Session, 'user': self.site_user, 'ignore_auth': True}
+            try:
+                get_action(action)(context, dict(odproduct))
+                self.loaded += 1
+            except ValidationError, e:
+                model.Session.rollback()
+                self.failed.put((odproduct, '%s failed: %s' % (action, e.error_dict)))
+            except Exception, e:
+                model.Session.rollback()
+                self.failed.put((odproduct, '%s failed: %s' % (action, e)))
+
+    def failures(self):
+        """Return the (odproduct, reason) pairs for records that CKAN has rejected since the last call"""
+        failed = []
+        try:
+            while True:
+                failed.append(self.failed.get_nowait())
+        except Queue.Empty:
+            pass
+        return failed
+
+    def flush(self):
+        """Queue the records written so far to be loaded without waiting for a full batch"""
+        if self.batch:
+            self.batches.put(self.batch)
+            self.batch = []
+            self.positions = {}
+
+    def wait(self):
+        """Load the records written so far and wait until CKAN has them all"""
+        self.flush()
+        self.batches.join()
+
+    def close(self):
+        """Load the remaining records and wait for the background thread to finish"""
+        self.flush()
+        self.batches.put(None)
+        self.thread.join()
+
+
+class JsonLinesSink(object):
+    """Write JSON lines to a file through a large buffer, optionally compressed and rotated into shards
+
+    Nothing is flushed until sync() is called, which makes everything written so far durable and returns a
+    position that resume() can later continue the output from. With compression, each sync ends a gzip member,
+    bz2 stream or xz stream; concatenated streams are valid files for all three formats, so the file can be
+    truncated at any sync position and appended to.
+
+    If max_bytes or max_records is set, the output is rotated into numbered shard files (out-00001.jl.gz,
+    out-00002.jl.gz, ...) once a shard reaches either limit, and a manifest (out.manifest.json) lists the
+    shards with their record counts, sizes and SHA-256 checksums.
+
+    """
+    def __init__(self, path, compression=None, max_bytes=0, max_records=0, buffer_size=1048576):
+        self.base, self.extension = os.path.splitext(path)
+        self.path = path
+        self.suffix = COMPRESSIONS[compression][0] if compression else ''
+        self.new_compressor = COMPRESSIONS[compression][1] if compression else None
+        self.max_bytes = max_bytes
+        self.max_records = max_records
+        self.rotating = bool(max_bytes or max_records)
+        self.buffer_size = buffer_size
+        self.shards = []
+        self.shard = 1
+        self.file = None
+        self.compressor = None
+        self.checksum = None
+        self.bytes = 0
+        self.records = 0
+
+    def _shard_path(self, shard):
+        if self.rotating:
+            return '%s-%05d%s%s' % (self.base, shard, self.extension, self.suffix)
+        return self.path + self.suffix
+
+    def _open(self, offset=0):
+        """Open the current shard, keeping its first 'offset' bytes"""
+        path = self._shard_path(self.shard)
+        self.checksum = hashlib.sha256()
+        if offset and os.path.exists(path):
+            self.file = open(path, 'r+b', self.buffer_size)
+            self.file.truncate(offset)
+            while self.file.tell() < offset:
+                self.checksum.update(self.file.read(min(self.buffer_size, offset - self.file.tell())))
+            self.file.seek(offset)
+            self.bytes = offset
+        else:
+            self.file = open(path, 'wb', self.buffer_size)
+            self.bytes = 0
+
+    def _write_bytes(self, data):
+        if data:
+            self.file.write(data)
+            self.checksum.update(data)
+            self.bytes += len(data)
+
+    def write(self, line):
+        if self.file is None:
+            self._open()
+        if isinstance(line, unicode):
+            line = line.encode('utf-8')
+        data = line + '\n'
+        if self.new_compressor:
+            if self.compressor is None:
+                self.compressor = self.new_compressor()
+            data = self.compressor.compress(data)
+        self._write_bytes(data)
+        self.records += 1
+        if self.rotating and ((self.max_records and self.records >= self.max_records) or
+                              (self.max_bytes and self.bytes >= self.max_bytes)):
+            self._rotate()
+
+    def _flush(self):
+        """Write out everything buffered so far, ending the compressed stream, and fsync the file"""
+        if self.compressor is not None:
+            self._write_bytes(self.compressor.flush())
+            self.compressor = None
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def _rotate(self):
+        """Finish the current shard and add it to the manifest. The next shard is opened by the next write."""
+        self._flush()
+        self.file.close()
+        self.file = None
+        self.shards.append({'file': os.path.basename(self._shard_path(self.shard)), 'records': self.records,
+                            'bytes': self.bytes, 'sha256': self.checksum.hexdigest()})
+        self._write_manifest()
+        self.shard += 1
+        self.bytes = 0
+        self.records = 0
+
+    def _write_manifest(self):
+        if not self.rotating:
+            return
+        manifest = {'compression': self.suffix[1:] or None,
+                    'records': sum(shard['records'] for shard in self.shards),
+                    'shards': self.shards}
+        path = _manifest_path(self.base)
+        with open(path + '.tmp', 'wb') as manifest_file:
+            json.dump(manifest, manifest_file, indent=2)
+            manifest_file.flush()
+            os.fsync(manifest_file.fileno())
+        os.rename(path + '.tmp', path)
+
+    def sync(self):
+        """Make everything written so far durable and return the position to resume from"""
+        if self.file is not None:
+            self._flush()
+        return '%d:%d:%d' % (self.shard, self.bytes, self.records)
+
+    def resume(self, position):
+        """Continue the output of an interrupted run from a position returned by sync()
+
+        Anything the interrupted run wrote after that position, including later shards, is discarded. An
+        offset in an uncompressed file, as recorded by earlier versions, is also accepted.
+
+        """
+        if ':' in position:
+            shard, offset, records = [int(part) for part in position.split(':')]
+        else:
+            shard, offset, records = 1, int(position), 0
+        if self.rotating:
+            path = _manifest_path(self.base)
+            if os.path.exists(path):
+                with open(path, 'rb') as manifest_file:
+                    self.shards = json.load(manifest_file)['shards'][:shard - 1]
+            later = shard + 1
+            while os.path.exists(self._shard_path(later)):
+                os.remove(self._shard_path(later))
+                later += 1
+        self.shard = shard
+        self.records = records
+        self._open(offset)
+
+    def close(self):
+        """Flush the output and, when rotating, finish the last shard and write out the manifest"""
+        if self.file is None and not self.rotating:
+            self._open()
+        if self.file is not None:
+            if self.rotating and self.records:
+                self._rotate()
+            else:
+                self._flush()
+                self.file.close()
+                self.file = None
+                if self.rotating:
+                    os.remove(self._shard_path(self.shard))
+        self._write_manifest()
+
+
+def _manifest_path(base):
+    return '%s.manifest.json' % base
+
+
+def output_files(path):
+    """The files that a JsonLinesSink wrote its output to, in order, given the path passed to it, the manifest of
+    rotated output or a single file
+
+    A file that does not exist is looked for with the suffix of each compression. Raises ValueError if the path
+    is one of the numbered shards of rotated output, since the records in the others would be left out.
+
+    """
+    if path.endswith('.manifest.json'):
+        with open(path, 'rb') as manifest_file:
+            manifest = json.load(manifest_file)
+        return [os.path.join(os.path.dirname(path), shard['file']) for shard in manifest['shards']]
+    base, extension = os.path.splitext(path)
+    if extension in DECOMPRESSIONS:
+        base = os.path.splitext(base)[0]
+    rotated = re.match(r'(.*)-\d{5}$', base)
+    if rotated and os.path.exists(_manifest_path(rotated.group(1))):
+        raise ValueError('%s is one of the files of rotated output. Give its manifest, %s, to read all of them.' %
+                         (path, _manifest_path(rotated.group(1))))
+    if not os.path.exists(path):
+        if os.path.exists(_manifest_path(os.path.splitext(path)[0])):
+            return output_files(_manifest_path(os.path.splitext(path)[0]))
+        for suffix in sorted(DECOMPRESSIONS):
+            if os.path.exists(path + suffix):
+                return [path + suffix]
+    return [path]
+
+
+def read_lines(path, chunk_size=1048576):
+    """Yield the lines of a file written by a JsonLinesSink, decompressing it if its name has the suffix of a
+    compression. Each compressed stream in the file is decompressed in turn."""
+    new_decompressor = DECOMPRESSIONS.get(os.path.splitext(path)[1])
+    with open(path, 'rb') as data_file:
+        chunks = iter(lambda: data_file.read(chunk_size), '')
+        if new_decompressor:
+            chunks = _decompress(chunks, new_decompressor)
+        partial = ''
+        for chunk in chunks:
+            lines = (partial + chunk).split('\n')
+            partial = lines.pop()
+            for line in lines:
+                yield line + '\n'
+        if partial:
+            yield partial + '\n'
+
+
+def _decompress(chunks, new_decompressor):
+    decompressor = new_decompressor()
+    for data in chunks:
+        while data:
+            try:
+                text = decompressor.decompress(data)
+            except EOFError:
+                # The last stream ended with the last chunk, and this one starts another
+                decompressor = new_decompressor()
+                continue
+            yield text
+            data = decompressor.unused_data
+            if data:
+                decompressor = new_decompressor()
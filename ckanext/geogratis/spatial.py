@@ -0,0 +1,134 @@
+import simplejson as json
+
+# Coordinates are rounded to this many decimal places by default, about 0.1 m in degrees of latitude
+DEFAULT_PRECISION = 6
+
+# The fewest positions that a line and a linear ring can be left with by simplification
+MIN_LINE = 2
+MIN_RING = 4
+
+
+def _simplify(positions, tolerance, minimum):
+    """Drop the positions of a line that lie within tolerance of the line through those kept (Douglas-Peucker)
+
+    The first and last positions are always kept. Returns the positions unchanged if fewer than minimum would be
+    left.
+
+    """
+    count = len(positions)
+    if count <= minimum:
+        return positions
+    keep = [False] * count
+    keep[0] = keep[-1] = True
+    squared_tolerance = tolerance * tolerance
+    stack = [(0, count - 1)]
+    while stack:
+        first, last = stack.pop()
+        x1, y1 = positions[first][0], positions[first][1]
+        dx, dy = positions[last][0] - x1, positions[last][1] - y1
+        length = dx * dx + dy * dy
+        farthest, farthest_distance = None, squared_tolerance
+        for i in xrange(first + 1, last):
+            px, py = positions[i][0] - x1, positions[i][1] - y1
+            if length:
+                # Squared distance from the segment, or from its nearest end
+                t = min(max((px * dx + py * dy) / length, 0.0), 1.0)
+                px, py = px - t * dx, py - t * dy
+            distance = px * px + py * py
+            if distance > farthest_distance:
+                farthest, farthest_distance = i, distance
+        if farthest is not None:
+            keep[farthest] = True
+            stack.append((first, farthest))
+            stack.append((farthest, last))
+    simplified = [position for position, kept in zip(positions, keep) if kept]
+    if len(simplified) < minimum:
+        return positions
+    return simplified
+
+
+def _signed_area(ring):
+    """The area of a linear ring, positive if it runs anticlockwise and negative if clockwise"""
+    area = 0.0
+    for a, b in zip(ring, ring[1:]):
+        area += a[0] * b[1] - b[0] * a[1]
+    return area / 2
+
+
+def _is_rectangle(ring):
+    """Whether a linear ring is an axis-aligned rectangle, the shape of most Geogratis bounding boxes"""
+    if len(ring) != 5 or ring[0] != ring[4] or any(len(position) != 2 for position in ring):
+        return False
+    xs = set(position[0] for position in ring)
+    ys = set(position[1] for position in ring)
+    if len(xs) != 2 or len(ys) != 2:
+        return False
+    return all(a[0] == b[0] or a[1] == b[1] for a, b in zip(ring[:-1], ring[1:]))
+
+
+class SpatialEncoder(object):
+    """Encode Geogratis geometries as compact GeoJSON for the Open Data spatial field
+
+    Coordinates are rounded to 'precision' decimal places, or written in full if precision is None. If a tolerance
+    is given, lines and polygon rings are simplified by dropping vertices that lie within tolerance (in degrees) of
+    the simplified shape. The simplification never collapses a ring or turns it inside out: a ring that would be
+    left with fewer than four positions, or whose orientation would change, is kept as it was. Polygons that are
+    axis-aligned rectangles, as the bounding boxes Geogratis gives for most products are, are not simplified. The
+    coordinates are then serialized in one call to the JSON encoder.
+
+    """
+    def __init__(self, precision=DEFAULT_PRECISION, tolerance=0):
+        self.precision = precision
+        self.tolerance = tolerance
+        self.encoders = {'Point': self._position,
+                         'MultiPoint': self._positions,
+                         'LineString': self._line,
+                         'MultiLineString': lambda lines: [self._line(line) for line in lines],
+                         'Polygon': self._polygon,
+                         'MultiPolygon': lambda polygons: [self._polygon(polygon) for polygon in polygons]}
+
+    def encode(self, geometry):
+        """Return the geometry, a GeoJSON geometry object decoded from a Geogratis record, as a GeoJSON string"""
+        try:
+            geometry_type = geometry['type']
+            if geometry_type == 'GeometryCollection':
+                return '{"type":"GeometryCollection","geometries":[%s]}' % ','.join(
+                    self.encode(member) for member in geometry['geometries'])
+            encoder = self.encoders.get(geometry_type)
+            if encoder is not None:
+                return '{"type":%s,"coordinates":%s}' % (json.dumps(geometry_type), json.dumps(
+                    encoder(geometry['coordinates']), separators=(',', ':')))
+        except (KeyError, TypeError, IndexError):
+            pass
+        # Anything that is not a GeoJSON geometry is passed on as it is
+        return json.dumps(geometry, separators=(',', ':'))
+
+    def _position(self, position):
+        if self.precision is None:
+            return position
+        precision = self.precision
+        return [round(number, precision) if type(number) is float else number for number in position]
+
+    def _positions(self, positions):
+        if self.precision is None:
+            return positions
+        precision = self.precision
+        return [[round(number, precision) if type(number) is float else number for number in position]
+                for position in positions]
+
+    def _line(self, positions):
+        if self.tolerance > 0:
+            positions = _simplify(positions, self.tolerance, MIN_LINE)
+        return self._positions(positions)
+
+    def _ring(self, ring):
+        if self.tolerance > 0 and len(ring) > MIN_RING:
+            simplified = _simplify(ring, self.tolerance, MIN_RING)
+            if simplified is not ring and _signed_area(simplified) * _signed_area(ring) > 0:
+                ring = simplified
+        return self._positions(ring)
+
+    def _polygon(self, rings):
+        if len(rings) == 1 and _is_rectangle(rings[0]):
+            return [self._positions(rings[0])]
+        return [self._ring(ring) for ring in rings]
@@ -0,0 +1,72 @@
+import BaseHTTPServer
+import SocketServer
+import random
+import threading
+import time
+import zlib
+
+# The server errors that the stand-in answers with, all of which a harvest retries
+ERROR_CODES = (500, 502, 503, 504)
+
+
+class StandInHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Answer GET requests from the server's archive, with keep-alive and gzip compression like Geogratis"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        delay, error = self.server.plan()
+        if delay > 0:
+            time.sleep(delay)
+        if error:
+            self._send(error, '')
+            return
+        base_url = 'http://%s' % self.headers.get('host', '%s:%d' % self.server.server_address)
+        body = self.server.archive.get(self.path.lstrip('/'), base_url)
+        if body is None:
+            self._send(404, '')
+            return
+        self._send(200, body, 'gzip' in (self.headers.get('accept-encoding') or ''))
+
+    def _send(self, code, body, compress=False):
+        self.send_response(code)
+        if compress:
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            body = compressor.compress(body) + compressor.flush()
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """Serve the responses in a ResponseArchive in place of Geogratis
+
+    Links in the responses are rewritten to point back at the stand-in. Every response is delayed by 'latency'
+    seconds, give or take up to 'jitter' seconds, and a fraction 'error_rate' of requests is answered with a
+    server error instead. Given a seed, the same sequence of delays and errors is drawn on every run.
+
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, archive, latency=0, jitter=0, error_rate=0, seed=None):
+        BaseHTTPServer.HTTPServer.__init__(self, address, StandInHandler)
+        self.archive = archive
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def plan(self):
+        """Draw the delay and the error code, or None, for the next response"""
+        with self.lock:
+            delay = self.latency + self.random.uniform(-self.jitter, self.jitter)
+            error = None
+            if self.random.random() < self.error_rate:
+                error = self.random.choice(ERROR_CODES)
+        return delay, error
@@ -0,0 +1,127 @@
+import cPickle as pickle
+import hashlib
+import os
+import pkgutil
+
+# Bump whenever build_lookup_tables changes, so that tables cached by an earlier version are rebuilt
+TABLES_VERSION = 1
+
+SCHEMA_MODULE = 'ckanext.canada.metadata_schema'
+
+
+def build_lookup_tables():
+    """Create look-up tables (dicts) of valid choices from the Open Data schema
+
+    Returns a dict holding:
+        * topic_subjects: the Open Data topic key and subject keys for each topic category
+        * format_types: resource file format types
+        * geographic_regions: geographic regions
+        * presentation_forms: presentation forms, which are not in the schema
+
+    """
+    from ckanext.canada.metadata_schema import schema_description
+
+    # Topic categories. The Open Data topic key and subject keys for each topic category are looked up once
+    # rather than for every record.
+    topic_choices = dict((c['eng'], c)
+                         for c in schema_description.dataset_field_by_id['topic_category']['choices'] if 'eng' in c)
+    subject_choices = schema_description.dataset_field_by_id['subject']['choices_by_id']
+    topic_subjects = dict((topic_key, (c['key'], [subject_choices[s]['key'] for s in c['subject_ids']]))
+                          for topic_key, c in topic_choices.items())
+
+    # Resource file types - additional mappings to the correct types are added
+    # for Geogratis because the file formats in Geogratis do not match one-for-one with Open Data formats
+    format_types = dict((item['eng'], item['key'])
+                        for item in schema_description.resource_field_by_id['format']['choices'])
+    format_types['GeoTIFF (Georeferenced Tag Image File Format)'] = 'geotif'
+    format_types['TIFF (Tag Image File Format)'] = "tiff"
+    format_types['GeoTIFF'] = 'geotif'
+    format_types['Adobe PDF'] = 'PDF'
+    format_types['PDF - Portable Document Format'] = "PDF"
+    format_types['ASCII (American Standard Code for Information Interchange)'] = "TXT"
+    format_types['GML (Geography Markup Language)'] = "gml"
+    format_types['Shape'] = "SHAPE"
+    format_types['gzip (GNU zip)'] = "ZIP"
+    format_types['ZIP'] = "ZIP"
+    format_types['ESRI Shapefile'] = "SHAPE"
+    format_types['JPEG'] = "jpg"
+    format_types['Jpeg 2000'] = "jpeg 2000"
+
+    # Geographic regions - note that Open Data uses far fewer regions than Geogratis
+    geographic_regions = dict((region['eng'], region['key'])
+                              for region in schema_description.dataset_field_by_id['geographic_region']['choices'])
+
+    presentation_forms = {}
+    presentation_forms['documentDigital'] = u"Document Digital | Document num\u00e9rique"
+    presentation_forms['documentHardcopy'] = u"Document Hardcopy | Document papier"
+    presentation_forms['imageDigital'] = u"Image Digital | Image num\u00e9rique"
+    presentation_forms['imageHardcopy'] = u"Image Hardcopy | Image papier"
+    presentation_forms['mapDigital'] = u"Map Digital | Carte num\u00e9rique"
+    presentation_forms['mapHardcopy'] = u"Map Hardcopy | Carte papier"
+    presentation_forms['modelDigital'] = u"Model Digital | Mod\u00e8le num\u00e9rique"
+    presentation_forms['modelHardcopy'] = u"Model Hardcopy | Maquette"
+    presentation_forms['profileDigital'] = u"Profile Digital | Profil num\u00e9rique"
+    presentation_forms['profileHardcopy'] = u"Profile Hardcopy | Profil papier"
+    presentation_forms['tableDigital'] = u"Table Digital | Table num\u00e9rique"
+    presentation_forms['tableHardcopy'] = u"Table Hardcopy | Table papier"
+    presentation_forms['videoDigital'] = u"Video Digital | Vid\u00e9o num\u00e9rique"
+    presentation_forms['videalHardcopy'] = u"Video Hardcopy | Vid\u00e9o film"
+    presentation_forms['audioDigital'] = u"Audio Digital | Audio num\u00e9rique"
+    presentation_forms['audioHardcopy'] = u"Audio Hardcopy | Audio analogique"
+    presentation_forms['multimediaDigital'] = u"Multimedia Digital | Multim\u00e9dia num\u00e9rique"
+    presentation_forms['multimediaHardcopy'] = u"Multimedia Hardcopy | Multim\u00e9dia analogique"
+    presentation_forms['diagramDigial'] = u"Diagram Digital | Diagramme num\u00e9rique"
+    presentation_forms['diagramHardcopy'] = u"Diagram Hardcopy | Diagramme papier"
+
+    return {'topic_subjects': topic_subjects,
+            'format_types': format_types,
+            'geographic_regions': geographic_regions,
+            'presentation_forms': presentation_forms}
+
+
+def schema_fingerprint():
+    """Identify the installed version of the Open Data schema without importing it
+
+    The schema may be loaded from data files kept next to its module, so the name, size and modification time of
+    every file in the module's directory are taken into account. Returns None if the schema cannot be found.
+
+    """
+    loader = pkgutil.get_loader(SCHEMA_MODULE)
+    if loader is None:
+        return None
+    directory = os.path.dirname(os.path.abspath(loader.get_filename()))
+    fingerprint = hashlib.sha1()
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(('.pyc', '.pyo')):
+            continue
+        stat = os.stat(os.path.join(directory, name))
+        fingerprint.update('%s %d %r\n' % (name, stat.st_size, stat.st_mtime))
+    return fingerprint.hexdigest()
+
+
+def load_lookup_tables(cache_path=None):
+    """Return the look-up tables, from cache_path if they were cached there from the installed schema
+
+    The tables are built from the schema, and cached at cache_path if it is given, when the cache is missing,
+    unreadable or out of date.
+
+    """
+    if not cache_path:
+        return build_lookup_tables()
+
+    fingerprint = schema_fingerprint()
+    try:
+        with open(cache_path, 'rb') as cache_file:
+            cached = pickle.load(cache_file)
+        if cached['version'] == TABLES_VERSION and fingerprint and cached['schema'] == fingerprint:
+            return cached['tables']
+    except Exception:
+        pass
+
+    tables = build_lookup_tables()
+    if fingerprint:
+        tmp_path = '%s.tmp' % cache_path
+        with open(tmp_path, 'wb') as cache_file:
+            pickle.dump({'version': TABLES_VERSION, 'schema': fingerprint, 'tables': tables}, cache_file, 2)
+        os.rename(tmp_path, cache_path)
+    return tables
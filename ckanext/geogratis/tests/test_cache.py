@@ -0,0 +1,113 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import urllib2
+
+from ckanext.geogratis.cache import CachingTransport, ResponseCache
+
+
+class _Response(object):
+    def __init__(self, status, body='', headers=None):
+        self.status = status
+        self.body = body
+        self.headers = headers or {}
+
+    def read(self):
+        return self.body
+
+    def getheader(self, name):
+        return self.headers.get(name)
+
+
+class _Transport(object):
+    """Answers each request with the next of 'responses', keeping the headers it was sent"""
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def open(self, url, headers=None):
+        self.requests.append((url, headers))
+        return self.responses.pop(0)
+
+    def summary(self):
+        return '%d requests' % len(self.requests)
+
+
+class ResponseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_entries_are_kept_across_runs(self):
+        cache = ResponseCache(os.path.join(self.directory, 'cache'), 1000)
+        self.assertEqual(cache.get('http://a'), None)
+        cache.put('http://a', 'body', '"1"', 'Mon, 01 Sep 2014 00:00:00 GMT')
+        cache = ResponseCache(os.path.join(self.directory, 'cache'), 1000)
+        validators, body = cache.get('http://a')
+        self.assertEqual(body, 'body')
+        self.assertEqual((validators['etag'], validators['last_modified']), ('"1"', 'Mon, 01 Sep 2014 00:00:00 GMT'))
+        self.assertEqual(cache.total_bytes, 4)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = ResponseCache(self.directory, 25)
+        for url in ('http://a', 'http://b'):
+            cache.put(url, 'x' * 10)
+        # Make 'a' the older entry, then use it so that 'b' is evicted instead
+        past = time.time() - 60
+        os.utime(cache._path('http://a', 'body'), (past, past))
+        os.utime(cache._path('http://b', 'body'), (past + 1, past + 1))
+        cache.get('http://a')
+        cache.put('http://c', 'x' * 10)
+        self.assertNotEqual(cache.get('http://a'), None)
+        self.assertEqual(cache.get('http://b'), None)
+        self.assertNotEqual(cache.get('http://c'), None)
+        self.assertEqual(cache.total_bytes, 20)
+
+
+class CachingTransportTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = ResponseCache(self.directory, 1000)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_cached_responses_are_revalidated(self):
+        transport = _Transport([_Response(200, 'first', {'etag': '"1"', 'last-modified': 'yesterday'}),
+                                _Response(304),
+                                _Response(200, 'second', {'etag': '"2"'})])
+        caching = CachingTransport(transport, self.cache)
+        self.assertEqual(caching.open('http://a', {'Accept': 'application/json'}).read(), 'first')
+        self.assertEqual(transport.requests[0][1], {'Accept': 'application/json'})
+        # Not modified since, so answered from the cache
+        self.assertEqual(caching.open('http://a').read(), 'first')
+        self.assertEqual(transport.requests[1][1], {'If-None-Match': '"1"', 'If-Modified-Since': 'yesterday'})
+        self.assertEqual(caching.open('http://a').read(), 'second')
+        self.assertEqual(self.cache.get('http://a')[0]['etag'], '"2"')
+        self.assertEqual(caching.stats, {'cache_hits': 0, 'cache_revalidated': 1, 'cache_misses': 2})
+        self.assertEqual(caching.summary(), '3 requests, 0 cache hits, 1 revalidated, 2 misses')
+
+    def test_errors_are_not_cached(self):
+        transport = _Transport([_Response(503, 'busy'), _Response(304)])
+        caching = CachingTransport(transport, self.cache)
+        response = caching.open('http://a')
+        self.assertEqual((response.status, response.read()), (503, 'busy'))
+        self.assertEqual(self.cache.get('http://a'), None)
+        # Without a cached body, a 304 is passed on as it is
+        self.assertEqual(caching.open('http://a').status, 304)
+        self.assertEqual(transport.requests[1][1], {})
+
+    def test_offline(self):
+        self.cache.put('http://a', 'cached')
+        caching = CachingTransport(_Transport([]), self.cache, offline=True)
+        self.assertEqual(caching.open('http://a').read(), 'cached')
+        self.assertRaises(urllib2.URLError, caching.open, 'http://b')
+        self.assertEqual(caching.summary(), '1 cache hits, 0 revalidated, 1 misses')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import simplejson as json
+
+from ckanext.geogratis.catalog import CatalogStore
+
+
+def _put(catalog, geo_id, updated_date, series=None, topics=(), valid=True):
+    odproduct = {'id': geo_id, 'data_series_name': series, 'topic_category': list(topics)}
+    catalog.put(geo_id, updated_date, u'{"id": "%s", "title": "\xc9t\xe9"}' % geo_id, '{"id": "%s"}' % geo_id,
+                odproduct, json.dumps(odproduct), valid, None if valid else 'missing title', geo_id.upper())
+
+
+class CatalogStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'geogratis.db')
+        self.catalog = CatalogStore(self.path)
+        _put(self.catalog, u'a', '2014-01-01T00:00:00Z', 'Roads', ['transport'])
+        _put(self.catalog, u'b', '2014-06-01T00:00:00Z', 'Roads', ['transport', 'economy'], valid=False)
+        _put(self.catalog, u'c', '2015-01-01T00:00:00Z', None, ['economy'])
+
+    def tearDown(self):
+        self.catalog.close()
+        shutil.rmtree(self.directory)
+
+    def _ids(self, **selection):
+        return [record.id for record in self.catalog.select(**selection)]
+
+    def test_records_are_kept_across_runs(self):
+        self.catalog.close()
+        self.catalog = CatalogStore(self.path)
+        record = list(self.catalog.select())[1]
+        self.assertEqual((record.id, record.updated_date, record.series, record.valid, record.reasons, record.title),
+                         (u'b', '2014-06-01T00:00:00Z', 'Roads', 0, 'missing title', 'B'))
+        # The documents are given back as the UTF-8 JSON text that was stored
+        self.assertEqual(record.product_en, '{"id": "b", "title": "\xc3\x89t\xc3\xa9"}')
+        self.assertEqual(record.product_fr, '{"id": "b"}')
+        self.assertEqual(json.loads(record.odproduct)['topic_category'], ['transport', 'economy'])
+
+    def test_selections(self):
+        self.assertEqual(self._ids(), [u'a', u'b', u'c'])
+        self.assertEqual(self._ids(since='2014-06-01'), [u'b', u'c'])
+        self.assertEqual(self._ids(series='Roads'), [u'a', u'b'])
+        self.assertEqual(self._ids(topic='economy'), [u'b', u'c'])
+        self.assertEqual(self._ids(valid=True), [u'a', u'c'])
+        self.assertEqual(self._ids(series='Roads', topic='economy', valid=False), [u'b'])
+        self.assertEqual(self.catalog.count(topic='transport', since='2014-02-01'), 1)
+        self.assertEqual(self.catalog.count(), 3)
+
+    def test_records_are_replaced(self):
+        _put(self.catalog, u'b', '2015-06-01T00:00:00Z', 'Rivers', ['environment'])
+        self.assertEqual(self._ids(topic='economy'), [u'c'])
+        self.assertEqual(self._ids(topic='environment', series='Rivers', valid=True), [u'b'])
+        self.assertEqual(self.catalog.count(), 3)
+
+    def test_records_can_be_stored_while_a_selection_is_read(self):
+        seen = []
+        for record in self.catalog.select(batch_size=2):
+            seen.append(record.id)
+            _put(self.catalog, record.id, record.updated_date)
+            if record.id == u'a':
+                _put(self.catalog, u'd', '2015-01-01T00:00:00Z')
+        self.assertEqual(seen, [u'a', u'b', u'c', u'd'])
+        self.assertEqual(self.catalog.count(topic='economy'), 0)
+
+    def test_unconverted_record(self):
+        self.catalog.put(u'e', None, '{}', None, None, None, False, 'not converted', None)
+        record = list(self.catalog.select(valid=False))[-1]
+        self.assertEqual((record.id, record.series, record.product_fr, record.odproduct), (u'e', None, None, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import simplejson as json
+
+from ckanext.geogratis.checkpoint import CheckpointJournal
+from ckanext.geogratis.sinks import JsonLinesSink, output_files, read_lines
+
+# A feed of four pages of five products each
+PAGES = [['%d-%d' % (page, i) for i in range(5)] for page in range(4)]
+
+
+class _Crash(Exception):
+    pass
+
+
+class CheckpointJournalTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'geogratis.ckpt')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_progress_is_replayed(self):
+        journal = CheckpointJournal(self.path)
+        journal.begin_page('page-1', '1:0:0')
+        journal.complete([u'a', u'b'], '1:10:2')
+        journal.begin_page('page-2', '1:20:3')
+        journal.complete([u'c'], '1:30:4')
+        journal.complete([u'd\xe9'], '1:40:5')
+        journal.close()
+
+        journal = CheckpointJournal(self.path)
+        self.assertEqual(journal.cursor, 'page-2')
+        self.assertEqual(journal.done, set([u'c', u'd\xe9']))
+        self.assertEqual(journal.position, '1:40:5')
+        journal.close()
+
+    def test_incomplete_line_is_ignored(self):
+        journal = CheckpointJournal(self.path)
+        journal.begin_page('page-1')
+        journal.complete([u'a'])
+        journal.close()
+        with open(self.path, 'ab') as journal_file:
+            journal_file.write('D 1:50:')
+
+        journal = CheckpointJournal(self.path)
+        self.assertEqual((journal.cursor, journal.done, journal.position), ('page-1', set([u'a']), None))
+        journal.reset()
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual(CheckpointJournal(self.path).cursor, None)
+
+
+class InterruptedHarvestTest(unittest.TestCase):
+    """Harvest PAGES the way a feed harvest does, into a JsonLinesSink with a checkpoint every two products, crash
+    part way through a page, and resume"""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.journal_path = os.path.join(self.directory, 'geogratis.ckpt')
+        self.output_path = os.path.join(self.directory, 'out.jl')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _harvest(self, sink_options, crash_at=None):
+        journal = CheckpointJournal(self.journal_path)
+        sink = JsonLinesSink(self.output_path, **sink_options)
+        if journal.position is not None:
+            sink.resume(journal.position)
+        first_page = 0
+        if journal.cursor:
+            first_page = int(journal.cursor.split('-')[1])
+        else:
+            journal.begin_page('page-0', sink.sync())
+        skip_ids = journal.done
+        completed = []
+        for page in range(first_page, len(PAGES)):
+            for geo_id in PAGES[page]:
+                if geo_id in skip_ids:
+                    continue
+                sink.write(json.dumps({'id': geo_id}))
+                if geo_id == crash_at:
+                    # The output reaches the disk, but the run ends before the journal records it
+                    sink.sync()
+                    sink.file.close()
+                    journal.close()
+                    raise _Crash()
+                completed.append(geo_id)
+                if len(completed) == 2:
+                    journal.complete(completed, sink.sync())
+                    completed = []
+            journal.complete(completed, sink.sync())
+            completed = []
+            skip_ids = ()
+            if page + 1 < len(PAGES):
+                journal.begin_page('page-%d' % (page + 1), sink.sync())
+        sink.close()
+        journal.reset()
+
+    def _output_ids(self):
+        return [json.loads(line)['id'] for path in output_files(self.output_path) for line in read_lines(path)]
+
+    def _check_resume(self, sink_options, crash_at):
+        self.assertRaises(_Crash, self._harvest, sink_options, crash_at)
+        self._harvest(sink_options)
+        self.assertEqual(self._output_ids(), [geo_id for page in PAGES for geo_id in page])
+
+    def test_resume_plain_output(self):
+        self._check_resume({}, '1-3')
+
+    def test_resume_after_the_last_product_of_a_page(self):
+        self._check_resume({}, '2-4')
+
+    def test_resume_gzip_output(self):
+        self._check_resume({'compression': 'gzip'}, '2-1')
+
+    def test_resume_bz2_output_on_the_first_product(self):
+        self._check_resume({'compression': 'bz2'}, '0-0')
+
+    def test_resume_rotated_output(self):
+        self._check_resume({'compression': 'gzip', 'max_records': 3}, '2-3')
+        with open(os.path.join(self.directory, 'out.manifest.json')) as manifest_file:
+            manifest = json.load(manifest_file)
+        self.assertEqual(manifest['records'], 20)
+        self.assertEqual([shard['records'] for shard in manifest['shards']], [3] * 6 + [2])
+        self.assertFalse(os.path.exists(os.path.join(self.directory, 'out-00008.jl.gz')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+import StringIO
+import logging
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import simplejson as json
+
+from ckanext.geogratis.checkpoint import CheckpointJournal
+from ckanext.geogratis.commands import GeogratisCommand
+from ckanext.geogratis.failures import FailureQueue
+from ckanext.geogratis.index import HarvestIndex
+from ckanext.geogratis.metrics import RunMetrics
+from ckanext.geogratis.sinks import CkanSink
+
+
+class _Synced(object):
+    """Stands in for a store that checkpoints make durable, counting how often it was synced"""
+    def __init__(self):
+        self.syncs = 0
+
+    def sync(self):
+        self.syncs += 1
+
+
+class _Session(object):
+    def remove(self):
+        pass
+
+
+class _SlowCkanSink(CkanSink):
+    """A CkanSink that takes its time loading each batch, and rejects the records in 'rejected'"""
+    def __init__(self, batch_size, rejected=()):
+        self.loaded_ids = []
+        self.rejected = rejected
+        CkanSink.__init__(self, batch_size)
+
+    def _connect(self):
+        self.model = type('Model', (object,), {'Session': _Session()})
+        self.site_user = 'site'
+
+    def _load_batch(self, batch):
+        time.sleep(0.2)
+        for odproduct in batch:
+            if odproduct['id'] in self.rejected:
+                self.failed.put((odproduct, 'package_create failed: rejected'))
+            else:
+                self.loaded_ids.append(odproduct['id'])
+
+
+class _CommandTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.command = command = GeogratisCommand('geogratis')
+        command.options, command.args = GeogratisCommand.parser.parse_args([])
+        command.metrics = RunMetrics()
+        command.profiler = None
+        command.display_formatted = False
+        command.output = None
+        command.output_file = StringIO.StringIO()
+        command.catalog = None
+        command.failures = None
+        command.index = None
+        command.delta_file = None
+        command.ckan_sink = None
+        command.report = None
+        command.watched = None
+        command.resuming_page = False
+        command.completed = []
+        command.ckan_rejected = set()
+        command.logger = logging.getLogger('test_commands')
+        command.logger.addHandler(logging.NullHandler())
+        command.logger.propagate = False
+        command.checkpoint = CheckpointJournal(os.path.join(self.directory, 'geogratis.ckpt'))
+
+    def tearDown(self):
+        self.command.checkpoint.close()
+        shutil.rmtree(self.directory)
+
+
+class CheckpointTest(_CommandTest):
+    def test_stores_are_synced_with_the_journal(self):
+        command = self.command
+        command.index = _Synced()
+        command.failures = _Synced()
+        command.checkpoint.begin_page('page-1', command._sync_output())
+        command.completed = [u'a', u'b']
+        command._complete_feed_records()
+        self.assertEqual((command.index.syncs, command.failures.syncs), (2, 2))
+        self.assertEqual(CheckpointJournal(command.checkpoint.path).done, set([u'a', u'b']))
+
+    def test_records_journaled_as_done_are_in_ckan(self):
+        command = self.command
+        command.options.noprint = True
+        command.failures = FailureQueue(os.path.join(self.directory, 'geogratis.failures'))
+        sink = command.ckan_sink = _SlowCkanSink(2, rejected=[u'c'])
+        command.checkpoint.begin_page('page-1', command._sync_output())
+        for geo_id in [u'a', u'b', u'c', u'd', u'e']:
+            command._write_od_dataset(geo_id, '1', {'id': geo_id})
+            command.completed.append(geo_id)
+        command._complete_feed_records()
+        # The run stops here without closing anything. A resumed run skips the records journaled as done, so
+        # they must already be in CKAN, or queued to be retried if CKAN rejected them.
+        done = CheckpointJournal(command.checkpoint.path).done
+        self.assertEqual(done, set([u'a', u'b', u'c', u'd', u'e']))
+        self.assertEqual(sorted(sink.loaded_ids), [u'a', u'b', u'd', u'e'])
+        self.assertEqual(command.failures.due(backoff=False), [u'c'])
+        command.failures.close()
+
+
+class HarvestIndexTest(_CommandTest):
+    def setUp(self):
+        _CommandTest.setUp(self)
+        self.command.index = HarvestIndex(os.path.join(self.directory, 'geogratis.index'))
+        self.command.delta_file = StringIO.StringIO()
+        self.command.options.noprint = True
+
+    def tearDown(self):
+        self.command.index.close()
+        _CommandTest.tearDown(self)
+
+    def test_unchanged_records_are_skipped(self):
+        command = self.command
+        odproduct = {'id': u'a', 'title': 'A'}
+        self.assertFalse(command._is_current(u'a', '1'))
+        command._write_od_dataset(u'a', '1', odproduct)
+        self.assertTrue(command._is_current(u'a', '1'))
+        self.assertFalse(command._is_current(u'a', '2'))
+        # Converted again without a change, the record is not written out again unless its page is being resumed
+        command._write_od_dataset(u'a', '2', odproduct)
+        self.assertEqual(command.metrics.counters['records_written'], 1)
+        command.resuming_page = True
+        self.assertFalse(command._is_current(u'a', '2'))
+        command._write_od_dataset(u'a', '2', odproduct)
+        self.assertEqual(command.metrics.counters['records_written'], 2)
+        self.assertEqual([json.loads(line)['change'] for line in command.delta_file.getvalue().splitlines()], ['new'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+
+from ckanext.geogratis.concurrency import AdaptiveRateLimiter
+
+
+class AdaptiveRateLimiterTest(unittest.TestCase):
+    def test_rate_rises_without_a_maximum(self):
+        limiter = AdaptiveRateLimiter(20)
+        for i in range(1000):
+            limiter.succeeded(0.1)
+        self.assertTrue(limiter.rate > 20, limiter.rate)
+        self.assertAlmostEqual(limiter.interval, 1.0 / limiter.rate)
+
+    def test_rate_rises_up_to_the_maximum(self):
+        limiter = AdaptiveRateLimiter(20, 25)
+        for i in range(1000):
+            limiter.succeeded(0.1)
+        self.assertEqual(limiter.rate, 25)
+        # Slow responses do not raise the rate
+        limiter = AdaptiveRateLimiter(20, 25)
+        limiter.succeeded(AdaptiveRateLimiter.healthy_latency + 1)
+        self.assertEqual(limiter.rate, 20)
+
+    def test_rate_is_halved_once_per_burst_of_failures(self):
+        limiter = AdaptiveRateLimiter(20)
+        for i in range(5):
+            limiter.overloaded()
+        self.assertEqual(limiter.rate, 10)
+
+    def test_no_limit(self):
+        limiter = AdaptiveRateLimiter(0)
+        limiter.succeeded(0.1)
+        limiter.overloaded()
+        self.assertEqual(limiter.interval, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
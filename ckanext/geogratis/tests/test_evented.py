@@ -0,0 +1,210 @@
+import BaseHTTPServer
+import SocketServer
+import logging
+import threading
+import time
+import unittest
+import urllib2
+
+import simplejson as json
+
+from ckanext.geogratis import evented
+from ckanext.geogratis.concurrency import AdaptiveRateLimiter, RateLimiter
+from ckanext.geogratis.evented import EventedHarvest, EventLoop
+from ckanext.geogratis.metrics import RunMetrics
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = '{"path": "%s"}' % self.path
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _FlakyFeedHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """A feed of three pages of two products each, failing the first request for every URL with a 503, and every
+    request for the pages in 'broken'. Requests for the paths in 'dropped' are closed without a response."""
+    requested = {}
+    broken = set()
+    dropped = set()
+
+    def do_GET(self):
+        count = self.requested[self.path] = self.requested.get(self.path, 0) + 1
+        if self.path in self.dropped:
+            self.close_connection = 1
+            return
+        if count == 1 or self.path in self.broken:
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.path.startswith('/page/'):
+            number = int(self.path.split('/')[-1])
+            body = json.dumps({'count': 2, 'products': [{'id': '%d-%d' % (number, i)} for i in range(2)],
+                               'next': '/page/%d' % (number + 1) if number < 3 else None})
+        else:
+            body = json.dumps({'path': self.path})
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Command(object):
+    """The parts of GeogratisCommand that an EventedHarvest uses"""
+    retries = 3
+    failures = None
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.rate_limiter = AdaptiveRateLimiter(0)
+        self.metrics = RunMetrics()
+        self.logger = logging.getLogger('test_evented')
+        self.logger.addHandler(logging.NullHandler())
+        self.logger.propagate = False
+        self.imported = []
+
+    def _in_shard(self, geo_id):
+        return True
+
+    def _is_repeated(self, product):
+        return False
+
+    def _get_next_link(self, page):
+        return self.base_url + page['next'] if page['next'] else None
+
+    def _get_item_url(self, geo_id, lang):
+        return '%s/%s/%s.json' % (self.base_url, lang, geo_id)
+
+    def _decode_feed_json(self, link, json_data):
+        json_obj = json.loads(json_data)
+        json_obj['url'] = link
+        return json_obj
+
+    def _finish_feed_page(self, page):
+        self.imported.append(page['url'])
+
+    def _import_feed_record(self, geo_id, record):
+        if isinstance(record, urllib2.URLError):
+            self.imported.append((geo_id, 'failed'))
+        else:
+            self.imported.append((geo_id, record[0]['path'], record[1]['path']))
+
+
+class _Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass
+
+
+class _ServerTest(unittest.TestCase):
+    handler = _Handler
+
+    def setUp(self):
+        self.server = _Server(('127.0.0.1', 0), self.handler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class EventLoopTest(_ServerTest):
+    def test_rate_limit_does_not_block_the_loop(self):
+        loop = EventLoop(4, 5, RateLimiter(10))
+        results = []
+        start = time.time()
+        for i in range(6):
+            loop.get('%s/%d.json' % (self.url, i), lambda body, error: results.append((body, error)))
+        # Requests wait for their time slots on the loop, not in get()
+        self.assertTrue(time.time() - start < 0.05)
+        longest = 0
+        while len(results) < 6:
+            started = time.time()
+            loop.run_once()
+            longest = max(longest, time.time() - started)
+        elapsed = time.time() - start
+        loop.close()
+        self.assertEqual(sorted(body for body, error in results), ['{"path": "/%d.json"}' % i for i in range(6)])
+        # Six requests at ten a second, without run_once ever waiting longer than its timeout
+        self.assertTrue(elapsed >= 0.45, elapsed)
+        self.assertTrue(longest < 0.09, longest)
+
+    def test_cancel_request_waiting_for_its_time_slot(self):
+        loop = EventLoop(4, 5, RateLimiter(10))
+        results = []
+        first = loop.get('%s/1.json' % self.url, lambda body, error: results.append(1))
+        second = loop.get('%s/2.json' % self.url, lambda body, error: results.append(2))
+        loop.cancel(second)
+        start = time.time()
+        while time.time() - start < 0.3:
+            loop.run_once()
+        loop.close()
+        self.assertEqual(results, [1])
+        self.assertTrue(first.finished)
+
+
+class EventedHarvestTest(_ServerTest):
+    handler = _FlakyFeedHandler
+
+    def setUp(self):
+        _ServerTest.setUp(self)
+        _FlakyFeedHandler.requested.clear()
+        _FlakyFeedHandler.broken.clear()
+        _FlakyFeedHandler.dropped.clear()
+        self.retry_delay = evented.retry_delay
+        evented.retry_delay = lambda attempt, retry_after=None: 0.01
+        self.command = _Command(self.url)
+        first_page = self.command._decode_feed_json(self.url + '/page/1', json.dumps(
+            {'count': 2, 'products': [{'id': '1-0'}, {'id': '1-1'}], 'next': '/page/2'}))
+        self.harvest = EventedHarvest(self.command, first_page, 4, 5)
+
+    def tearDown(self):
+        evented.retry_delay = self.retry_delay
+        _ServerTest.tearDown(self)
+
+    def _record(self, geo_id):
+        return geo_id, '/en/%s.json' % geo_id, '/fr/%s.json' % geo_id
+
+    def test_failed_requests_are_retried(self):
+        self.assertTrue(self.harvest.run())
+        self.assertEqual(self.command.imported,
+                         [self._record('1-0'), self._record('1-1'), self.url + '/page/1',
+                          self._record('2-0'), self._record('2-1'), self.url + '/page/2',
+                          self._record('3-0'), self._record('3-1'), self.url + '/page/3'])
+        self.assertEqual(self.command.metrics.counters['retries'], 14)
+
+    def test_record_that_cannot_be_retrieved_is_an_error_without_a_failure_queue(self):
+        _FlakyFeedHandler.dropped.add('/en/2-1.json')
+        self.assertRaises(urllib2.URLError, self.harvest.run)
+        self.assertEqual(self.command.imported[-1], self._record('2-0'))
+
+    def test_record_that_cannot_be_retrieved_is_queued(self):
+        _FlakyFeedHandler.dropped.add('/en/2-1.json')
+        self.command.failures = []
+        self.assertTrue(self.harvest.run())
+        self.assertEqual(self.command.imported[3:6], [self._record('2-0'), ('2-1', 'failed'), self.url + '/page/2'])
+        self.assertEqual(len(self.command.imported), 9)
+
+    def test_page_that_cannot_be_retrieved_is_an_error(self):
+        _FlakyFeedHandler.broken.add('/page/3')
+        self.assertRaises(urllib2.URLError, self.harvest.run)
+        # The records before the page are imported, and the page was tried once more for every retry
+        self.assertEqual(self.command.imported[-1], self.url + '/page/2')
+        self.assertEqual(_FlakyFeedHandler.requested['/page/3'], 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import threading
+import time
+import unittest
+
+from ckanext.geogratis.feed import FeedPrefetcher
+
+
+def _next_link(page):
+    return page.get('next')
+
+
+class _Feed(object):
+    """A feed of numbered pages, each page streamed one product at a time, recording the pages requested and the
+    products produced"""
+    def __init__(self, pages, products_per_page):
+        self.pages = pages
+        self.products_per_page = products_per_page
+        self.requested = []
+        self.produced = 0
+        self.lock = threading.Lock()
+
+    def page(self, number):
+        return {'number': number, 'count': self.products_per_page, 'products': [],
+                'next': number + 1 if number < self.pages else None}
+
+    def stream_page(self, number):
+        self.requested.append(number)
+        return self._stream(number)
+
+    def _stream(self, number):
+        for i in xrange(self.products_per_page):
+            with self.lock:
+                self.produced += 1
+            yield 'product', {'id': '%d-%d' % (number, i)}
+        yield 'page', self.page(number)
+
+
+class FeedPrefetcherTest(unittest.TestCase):
+    def _wait_for_producer(self, feed):
+        # Give the reading thread time to get as far ahead as it is allowed to
+        produced = -1
+        while produced != feed.produced:
+            produced = feed.produced
+            time.sleep(0.1)
+
+    def test_queue_stays_bounded_on_large_streamed_page(self):
+        feed = _Feed(2, 100000)
+        first_page = feed.page(1)
+        pages = FeedPrefetcher(feed.stream_page, _next_link, first_page, depth=1, max_queued=100)
+        try:
+            consumed = 0
+            for kind, value in pages:
+                if kind == 'product':
+                    consumed += 1
+                    if consumed % 25000 == 0:
+                        self._wait_for_producer(feed)
+                        self.assertTrue(pages.entries.qsize() <= 100)
+                        self.assertTrue(feed.produced - consumed <= 102, (feed.produced, consumed))
+            self.assertEqual(consumed, 100000)
+        finally:
+            pages.close()
+
+    def test_pages_fetched_ahead(self):
+        feed = _Feed(10, 3)
+        pages = FeedPrefetcher(feed.stream_page, _next_link, feed.page(1), depth=1)
+        try:
+            entries = iter(pages)
+            # While the end of the first page is being dealt with, only the second page is read ahead
+            while next(entries)[0] != 'page':
+                pass
+            self._wait_for_producer(feed)
+            self.assertEqual(feed.requested, [2])
+            # Moving on to the second page lets the third be read
+            self.assertEqual(next(entries)[0], 'product')
+            self._wait_for_producer(feed)
+            self.assertEqual(feed.requested, [2, 3])
+        finally:
+            pages.close()
+
+    def test_reads_every_page_and_stops_when_closed(self):
+        feed = _Feed(5, 3)
+        pages = FeedPrefetcher(feed.stream_page, _next_link, feed.page(1), depth=2)
+        kinds = [kind for kind, value in pages]
+        self.assertEqual(kinds, ['page'] + (['product'] * 3 + ['page']) * 4)
+        self.assertTrue(pages.exhausted)
+
+        feed = _Feed(3, 1000)
+        pages = FeedPrefetcher(feed.stream_page, _next_link, feed.page(1), max_queued=10)
+        self._wait_for_producer(feed)
+        pages.close()
+        pages.thread.join(5)
+        self.assertFalse(pages.thread.is_alive())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from ckanext.geogratis.index import HarvestIndex
+
+
+def _odproduct(geo_id, title, release_date='2014-01-01'):
+    return {'id': geo_id, 'title': title, 'portal_release_date': release_date}
+
+
+class HarvestIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'geogratis.index')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_unchanged_records_are_current(self):
+        index = HarvestIndex(self.path)
+        self.assertFalse(index.is_current(u'a', '2014-01-01T00:00:00Z'))
+        self.assertEqual(index.update(u'a', '2014-01-01T00:00:00Z', _odproduct(u'a', 'A')), 'new')
+        index.close()
+
+        index = HarvestIndex(self.path)
+        self.assertTrue(index.is_current(u'a', '2014-01-01T00:00:00Z'))
+        # Edited in Geogratis since, or without a date to tell
+        self.assertFalse(index.is_current(u'a', '2014-02-01T00:00:00Z'))
+        self.assertFalse(index.is_current(u'a', None))
+        index.close()
+
+    def test_changes_ignore_the_release_date(self):
+        index = HarvestIndex(self.path)
+        index.update(u'a', '1', _odproduct(u'a', 'A'))
+        self.assertEqual(index.update(u'a', '2', _odproduct(u'a', 'A', '2015-01-01')), None)
+        self.assertEqual(index.update(u'a', '3', _odproduct(u'a', 'B')), 'changed')
+        self.assertTrue(index.is_current(u'a', '3'))
+        index.close()
+
+    def test_records_not_seen_are_removed(self):
+        index = HarvestIndex(self.path)
+        for geo_id in (u'a', u'b', u'c', u'd'):
+            index.update(geo_id, '1', _odproduct(geo_id, geo_id))
+        index.close()
+
+        index = HarvestIndex(self.path)
+        index.mark_seen(u'a')
+        # Only records that the run could have seen are removed, e.g. those in its shard
+        self.assertEqual(sorted(index.remove_unseen(lambda geo_id: geo_id != u'd')), [u'b', u'c'])
+        index.close()
+
+        index = HarvestIndex(self.path)
+        self.assertTrue(index.is_current(u'a', '1'))
+        self.assertFalse(index.is_current(u'b', '1'))
+        self.assertTrue(index.is_current(u'd', '1'))
+        self.assertEqual(sorted(index.remove_unseen()), [u'a', u'd'])
+        index.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+import StringIO
+import unittest
+
+import simplejson as json
+
+from ckanext.geogratis.jsonstream import JsonStream
+
+DOCUMENT = {
+    u'count': 12345,
+    u'ratio': -1.5e-3,
+    u'title': u'Carte topographique — \xc9t\xe9',
+    u'products': [{u'id': u'a', u'links': []}, {u'id': u'é', u'nested': {u'x': [1, 2, [3]]}}, None, True],
+    u'empty': [],
+    u'none': None,
+    u'last': False,
+}
+
+
+class JsonStreamTest(unittest.TestCase):
+    def _stream(self, text, chunk_size):
+        return JsonStream(StringIO.StringIO(text), chunk_size)
+
+    def test_whole_object_in_any_chunk_size(self):
+        # Small chunks split multi-byte characters, numbers, literals and strings
+        text = json.dumps(DOCUMENT, ensure_ascii=False, indent=1).encode('utf-8')
+        for chunk_size in (1, 2, 3, 7, 64, 65536):
+            self.assertEqual(self._stream(text, chunk_size).load(), DOCUMENT, chunk_size)
+
+    def test_items_of_streamed_arrays_are_yielded_one_at_a_time(self):
+        text = '{"count": 2, "products": [{"id": "a"}, [1, 2], null], "empty": [], "title": "x", "next": [3]}'
+        for chunk_size in (1, 5, 65536):
+            members = list(self._stream(text, chunk_size).members(streamed=('products', 'empty', 'count')))
+            # An empty streamed array yields nothing, and a streamed key whose value is not an array is yielded whole
+            self.assertEqual(members, [(u'count', 2), (u'products', {u'id': u'a'}), (u'products', [1, 2]),
+                                       (u'products', None), (u'title', u'x'), (u'next', [3])])
+
+    def test_only_the_unparsed_text_is_kept(self):
+        products = [{'id': '%05d' % i, 'title': 'x' * 100} for i in range(1000)]
+        stream = self._stream('{"products": %s, "count": 1000}' % json.dumps(products), 1024)
+        longest = 0
+        for key, value in stream.members(streamed=('products',)):
+            longest = max(longest, len(stream.buffer))
+        self.assertEqual(value, 1000)
+        self.assertTrue(longest < 4096, longest)
+
+    def test_values_spanning_many_chunks(self):
+        text = json.dumps({'big': 'y' * 100000, 'list': range(10000)})
+        self.assertEqual(self._stream(text, 16).load(), json.loads(text))
+
+    def test_empty_object(self):
+        self.assertEqual(self._stream(' { } ', 1).load(), {})
+
+    def test_malformed_input(self):
+        for text in ('', '[]', '{"a": 1', '{"a" 1}', '{"a": 1 "b": 2}', '{1: 2}', '{"a": [1 2]}', '{"a": tru}'):
+            self.assertRaises(ValueError, self._stream(text, 4).load)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import csv
+import os
+import shutil
+import tempfile
+import unittest
+
+from ckanext.geogratis.report import FIELDNAMES, ImportReport
+
+
+def _odproduct(geo_id, series=u''):
+    return {'id': geo_id, 'title': u'\xc9t\xe9 %s' % geo_id, 'title_fra': u'Summer %s' % geo_id,
+            'notes': u'Notes', 'notes_fra': u'Notes', 'topic_category': [u'economy'], 'date_published': u'2014-01-01',
+            'browse_graphic_url': u'/static/img/canada_default.png', 'data_series_name': series,
+            'data_series_name_fra': series, 'data_series_issue_identification': u'',
+            'data_series_issue_identification_fra': u''}
+
+
+class ImportReportTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'report.csv')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _report(self, report):
+        report.record(_odproduct(u'a', u'Roads'), True, '')
+        report.record(_odproduct(u'b'), False, 'Missing keywords; Invalid date;')
+        report.missing_french(u'c', u'\xc9t\xe9 c')
+        report.ckan_failure(_odproduct(u'a', u'Roads'), 'package_update failed: rejected')
+        report.close()
+
+    def test_rows_are_written_out(self):
+        self._report(ImportReport(self.path))
+        with open(self.path, 'rb') as report_file:
+            reader = csv.DictReader(report_file)
+            rows = list(reader)
+        self.assertEqual(reader.fieldnames, list(FIELDNAMES))
+        self.assertEqual([(row['ID'], row['Pass or Fail']) for row in rows],
+                         [('a', 'True'), ('b', 'False'), ('c', 'False'), ('a', 'False')])
+        self.assertEqual((rows[0]['Title (EN)'], rows[0]['Series (EN)'], rows[0]['Browse Images']),
+                         ('\xc3\x89t\xc3\xa9 a', 'Y', 'N'))
+        self.assertEqual((rows[2]['Title (EN)'], rows[2]['Title (FR)'], rows[2]['Summary (EN)']),
+                         ('\xc3\x89t\xc3\xa9 c', '', ''))
+        self.assertEqual(rows[3]['Reason for Failure'], 'package_update failed: rejected')
+
+    def test_summary(self):
+        # Without a path only the statistics are kept
+        report = ImportReport()
+        report.record(_odproduct(u'd'), False, 'Invalid date')
+        self._report(report)
+        self.assertEqual(dict(report.missing_fields), {'Browse Images': 3, 'Series (EN)': 2, 'Series (FR)': 2,
+                                                       'Series Issue (EN)': 3, 'Series Issue (FR)': 3})
+        lines = report.summary(top=1).splitlines()
+        self.assertEqual(lines[:2], ['4 records imported: 1 passed, 3 failed', '1 records rejected by CKAN'])
+        self.assertTrue(lines[2].startswith('Missing fields: '), lines[2])
+        self.assertEqual(lines[3], 'Top reasons for failure: Invalid date 2')
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_errors_on_the_background_thread_are_raised_by_close(self):
+        report = ImportReport(self.path, max_pending=1)
+        report.record({'id': u'a'}, True, '')
+        # Later records are not reported, but do not block either
+        for i in range(5):
+            report.record(_odproduct(u'b'), True, '')
+        self.assertRaises(KeyError, report.close)
+        self.assertEqual(report.passed, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
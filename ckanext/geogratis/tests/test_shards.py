@@ -0,0 +1,72 @@
+import StringIO
+import os
+import shutil
+import tempfile
+import unittest
+
+import simplejson as json
+
+from ckanext.geogratis.shards import merge_records
+from ckanext.geogratis.sinks import JsonLinesSink
+
+
+def _record(geo_id, date_modified):
+    return json.dumps({'id': geo_id, 'date_modified': date_modified, 'title': 'Record %s' % geo_id})
+
+
+class MergeRecordsTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _write(self, name, records, compression=None, max_records=0):
+        path = os.path.join(self.directory, name)
+        sink = JsonLinesSink(path, compression, max_records=max_records)
+        for i, record in enumerate(records):
+            sink.write(record)
+            if i % 3 == 0:
+                # Every sync ends a compressed stream, so the files hold several
+                sink.sync()
+        sink.close()
+        return path
+
+    def _merge(self, paths):
+        output = StringIO.StringIO()
+        read, written = merge_records(paths, output)
+        return read, written, [json.loads(line) for line in output.getvalue().splitlines()]
+
+    def test_merge_compressed_and_rotated_shards(self):
+        first = self._write('first.jl', [_record('a%d' % i, '2020-01-01') for i in range(10)] +
+                            [_record('shared', '2020-01-01')], 'gzip')
+        second = self._write('second.jl', [_record('b%d' % i, '2020-01-01') for i in range(25)] +
+                             [_record('shared', '2021-01-01')], 'gzip', max_records=4)
+        third = self._write('third.jl', [_record('c%d' % i, '2020-01-01') for i in range(5)], 'bz2', max_records=2)
+        self.assertTrue(os.path.exists(os.path.join(self.directory, 'second-00007.jl.gz')))
+
+        read, written, records = self._merge([first + '.gz', os.path.join(self.directory, 'second.manifest.json'),
+                                              third])
+        self.assertEqual(read, 42)
+        self.assertEqual(written, 41)
+        self.assertEqual([record['id'] for record in records],
+                         ['a%d' % i for i in range(10)] + ['b%d' % i for i in range(25)] + ['shared'] +
+                         ['c%d' % i for i in range(5)])
+        self.assertEqual([record['date_modified'] for record in records if record['id'] == 'shared'],
+                         ['2021-01-01'])
+
+    def test_single_file_of_rotated_output_is_rejected(self):
+        self._write('rotated.jl', [_record('a%d' % i, '2020-01-01') for i in range(5)], max_records=2)
+        self.assertRaises(ValueError, self._merge, [os.path.join(self.directory, 'rotated-00001.jl')])
+
+    def test_merge_plain_shards(self):
+        first = self._write('first.jl', [_record('a', '2020-01-01'), _record('b', '2020-01-01')])
+        second = self._write('second.jl', [_record('a', '2019-01-01'), _record('c', '2020-01-01')])
+        read, written, records = self._merge([first, second])
+        self.assertEqual((read, written), (4, 3))
+        self.assertEqual([(record['id'], record['date_modified']) for record in records],
+                         [('a', '2020-01-01'), ('b', '2020-01-01'), ('c', '2020-01-01')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+import simplejson as json
+
+from ckanext.geogratis.sinks import JsonLinesSink, output_files, read_lines
+
+
+class JsonLinesSinkTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'out.jl')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _lines(self, path=None):
+        return [line for name in output_files(path or self.path) for line in read_lines(name)]
+
+    def test_position_counts_shard_bytes_and_records(self):
+        sink = JsonLinesSink(self.path)
+        self.assertEqual(sink.sync(), '1:0:0')
+        sink.write('{"id": "a"}')
+        sink.write(u'{"id": "\xe9"}')
+        self.assertEqual(sink.sync(), '1:%d:2' % os.path.getsize(self.path))
+        sink.close()
+        self.assertEqual(self._lines(), ['{"id": "a"}\n', '{"id": "\xc3\xa9"}\n'])
+
+    def test_resume_discards_what_was_written_after_the_position(self):
+        sink = JsonLinesSink(self.path)
+        sink.write('a')
+        position = sink.sync()
+        sink.write('b')
+        sink.sync()
+        sink.file.close()
+
+        sink = JsonLinesSink(self.path)
+        sink.resume(position)
+        sink.write('c')
+        self.assertEqual(sink.sync(), '1:4:2')
+        sink.close()
+        self.assertEqual(self._lines(), ['a\n', 'c\n'])
+
+    def test_resume_from_a_byte_offset(self):
+        # Earlier versions recorded only the offset in the uncompressed file
+        with open(self.path, 'wb') as out_file:
+            out_file.write('a\nb\n')
+        sink = JsonLinesSink(self.path)
+        sink.resume('2')
+        sink.write('c')
+        sink.close()
+        self.assertEqual(self._lines(), ['a\n', 'c\n'])
+
+    def test_compressed_streams_are_read_back_in_turn(self):
+        for compression in ('gzip', 'bz2'):
+            sink = JsonLinesSink(self.path, compression)
+            for i in range(3):
+                sink.write(str(i))
+                sink.sync()
+            position = sink.sync()
+            sink.write('dropped')
+            sink.sync()
+            sink.file.close()
+
+            sink = JsonLinesSink(self.path, compression)
+            sink.resume(position)
+            sink.write('3')
+            sink.close()
+            self.assertEqual(self._lines(), ['0\n', '1\n', '2\n', '3\n'], compression)
+
+    def test_rotated_shards_are_listed_in_the_manifest(self):
+        sink = JsonLinesSink(self.path, 'gzip', max_records=2)
+        for i in range(5):
+            sink.write(str(i))
+        sink.close()
+        with open(os.path.join(self.directory, 'out.manifest.json')) as manifest_file:
+            manifest = json.load(manifest_file)
+        self.assertEqual((manifest['compression'], manifest['records']), ('gz', 5))
+        self.assertEqual([shard['file'] for shard in manifest['shards']],
+                         ['out-00001.jl.gz', 'out-00002.jl.gz', 'out-00003.jl.gz'])
+        for shard in manifest['shards']:
+            with open(os.path.join(self.directory, shard['file']), 'rb') as shard_file:
+                data = shard_file.read()
+            self.assertEqual((len(data), hashlib.sha256(data).hexdigest()), (shard['bytes'], shard['sha256']))
+        self.assertEqual(self._lines(), ['%d\n' % i for i in range(5)])
+
+    def test_resume_drops_shards_rotated_after_the_position(self):
+        sink = JsonLinesSink(self.path, max_records=2)
+        sink.write('0')
+        sink.write('1')
+        sink.write('2')
+        position = sink.sync()
+        for i in range(4):
+            sink.write('dropped')
+        sink.sync()
+        sink.file.close()
+
+        sink = JsonLinesSink(self.path, max_records=2)
+        sink.resume(position)
+        sink.write('3')
+        sink.close()
+        with open(os.path.join(self.directory, 'out.manifest.json')) as manifest_file:
+            manifest = json.load(manifest_file)
+        self.assertEqual([shard['records'] for shard in manifest['shards']], [2, 2])
+        self.assertFalse(os.path.exists(os.path.join(self.directory, 'out-00003.jl')))
+        self.assertEqual(self._lines(), ['0\n', '1\n', '2\n', '3\n'])
+
+    def test_empty_rotated_output(self):
+        JsonLinesSink(self.path, max_records=2).close()
+        self.assertEqual(os.listdir(self.directory), ['out.manifest.json'])
+        self.assertEqual(self._lines(), [])
+
+
+class OutputFilesTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'out.jl')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_single_file(self):
+        self.assertEqual(output_files(self.path), [self.path])
+        JsonLinesSink(self.path, 'bz2').close()
+        # Found with the suffix of its compression
+        self.assertEqual(output_files(self.path), [self.path + '.bz2'])
+
+    def test_rotated_output(self):
+        sink = JsonLinesSink(self.path, max_records=1)
+        sink.write('0')
+        sink.write('1')
+        sink.close()
+        shards = [os.path.join(self.directory, 'out-00001.jl'), os.path.join(self.directory, 'out-00002.jl')]
+        self.assertEqual(output_files(self.path), shards)
+        self.assertEqual(output_files(os.path.join(self.directory, 'out.manifest.json')), shards)
+        # A single shard would leave out the records in the others
+        self.assertRaises(ValueError, output_files, shards[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
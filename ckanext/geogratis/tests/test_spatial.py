@@ -0,0 +1,88 @@
+import math
+import random
+import time
+import unittest
+
+import simplejson as json
+
+from ckanext.geogratis.spatial import SpatialEncoder
+
+
+def _best_time(function, repeat=5):
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        function()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def _outline(vertices):
+    """A closed, jagged outline around a point in Canada, with unicode keys as decoded from a Geogratis record"""
+    rng = random.Random(42)
+    ring = []
+    for i in range(vertices):
+        angle = 2 * math.pi * i / vertices
+        radius = 5 + rng.uniform(-0.01, 0.01)
+        ring.append([-95 + radius * math.cos(angle), 60 + radius * math.sin(angle)])
+    ring.append(list(ring[0]))
+    return {u'type': u'Polygon', u'coordinates': [ring]}
+
+
+class SpatialEncoderTest(unittest.TestCase):
+    def test_coordinates_are_rounded(self):
+        encoded = SpatialEncoder().encode({u'type': u'Point', u'coordinates': [-80.123456789, 43.1]})
+        self.assertEqual(encoded, '{"type":"Point","coordinates":[-80.123457,43.1]}')
+
+    def test_full_precision(self):
+        encoded = SpatialEncoder(None).encode({u'type': u'Point', u'coordinates': [-80.123456789, 43.1]})
+        self.assertEqual(json.loads(encoded)['coordinates'], [-80.123456789, 43.1])
+
+    def test_integers_are_kept(self):
+        rectangle = [[-80, 43], [-79, 43], [-79, 44], [-80, 44], [-80, 43]]
+        encoded = SpatialEncoder().encode({u'type': u'Polygon', u'coordinates': [rectangle]})
+        self.assertEqual(encoded, '{"type":"Polygon","coordinates":[[[-80,43],[-79,43],[-79,44],[-80,44],[-80,43]]]}')
+
+    def test_output_is_valid_json(self):
+        encoder = SpatialEncoder()
+        for geometry in [{u'type': u'Point', u'coordinates': [True, False]},
+                         {u'type': u'LineString', u'coordinates': [[1.5, None], [2, 3.25]]},
+                         {u'type': u'GeometryCollection', u'geometries': [
+                             {u'type': u'Point', u'coordinates': [1e-7, -1e21]},
+                             {u'type': u'MultiPoint', u'coordinates': [[0.1, 0.2], [0.3, 0.4]]}]},
+                         {u'type': u'Unknown', u'coordinates': u'caf\xe9'},
+                         [1, 2]]:
+            # Raises if the output is not JSON
+            json.loads(encoder.encode(geometry))
+        self.assertEqual(encoder.encode({u'type': u'Point', u'coordinates': [True, False]}),
+                         '{"type":"Point","coordinates":[true,false]}')
+
+    def test_simplification(self):
+        geometry = _outline(2000)
+        ring = json.loads(SpatialEncoder(tolerance=0.05).encode(geometry))['coordinates'][0]
+        self.assertTrue(4 <= len(ring) < 200, len(ring))
+        self.assertEqual(ring[0], ring[-1])
+        # A tolerance larger than the shape never collapses the ring
+        ring = json.loads(SpatialEncoder(tolerance=100).encode(geometry))['coordinates'][0]
+        self.assertTrue(len(ring) >= 4)
+        self.assertEqual(ring[0], ring[-1])
+
+    def test_rectangles_are_not_simplified(self):
+        rectangle = [[-80.5, 43.5], [-79.5, 43.5], [-79.5, 44.5], [-80.5, 44.5], [-80.5, 43.5]]
+        encoded = SpatialEncoder(tolerance=10).encode({u'type': u'Polygon', u'coordinates': [rectangle]})
+        self.assertEqual(json.loads(encoded)['coordinates'], [rectangle])
+
+    def test_encoding_time_against_str(self):
+        geometry = _outline(20000)
+        encoder = SpatialEncoder()
+        self.assertEqual(len(json.loads(encoder.encode(geometry))['coordinates'][0]), 20001)
+        old = _best_time(lambda: str(geometry).replace("'", '"'))
+        new = _best_time(lambda: encoder.encode(geometry))
+        # Rounding and one call to the encoder keeps within a small factor of the old repr of the whole geometry
+        self.assertTrue(new < 3 * old, 'Encoding took %.3f s against %.3f s with str()' % (new, old))
+
+
+if __name__ == '__main__':
+    unittest.main()
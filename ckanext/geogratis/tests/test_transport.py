@@ -0,0 +1,86 @@
+import BaseHTTPServer
+import SocketServer
+import os
+import threading
+import time
+import unittest
+import zlib
+
+from ckanext.geogratis.transport import HttpTransport
+
+# Mostly incompressible data, so that the body arrives in many chunks, with some long runs that decompress to
+# large ones
+BODY = ''.join(os.urandom(1 << 21) + 'x' * 60000 for i in range(16))
+_compressor = zlib.compressobj(1, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+GZIP_BODY = _compressor.compress(BODY) + _compressor.flush()
+
+
+class _GzipHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(GZIP_BODY)))
+        self.end_headers()
+        self.wfile.write(GZIP_BODY)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    # Pooled connections are kept open by the transport, so each is served on a thread of its own
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Connections still open in the transport's pool are cut off when the test ends
+        pass
+
+
+class HttpTransportTest(unittest.TestCase):
+    def setUp(self):
+        self.server = _Server(('127.0.0.1', 0), _GzipHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%d/body.json' % self.server.server_address[1]
+        self.transport = HttpTransport()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_read_large_compressed_body(self):
+        start = time.time()
+        body = self.transport.open(self.url).read()
+        elapsed = time.time() - start
+        self.assertEqual(len(body), len(BODY))
+        self.assertEqual(body, BODY)
+        # Joining the chunks once keeps this linear in the size of the body
+        self.assertTrue(elapsed < 1, 'Reading %d bytes took %.2f s' % (len(BODY), elapsed))
+
+    def test_sized_reads_of_large_compressed_body(self):
+        response = self.transport.open(self.url)
+        parts = []
+        start = time.time()
+        for size in [1, 7, 1000, 65536, 300000] * 100:
+            data = response.read(size)
+            if not data:
+                break
+            self.assertTrue(len(data) <= size)
+            parts.append(data)
+        elapsed = time.time() - start
+        self.assertEqual(''.join(parts), BODY)
+        self.assertEqual(response.read(10), '')
+        self.assertTrue(elapsed < 2, 'Reading %d bytes took %.2f s' % (len(BODY), elapsed))
+
+    def test_connection_is_reused_after_reading_to_the_end(self):
+        self.transport.open(self.url).read()
+        self.transport.open(self.url).read()
+        self.assertEqual(self.transport.stats['connections_opened'], 1)
+        self.assertEqual(self.transport.stats['connections_reused'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,214 @@
+import Queue
+import collections
+import httplib
+import socket
+import threading
+import urllib2
+import urlparse
+import zlib
+
+
+class HttpResponse(object):
+    """A response body read from a pooled connection, decompressed as it is read
+
+    The connection goes back to its pool once the body has been read to the end, and is
+    discarded if the response is closed early. Decompressed chunks are kept as they are until
+    read, and joined only once for each read, so that large bodies are not copied over and over.
+
+    """
+    chunk_size = 65536
+
+    def __init__(self, transport, pool_key, conn, response, url):
+        self.transport = transport
+        self.pool_key = pool_key
+        self.conn = conn
+        self.response = response
+        self.url = url
+        self.status = response.status
+        self.headers = response.msg
+        self.chunks = collections.deque()
+        self.offset = 0  # of the first unread byte in the first chunk
+        self.buffered = 0
+        self.eof = False
+        encoding = (response.getheader('content-encoding') or '').lower()
+        if encoding == 'gzip':
+            self.decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == 'deflate':
+            self.decoder = zlib.decompressobj()
+        else:
+            self.decoder = None
+        self.raw_deflate = encoding == 'deflate'
+
+    def getheader(self, name, default=None):
+        return self.response.getheader(name, default)
+
+    def _decode(self, data):
+        if not self.decoder:
+            return data
+        if self.raw_deflate:
+            # Some servers send a raw deflate stream without the zlib header, which shows on the first chunk
+            self.raw_deflate = False
+            try:
+                return self.decoder.decompress(data)
+            except zlib.error:
+                self.decoder = zlib.decompressobj(-zlib.MAX_WBITS)
+        return self.decoder.decompress(data)
+
+    def _append(self, data):
+        if data:
+            self.chunks.append(data)
+            self.buffered += len(data)
+
+    def _fill(self):
+        data = self.response.read(self.chunk_size)
+        if not data:
+            if self.decoder:
+                self._append(self.decoder.flush())
+            self.eof = True
+            self.close()
+            return
+        decoded = self._decode(data)
+        self.transport._count(len(data), len(decoded))
+        self._append(decoded)
+
+    def read(self, size=-1):
+        while not self.eof and (size < 0 or self.buffered < size):
+            self._fill()
+        if size < 0 or size > self.buffered:
+            size = self.buffered
+        parts = []
+        needed = size
+        while needed:
+            chunk = self.chunks[0]
+            available = len(chunk) - self.offset
+            if available <= needed:
+                parts.append(chunk[self.offset:] if self.offset else chunk)
+                self.chunks.popleft()
+                self.offset = 0
+                needed -= available
+            else:
+                parts.append(chunk[self.offset:self.offset + needed])
+                self.offset += needed
+                needed = 0
+        self.buffered -= size
+        return ''.join(parts)
+
+    def close(self):
+        if self.conn is None:
+            return
+        if self.eof and not self.response.will_close:
+            self.transport._release(self.pool_key, self.conn)
+        else:
+            self.conn.close()
+        self.conn = None
+
+
+class HttpTransport(object):
+    """Keep-alive HTTP client shared by every request made to Geogratis
+
+    Idle connections are kept in a pool per host and reused by later requests from any thread.
+    Responses are requested with gzip or deflate compression and decompressed while they are read.
+    Errors are raised as urllib2.URLError and urllib2.HTTPError so callers can treat this the same
+    way as urllib2.urlopen.
+
+    """
+    max_redirects = 5
+
+    def __init__(self, timeout=10, pool_size=4):
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.pools = {}
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0,
+                      'connections_opened': 0,
+                      'connections_reused': 0,
+                      'bytes_received': 0,
+                      'bytes_decoded': 0}
+
+    def _count(self, received, decoded):
+        with self.lock:
+            self.stats['bytes_received'] += received
+            self.stats['bytes_decoded'] += decoded
+
+    def _acquire(self, pool_key):
+        with self.lock:
+            pool = self.pools.setdefault(pool_key, Queue.Queue(self.pool_size))
+        try:
+            conn = pool.get_nowait()
+            reused = True
+        except Queue.Empty:
+            scheme, host = pool_key
+            if scheme == 'https':
+                conn = httplib.HTTPSConnection(host, timeout=self.timeout)
+            else:
+                conn = httplib.HTTPConnection(host, timeout=self.timeout)
+            reused = False
+        with self.lock:
+            self.stats['connections_reused' if reused else 'connections_opened'] += 1
+        return conn, reused
+
+    def _release(self, pool_key, conn):
+        try:
+            self.pools[pool_key].put_nowait(conn)
+        except Queue.Full:
+            conn.close()
+
+    def _send(self, pool_key, path, headers):
+        conn, reused = self._acquire(pool_key)
+        try:
+            conn.request('GET', path, None, headers)
+            return conn, conn.getresponse()
+        except (httplib.HTTPException, socket.error):
+            conn.close()
+            # A reused connection may have been closed by the server while it sat idle in the pool
+            if not reused:
+                raise
+        conn, reused = self._acquire(pool_key)
+        try:
+            conn.request('GET', path, None, headers)
+            return conn, conn.getresponse()
+        except:
+            conn.close()
+            raise
+
+    def open(self, url, headers=None):
+        """Send a GET request and return the HttpResponse, following redirects"""
+        request_headers = {'Accept-Encoding': 'gzip, deflate', 'User-Agent': 'ckanext-geogratis'}
+        if headers:
+            request_headers.update(headers)
+        with self.lock:
+            self.stats['requests'] += 1
+
+        for redirect in range(self.max_redirects + 1):
+            parts = urlparse.urlsplit(url)
+            pool_key = (parts.scheme, parts.netloc)
+            path = parts.path or '/'
+            if parts.query:
+                path = '%s?%s' % (path, parts.query)
+            try:
+                conn, response = self._send(pool_key, path, request_headers)
+            except (httplib.HTTPException, socket.error), e:
+                raise urllib2.URLError(e)
+
+            location = response.getheader('location')
+            if response.status in (301, 302, 303, 307) and location:
+                response.read()
+                conn.close()
+                url = urlparse.urljoin(url, location)
+                continue
+
+            result = HttpResponse(self, pool_key, conn, response, url)
+            if 200 <= response.status < 300 or response.status == 304:
+                return result
+            result.close()
+            raise urllib2.HTTPError(url, response.status, response.reason, response.msg, None)
+
+        raise urllib2.URLError('Too many redirects for %s' % url)
+
+    def summary(self):
+        """Describe connection reuse and the bytes saved by compression"""
+        stats = dict(self.stats)
+        stats['bytes_saved'] = max(stats['bytes_decoded'] - stats['bytes_received'], 0)
+        return ('%(requests)d requests, %(connections_opened)d connections opened, '
+                '%(connections_reused)d reused, %(bytes_received)d bytes received, '
+                '%(bytes_saved)d bytes saved by compression' % stats)